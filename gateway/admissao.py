@@ -0,0 +1,22 @@
+import time
+
+
+class BaldeFichas:
+    """Token bucket: `taxa` fichas por segundo, acumulando no maximo `rajada`"""
+
+    def __init__(self, taxa, rajada):
+        self.taxa = taxa
+        self.rajada = rajada
+        self.fichas = float(rajada)
+        self.ultimo = time.monotonic()
+
+    def consumir(self, n=1):
+        if self.taxa <= 0:
+            return True  # Sem limite configurado
+        agora = time.monotonic()
+        self.fichas = min(self.rajada, self.fichas + (agora - self.ultimo) * self.taxa)
+        self.ultimo = agora
+        if self.fichas >= n:
+            self.fichas -= n
+            return True
+        return False
@@ -0,0 +1,262 @@
+import datetime
+import heapq
+import json
+import math
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from estatisticas import parse_duracao
+
+HORA_DO_DIA = re.compile(r'^(\d{1,2})h(\d{2})$')
+DURACAO_MAX = 366 * 86400.0  # Maior atraso/periodo aceito (segundos)
+
+
+def _primeira_execucao(quando, agora):
+    """Instante da primeira execucao de `quando`; ValueError se a especificacao for invalida"""
+    if len(quando) < 2 or quando[0] not in '+@*':
+        raise ValueError(quando)
+    horario = HORA_DO_DIA.match(quando[1:])
+    if horario:
+        hora, minuto = int(horario.group(1)), int(horario.group(2))
+        if hora > 23 or minuto > 59 or quando[0] == '+':
+            raise ValueError(quando)
+        return _proximo_horario(hora, minuto, agora)
+    if quando[0] == '@':
+        raise ValueError(quando)
+    duracao = parse_duracao(quando[1:])
+    # Sem isso '+infs', '*nanm' ou '+999999999h' virariam um 'proximo' que nem
+    # datetime nem JSON representam
+    if not math.isfinite(duracao) or not 0 < duracao <= DURACAO_MAX:
+        raise ValueError(quando)
+    return agora + duracao
+
+
+def _proximo_horario(hora, minuto, depois):
+    """Proximo instante (epoch) com esse horario local estritamente apos `depois`"""
+    base = datetime.datetime.fromtimestamp(depois)
+    alvo = base.replace(hour=hora, minute=minuto, second=0, microsecond=0)
+    if alvo.timestamp() <= depois:
+        alvo += datetime.timedelta(days=1)
+    return alvo.timestamp()
+
+
+class Agendamento:
+    __slots__ = ('id', 'quando', 'alvo', 'acao', 'param', 'proximo')
+
+    def __init__(self, id, quando, alvo, acao, param, proximo):
+        self.id = id
+        self.quando = quando  # Especificacao original (+30s, @06h00, *06h00, *10m)
+        self.alvo = alvo
+        self.acao = acao
+        self.param = param
+        self.proximo = proximo
+
+    def seguinte(self, depois):
+        """Proxima execucao de um agendamento recorrente apos `depois`, ou None se e de uma vez"""
+        if not self.quando.startswith('*'):
+            return None
+        horario = HORA_DO_DIA.match(self.quando[1:])
+        if horario:
+            return _proximo_horario(int(horario.group(1)), int(horario.group(2)), depois)
+        periodo = parse_duracao(self.quando[1:])
+        # Mantem a fase original: atrasos nao empurram as execucoes seguintes
+        passos = int((depois - self.proximo) // periodo) + 1
+        return self.proximo + passos * periodo
+
+    def linha(self):
+        # Sem ':' no horario: a linha nao pode parecer uma leitura '[X] TIPO: valor' para o backend
+        instante = datetime.datetime.fromtimestamp(self.proximo).strftime('%Y-%m-%d %Hh%Mm%Ss')
+        return f"#{self.id} {instante} {self.quando} {self.alvo}:{self.acao}:{self.param}"
+
+    def como_dict(self):
+        return {'id': self.id, 'quando': self.quando, 'alvo': self.alvo, 'acao': self.acao,
+                'param': self.param, 'proximo': self.proximo}
+
+
+class Agenda:
+    """Comandos agendados (de uma vez ou recorrentes) com um unico heap de temporizadores.
+
+    Especificacoes de `quando`:
+      +30s / +10m / +2h   uma vez, daqui a esse tempo
+      @06h00              uma vez, no proximo 06:00 (horario local)
+      *06h00              todo dia as 06:00
+      *10m                a cada 10 minutos
+
+    Uma thread dorme ate o vencimento mais proximo; agendamentos nao custam
+    threads, so uma entrada no heap. Cancelar remove do indice e a entrada do
+    heap e ignorada quando chegar a vez dela. Os envios (conexao TCP ao
+    dispositivo) rodam num pool pequeno para um dispositivo lento nao atrasar
+    os outros vencimentos.
+
+    O arquivo JSON e regravado no pool, no maximo a cada `intervalo_gravacao`
+    segundos, quando algo muda. Ao carregar, agendamentos de uma vez vencidos ha mais
+    de `atraso_max` segundos sao descartados; os recorrentes pulam para a
+    proxima ocorrencia futura.
+    """
+
+    def __init__(self, executar, arquivo=None, trabalhadores=4, atraso_max=300.0,
+                 intervalo_gravacao=1.0, log=print):
+        self.executar = executar  # Funcao (alvo, acao, param)
+        self.arquivo = arquivo
+        self.atraso_max = atraso_max
+        self.intervalo_gravacao = intervalo_gravacao
+        self.log = log
+        self.agendamentos = {}
+        self.heap = []  # (proximo, id)
+        self.proximo_id = 1
+        self.cond = threading.Condition()
+        self.alterada = False
+        self.gravando = False
+        self.suspensa = False  # Durante a entrega para outro processo nada dispara
+        self.pool = ThreadPoolExecutor(max_workers=trabalhadores, thread_name_prefix="agenda")
+        self.executados = 0
+
+    def _inserir(self, ag):
+        self.agendamentos[ag.id] = ag
+        heapq.heappush(self.heap, (ag.proximo, ag.id))
+        self.alterada = True
+        # Acorda o laco se este passou a ser o mais proximo
+        if self.heap[0][1] == ag.id:
+            self.cond.notify()
+
+    def agendar(self, quando, alvo, acao, param, agora=None):
+        """Cria o agendamento e retorna ele; ValueError se `quando` for invalido"""
+        agora = time.time() if agora is None else agora
+        quando = quando.strip()
+        proximo = _primeira_execucao(quando, agora)
+        with self.cond:
+            ag = Agendamento(self.proximo_id, quando, alvo, acao, param, proximo)
+            self.proximo_id += 1
+            self._inserir(ag)
+        return ag
+
+    def cancelar(self, id_agendamento):
+        with self.cond:
+            ag = self.agendamentos.pop(id_agendamento, None)
+            if ag is not None:
+                self.alterada = True
+                # Entradas canceladas ficam no heap ate vencer; limpa se passarem a ser maioria
+                if len(self.heap) > 2 * len(self.agendamentos) + 1024:
+                    self.heap = [(a.proximo, a.id) for a in self.agendamentos.values()]
+                    heapq.heapify(self.heap)
+            return ag
+
+    def listar(self, limite=100):
+        """(total, os `limite` proximos em ordem de vencimento)"""
+        with self.cond:
+            return len(self.agendamentos), heapq.nsmallest(limite, self.agendamentos.values(),
+                                                           key=lambda ag: ag.proximo)
+
+    def executar_laco(self, ativo):
+        ultima_gravacao = 0.0
+        while ativo():
+            if self.suspensa:
+                time.sleep(0.1)
+                continue
+            vencidos = []
+            with self.cond:
+                agora = time.time()
+                while self.heap and self.heap[0][0] <= agora:
+                    proximo, id_ag = heapq.heappop(self.heap)
+                    ag = self.agendamentos.get(id_ag)
+                    if ag is None or ag.proximo != proximo:
+                        continue  # Cancelado (ou entrada antiga de um reagendado)
+                    vencidos.append((ag.alvo, ag.acao, ag.param))
+                    seguinte = ag.seguinte(agora)
+                    if seguinte is None:
+                        del self.agendamentos[id_ag]
+                        self.alterada = True
+                    else:
+                        # Sem regravar: ao carregar, a proxima ocorrencia sai de novo de `quando`
+                        ag.proximo = seguinte
+                        heapq.heappush(self.heap, (seguinte, id_ag))
+                espera = 1.0
+                if self.heap:
+                    espera = min(espera, max(0.0, self.heap[0][0] - agora))
+                if not vencidos and espera > 0:
+                    self.cond.wait(espera)
+            for alvo, acao, param in vencidos:
+                self.executados += 1
+                self.pool.submit(self._disparar, alvo, acao, param)
+            if self.alterada and not self.gravando and time.monotonic() - ultima_gravacao >= self.intervalo_gravacao:
+                # Gravar 100k entradas leva tempo: vai para o pool e o laco segue disparando
+                self.gravando = True
+                self.pool.submit(self._gravar_em_segundo_plano)
+                ultima_gravacao = time.monotonic()
+        self.salvar()
+        self.pool.shutdown(wait=False)
+
+    def _gravar_em_segundo_plano(self):
+        try:
+            self.salvar()
+        finally:
+            self.gravando = False
+
+    def _disparar(self, alvo, acao, param):
+        try:
+            self.executar(alvo, acao, param)
+        except Exception as e:
+            self.log(f"Erro no comando agendado {alvo}:{acao}:{param}: {e}")
+
+    def salvar(self):
+        if not self.arquivo:
+            return
+        with self.cond:
+            if not self.alterada:
+                return
+            dados = self.exportar()
+            self.alterada = False
+        try:
+            # Grava ao lado e troca: um desligamento no meio nao corrompe o arquivo
+            temporario = self.arquivo + ".tmp"
+            with open(temporario, 'w', encoding='utf-8') as f:
+                json.dump(dados, f)
+            os.replace(temporario, self.arquivo)
+        except Exception as e:
+            self.log(f"Erro ao gravar agenda em {self.arquivo}: {e}")
+
+    def exportar(self):
+        with self.cond:
+            return {'proximo_id': self.proximo_id,
+                    'agendamentos': [ag.como_dict() for ag in self.agendamentos.values()]}
+
+    def carregar(self, agora=None):
+        """Carrega o arquivo (se existir) e retorna quantos agendamentos ficaram"""
+        if not self.arquivo or not os.path.exists(self.arquivo):
+            return 0
+        with open(self.arquivo, encoding='utf-8') as f:
+            return self.importar(json.load(f), agora)
+
+    def importar(self, dados, agora=None):
+        """Carrega agendamentos exportados (arquivo ou outro processo) e retorna quantos ficaram"""
+        agora = time.time() if agora is None else agora
+        descartados = invalidos = 0
+        with self.cond:
+            for d in dados.get('agendamentos', []):
+                ag = Agendamento(d['id'], d['quando'], d['alvo'], d['acao'], d['param'], d['proximo'])
+                # Mesmas regras de agendar: um arquivo antigo (ou outro processo) pode
+                # trazer 'quando' invalido ou 'proximo' infinito/absurdo
+                try:
+                    _primeira_execucao(ag.quando, agora)
+                    valido = math.isfinite(ag.proximo) and ag.proximo <= agora + DURACAO_MAX + 86400
+                except (ValueError, TypeError):
+                    valido = False
+                if not valido:
+                    invalidos += 1
+                    continue
+                if ag.proximo < agora:
+                    seguinte = ag.seguinte(agora)
+                    if seguinte is not None:
+                        ag.proximo = seguinte
+                    elif agora - ag.proximo > self.atraso_max:
+                        descartados += 1
+                        continue
+                self._inserir(ag)
+            self.proximo_id = max(dados.get('proximo_id', 1), max(self.agendamentos, default=0) + 1)
+        if invalidos:
+            self.log(f"{invalidos} agendamento(s) invalido(s) descartado(s)")
+        if descartados:
+            self.log(f"{descartados} agendamento(s) de uma vez vencido(s) ha mais de {self.atraso_max:g}s descartado(s)")
+        return len(self.agendamentos)
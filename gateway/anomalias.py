@@ -0,0 +1,226 @@
+import collections
+import threading
+try:
+    import numpy as np
+except ImportError:  # Detector opcional: sem NumPy o gateway roda sem ele
+    np = None
+NUMPY_DISPONIVEL = np is not None
+
+DESVIO, TRAVADO, SALTO = 1, 2, 4
+MOTIVOS = ((DESVIO, "desvio"), (TRAVADO, "travado"), (SALTO, "salto"))
+EPS = 1e-9
+
+
+class _Grupo:
+    """Estado de todos os dispositivos de um tipo_leitura, uma linha por dispositivo"""
+
+    COLUNAS = (('media', 'f8'), ('var', 'f8'), ('ultimo', 'f8'), ('ultimo_t', 'f8'),
+               ('taxa_media', 'f8'), ('taxa_var', 'f8'), ('n', 'i4'), ('iguais', 'i4'),
+               ('sinais', 'u1'))
+
+    def __init__(self, capacidade=64, checar_travado=True):
+        self.checar_travado = checar_travado
+        self.linhas = {}
+        self.ids = []
+        for nome, tipo in self.COLUNAS:
+            setattr(self, nome, np.zeros(capacidade, dtype=tipo))
+
+    def linha(self, d_id):
+        i = self.linhas.get(d_id)
+        if i is None:
+            i = self.linhas[d_id] = len(self.ids)
+            self.ids.append(d_id)
+            if i == len(self.n):
+                # Dobra as colunas: custo amortizado constante por dispositivo novo
+                for nome, _ in self.COLUNAS:
+                    coluna = getattr(self, nome)
+                    setattr(self, nome, np.concatenate((coluna, np.zeros_like(coluna))))
+        return i
+
+    def remover(self, d_id):
+        """Tira a linha do dispositivo; a ultima linha ocupa o lugar e a dela volta a zero"""
+        i = self.linhas.pop(d_id, None)
+        if i is None:
+            return
+        ultima = len(self.ids) - 1
+        if i != ultima:
+            movido = self.ids[i] = self.ids[ultima]
+            self.linhas[movido] = i
+        self.ids.pop()
+        for nome, _ in self.COLUNAS:
+            coluna = getattr(self, nome)
+            coluna[i] = coluna[ultima]
+            coluna[ultima] = 0
+
+
+class DetectorAnomalias:
+    """Deteccao online de sensores quebrados ou falsificados, sem limites por tipo.
+
+    Para cada dispositivo, dentro do grupo do seu tipo_leitura, guarda em
+    colunas NumPy a media e a variancia exponenciais (EWMA, peso `alfa`), o
+    ultimo valor e instante, a media/variancia da taxa de variacao e quantas
+    leituras seguidas vieram iguais. Sinaliza:
+      desvio   valor a mais de `limiar_z` desvios da propria media
+      salto    taxa de variacao a mais de `limiar_z` desvios da taxa usual
+      travado  `repeticoes` leituras seguidas identicas (ex.: 25.0 fixo)
+    desvio e salto so depois de `aquecimento` leituras do dispositivo. Tipos
+    em `discretos` (estados como COR_SEMAFORO) ficam de fora: repetir e
+    saltar e o normal deles. Tipos que contem uma das marcas de
+    `sem_travado` (por padrao os resumos da borda, *_CONTAGEM e *_HIST_*)
+    nao passam pelo travado: uma contagem zerada em toda janela e normal.
+
+    O receptor so enfileira (`adicionar`), numa fila de no maximo
+    `max_pendentes` leituras: se o detector nao acompanha, as mais antigas
+    saem (contadas em `descartadas`). `processar`, numa thread propria
+    que espera o lote encher ou o intervalo vencer (`aguardar`), atualiza o
+    lote todo com operacoes vetorizadas por tipo, entao o custo por leitura nao cresce
+    com o numero de dispositivos. Cada motivo gera um evento quando aparece e
+    nao se repete enquanto o dispositivo continuar sinalizado.
+    """
+
+    def __init__(self, alfa=0.05, limiar_z=6.0, repeticoes=30, aquecimento=20,
+                 lote=256, intervalo=0.5, discretos=(), sem_travado=('_CONTAGEM', '_HIST_'),
+                 max_pendentes=65536):
+        self.alfa = alfa
+        self.limiar_z = limiar_z
+        self.repeticoes = repeticoes
+        self.aquecimento = aquecimento
+        self.lote = lote
+        self.intervalo = intervalo
+        self.discretos = set(discretos)
+        self.sem_travado = tuple(sem_travado)
+        self.grupos = {}
+        # append/popleft sem lock entre receptor e detector; cheia, a mais antiga sai
+        self.pendentes = collections.deque(maxlen=max_pendentes)
+        self.descartadas = 0
+        self.cheio = threading.Event()
+        self.ultimo_processamento = 0.0
+        self.lock = threading.Lock()
+        self.anomalias = 0
+
+    def adicionar(self, d_id, tipo_leitura, valor, timestamp):
+        if tipo_leitura not in self.discretos:
+            if len(self.pendentes) == self.pendentes.maxlen:
+                self.descartadas += 1
+            self.pendentes.append((d_id, tipo_leitura, valor, timestamp))
+            if len(self.pendentes) >= self.lote:
+                self.cheio.set()
+
+    def remover(self, d_id):
+        """Esquece o dispositivo (DESREGISTRO) em todos os tipos"""
+        with self.lock:
+            for grupo in self.grupos.values():
+                grupo.remover(d_id)
+        # Marca na fila: leituras dele enfileiradas antes disso nao recriam a linha
+        self.pendentes.append((d_id, None, None, None))
+
+    def aguardar(self, timeout):
+        """Dorme ate o lote encher ou `timeout` segundos"""
+        self.cheio.wait(timeout)
+        self.cheio.clear()
+
+    def vencido(self, agora):
+        return len(self.pendentes) >= self.lote or (
+            self.pendentes and agora - self.ultimo_processamento >= self.intervalo)
+
+    def processar(self, agora):
+        """Atualiza o estado com o micro-lote pendente; retorna [(id, tipo, valor, motivo, detalhe)] novos"""
+        pendentes = [self.pendentes.popleft() for _ in range(len(self.pendentes))]
+        self.ultimo_processamento = agora
+        por_tipo = {}
+        for d_id, tipo_leitura, valor, timestamp in pendentes:
+            if tipo_leitura is None:
+                # Marca de remover: descarta o que veio antes dela
+                for tipo, itens in por_tipo.items():
+                    por_tipo[tipo] = [item for item in itens if item[0] != d_id]
+                continue
+            por_tipo.setdefault(tipo_leitura, []).append((d_id, valor, timestamp))
+        novas = []
+        with self.lock:
+            for tipo_leitura, itens in por_tipo.items():
+                if not itens:
+                    continue
+                grupo = self.grupos.get(tipo_leitura)
+                if grupo is None:
+                    grupo = self.grupos[tipo_leitura] = _Grupo(
+                        checar_travado=not any(marca in tipo_leitura for marca in self.sem_travado))
+                linhas = np.fromiter((grupo.linha(d_id) for d_id, _, _ in itens), dtype=np.int64, count=len(itens))
+                valores = np.fromiter((v for _, v, _ in itens), dtype=np.float64, count=len(itens))
+                instantes = np.fromiter((t for _, _, t in itens), dtype=np.float64, count=len(itens))
+                for rodada in self._rodadas(linhas):
+                    for i, motivo, detalhe in self._atualizar(grupo, linhas[rodada], valores[rodada], instantes[rodada]):
+                        novas.append((grupo.ids[i], tipo_leitura, float(grupo.ultimo[i]), motivo, detalhe))
+        self.anomalias += len(novas)
+        return novas
+
+    @staticmethod
+    def _rodadas(linhas):
+        """Divide o lote em rodadas sem linha repetida (a n-esima leitura de cada dispositivo vai na rodada n)"""
+        ordem = np.argsort(linhas, kind='stable')
+        ordenadas = linhas[ordem]
+        posicoes = np.arange(len(linhas))
+        inicio = np.ones(len(linhas), dtype=bool)
+        inicio[1:] = ordenadas[1:] != ordenadas[:-1]
+        ocorrencia = np.empty(len(linhas), dtype=np.int64)
+        ocorrencia[ordem] = posicoes - np.maximum.accumulate(np.where(inicio, posicoes, 0))
+        if not ocorrencia.any():
+            return [slice(None)]
+        return [ocorrencia == r for r in range(int(ocorrencia.max()) + 1)]
+
+    def _atualizar(self, g, r, x, t):
+        a = self.alfa
+        n = g.n[r]
+        primeiro = n == 0
+        aquecido = n >= self.aquecimento
+
+        delta = x - g.media[r]
+        z = np.abs(delta) / np.sqrt(g.var[r] + EPS)
+        dt = np.maximum(t - g.ultimo_t[r], 1e-3)
+        taxa = np.where(primeiro, 0.0, np.abs(x - g.ultimo[r]) / dt)
+        delta_taxa = taxa - g.taxa_media[r]
+        z_taxa = np.abs(delta_taxa) / np.sqrt(g.taxa_var[r] + EPS)
+        iguais = np.where(~primeiro & (x == g.ultimo[r]), g.iguais[r] + 1, 0)
+
+        sinais = np.zeros(len(r), dtype=np.uint8)
+        sinais |= np.where(aquecido & (z > self.limiar_z), DESVIO, 0).astype(np.uint8)
+        sinais |= np.where(aquecido & (z_taxa > self.limiar_z), SALTO, 0).astype(np.uint8)
+        if g.checar_travado:
+            sinais |= np.where(iguais + 1 >= self.repeticoes, TRAVADO, 0).astype(np.uint8)
+        novos = sinais & ~g.sinais[r]
+
+        # EWMA de media e variancia; a primeira leitura so inicializa
+        g.media[r] = np.where(primeiro, x, g.media[r] + a * delta)
+        g.var[r] = np.where(primeiro, 0.0, (1 - a) * (g.var[r] + a * delta * delta))
+        g.taxa_media[r] = np.where(primeiro, 0.0, g.taxa_media[r] + a * delta_taxa)
+        g.taxa_var[r] = np.where(primeiro, 0.0, (1 - a) * (g.taxa_var[r] + a * delta_taxa * delta_taxa))
+        g.ultimo[r] = x
+        g.ultimo_t[r] = t
+        g.iguais[r] = iguais
+        g.n[r] = n + 1
+        g.sinais[r] = sinais
+
+        resultado = []
+        for j in np.flatnonzero(novos):
+            i = int(r[j])
+            for bit, motivo in MOTIVOS:
+                if novos[j] & bit:
+                    if bit == DESVIO:
+                        detalhe = f"z={z[j]:.1f}"
+                    elif bit == SALTO:
+                        detalhe = f"taxa z={z_taxa[j]:.1f}"
+                    else:
+                        detalhe = f"{int(iguais[j]) + 1} iguais"
+                    resultado.append((i, motivo, detalhe))
+        return resultado
+
+    def sinalizados(self):
+        """[(id, tipo_leitura, motivos)] dos dispositivos sinalizados agora"""
+        with self.lock:
+            return [(g.ids[i], tipo_leitura, [m for bit, m in MOTIVOS if g.sinais[i] & bit])
+                    for tipo_leitura, g in self.grupos.items()
+                    for i in np.flatnonzero(g.sinais[:len(g.ids)])]
+
+    def contadores(self):
+        return {'anomalias': self.anomalias,
+                'anomalias_descartadas': self.descartadas,
+                'anomalias_sinalizados': sum(int(np.count_nonzero(g.sinais[:len(g.ids)])) for g in self.grupos.values())}
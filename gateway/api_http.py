@@ -0,0 +1,241 @@
+import bisect
+import json
+import math
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, unquote
+
+MAX_RESPOSTAS = 4096  # Respostas em cache por instantaneo (filtros diferentes)
+MAX_STATS = 4096      # Consultas de stats mantidas atualizadas pela thread do instantaneo
+STATS_EXPIRA = 60.0   # Segundos sem pedido ate uma consulta de stats sair da lista
+
+
+def _finitos(obj):
+    """Copia com NaN/Infinity trocados por None (null), em dicts e listas aninhados"""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {k: _finitos(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_finitos(v) for v in obj]
+    return obj
+
+
+def _json(obj):
+    try:
+        return json.dumps(obj, separators=(',', ':'), allow_nan=False).encode()
+    except ValueError:
+        # NaN/Infinity nao sao JSON valido: viram null
+        return json.dumps(_finitos(obj), separators=(',', ':'), allow_nan=False).encode()
+
+
+class Instantaneo:
+    """Copia imutavel do registro e dos ultimos valores numa versao do estado.
+
+    As respostas sao geradas sob demanda a partir da copia e guardadas com a
+    ETag (CRC do corpo), entao varios pedidos iguais no mesmo instantaneo
+    custam um lookup de dicionario. Cheio o cache, as respostas mais antigas
+    saem para dar lugar as novas.
+    """
+
+    def __init__(self, versao, dispositivos):
+        self.versao = versao
+        self.dispositivos = dispositivos  # id -> dict pronto para JSON
+        self.ids = sorted(dispositivos)
+        self.respostas = {}
+        self.lock = threading.Lock()
+
+    def resposta(self, chave, gerar):
+        r = self.respostas.get(chave)
+        if r is None:
+            corpo = gerar()
+            if corpo is None:
+                return None
+            r = (corpo, f'"{zlib.crc32(corpo):08x}-{len(corpo):x}"')
+            with self.lock:
+                while len(self.respostas) >= MAX_RESPOSTAS:
+                    del self.respostas[next(iter(self.respostas))]  # Ordem de insercao: a mais antiga
+                self.respostas[chave] = r
+        return r
+
+    def listar(self, tipo=None, prefixo=None):
+        ids = self.ids
+        if prefixo:
+            # Lista ordenada: o intervalo de um prefixo sai por busca binaria
+            inicio = bisect.bisect_left(ids, prefixo)
+            fim = bisect.bisect_left(ids, prefixo + "\U0010ffff")
+            ids = ids[inicio:fim]
+        saida = []
+        for d_id in ids:
+            d = self.dispositivos[d_id]
+            if tipo and d['tipo'] != tipo:
+                continue
+            saida.append({k: d[k] for k in ('id', 'tipo', 'porta', 'ip')})
+        return saida
+
+
+class ApiHttp:
+    """API HTTP somente leitura do gateway.
+
+    Os pedidos nunca tocam o caminho de ingestao: uma thread monta um novo
+    Instantaneo a cada `intervalo` segundos, e so quando a versao do estado
+    mudou; as metricas sao copiadas no mesmo ritmo. Os handlers leem apenas o
+    instantaneo atual (troca atomica de referencia) e respondem 304 quando o
+    If-None-Match bate com a ETag.
+
+    Stats tambem saem da mesma thread: cada consulta pedida (id, tipo_leitura,
+    janela) entra numa lista que ela recalcula a cada intervalo, e o handler
+    so le a copia. Um pedido novo acorda a thread e espera a primeira copia;
+    consultas sem pedido ha `STATS_EXPIRA` segundos saem da lista.
+
+    GET /dispositivos?tipo=SENSOR&prefixo=radar_
+    GET /dispositivos/<id>
+    GET /dispositivos/<id>/stats?tipo_leitura=VELOCIDADE&janela=5m
+    GET /metricas
+    """
+
+    def __init__(self, host, porta, montar_estado, coletar_metricas, consultar_stats, versao, intervalo=1.0,
+                 sock=None):
+        self.montar_estado = montar_estado
+        self.coletar_metricas = coletar_metricas
+        self.consultar_stats = consultar_stats
+        self.versao = versao  # Funcao que devolve a versao atual do estado
+        self.intervalo = intervalo
+        self.instantaneo = Instantaneo(-1, {})
+        self.metricas = (b"{}", '"0"')
+        self.stats = {}           # (id, tipo_leitura, janela) -> (corpo, etag) ou None
+        self.stats_pedidos = {}   # (id, tipo_leitura, janela) -> ultimo pedido (monotonic)
+        self.cond_stats = threading.Condition()
+        self.acordar = threading.Event()
+        self.pedidos = 0
+        self.respostas_304 = 0
+
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                api.atender(self)
+
+            def log_message(self, formato, *args):
+                pass  # Sem log por pedido: dashboards fazem polling
+
+        if sock is None:
+            self.server = ThreadingHTTPServer((host, porta), Handler)
+        else:
+            # Socket ja em escuta, herdado de outro processo do gateway
+            self.server = ThreadingHTTPServer((host, porta), Handler, bind_and_activate=False)
+            self.server.socket = sock
+        self.server.daemon_threads = True
+
+    def atualizar(self):
+        versao = self.versao()
+        if versao != self.instantaneo.versao:
+            self.instantaneo = Instantaneo(versao, self.montar_estado())
+        corpo = _json(self.coletar_metricas())
+        self.metricas = (corpo, f'"{zlib.crc32(corpo):08x}-{len(corpo):x}"')
+        self.atualizar_stats()
+
+    def atualizar_stats(self, so_novas=False):
+        """Recalcula as consultas de stats pedidas (ou so as que ainda nao tem copia)"""
+        agora = time.monotonic()
+        with self.cond_stats:
+            for chave in [c for c, t in self.stats_pedidos.items() if agora - t > STATS_EXPIRA]:
+                del self.stats_pedidos[chave]
+            chaves = [c for c in self.stats_pedidos if not (so_novas and c in self.stats)]
+        # Fora do lock dos handlers: consultar_stats disputa o lock das estatisticas com a ingestao
+        novas = {chave: self._stats(*chave) for chave in chaves}
+        with self.cond_stats:
+            if so_novas:
+                self.stats.update(novas)
+            else:
+                self.stats = novas
+            self.cond_stats.notify_all()
+
+    def executar_atualizacao(self, ativo):
+        while ativo():
+            try:
+                self.atualizar()
+            except Exception as e:
+                print(f"[GATEWAY] Erro ao atualizar instantaneo HTTP: {e}")
+            fim = time.monotonic() + self.intervalo
+            while ativo() and time.monotonic() < fim:
+                # Consulta de stats nova: calcula so ela, sem esperar o fim do intervalo
+                if self.acordar.wait(max(0.0, fim - time.monotonic())):
+                    self.acordar.clear()
+                    try:
+                        self.atualizar_stats(so_novas=True)
+                    except Exception as e:
+                        print(f"[GATEWAY] Erro ao atualizar stats HTTP: {e}")
+
+    def executar(self):
+        self.server.serve_forever(poll_interval=0.5)
+
+    def fechar(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def atender(self, pedido):
+        self.pedidos += 1
+        url = urlsplit(pedido.path)
+        partes = [unquote(p) for p in url.path.split('/') if p]
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        inst = self.instantaneo
+
+        r = None
+        if partes == ["metricas"]:
+            r = self.metricas
+        elif partes == ["dispositivos"]:
+            tipo, prefixo = params.get('tipo'), params.get('prefixo')
+            r = inst.resposta(('lista', tipo, prefixo), lambda: _json(inst.listar(tipo, prefixo)))
+        elif len(partes) == 2 and partes[0] == "dispositivos":
+            d = inst.dispositivos.get(partes[1])
+            if d is not None:
+                r = inst.resposta(('dispositivo', partes[1]), lambda: _json(d))
+        elif len(partes) == 3 and partes[0] == "dispositivos" and partes[2] == "stats":
+            d_id, tipo_leitura, janela = partes[1], params.get('tipo_leitura'), params.get('janela')
+            if d_id in inst.dispositivos and tipo_leitura:
+                r = self._resposta_stats((d_id, tipo_leitura, janela))
+        if r is None:
+            self._enviar(pedido, 404, _json({"erro": "nao encontrado", "caminho": url.path}))
+            return
+
+        corpo, etag = r
+        if pedido.headers.get('If-None-Match') == etag:
+            self.respostas_304 += 1
+            self._enviar(pedido, 304, b"", etag)
+        else:
+            self._enviar(pedido, 200, corpo, etag)
+
+    def _resposta_stats(self, chave):
+        with self.cond_stats:
+            if chave not in self.stats_pedidos and len(self.stats_pedidos) >= MAX_STATS:
+                return None
+            self.stats_pedidos[chave] = time.monotonic()
+            if chave not in self.stats:
+                self.acordar.set()
+                self.cond_stats.wait_for(lambda: chave in self.stats, timeout=max(2 * self.intervalo, 1.0))
+            return self.stats.get(chave)
+
+    def _stats(self, d_id, tipo_leitura, janela):
+        resumo = self.consultar_stats(d_id, tipo_leitura, janela)
+        if resumo is None:
+            return None
+        corpo = _json({"id": d_id, "tipo_leitura": tipo_leitura, **resumo})
+        return corpo, f'"{zlib.crc32(corpo):08x}-{len(corpo):x}"'
+
+    @staticmethod
+    def _enviar(pedido, status, corpo, etag=None):
+        pedido.send_response(status)
+        if status != 304:
+            pedido.send_header("Content-Type", "application/json")
+            pedido.send_header("Content-Length", str(len(corpo)))
+        pedido.send_header("Cache-Control", "no-cache")
+        if etag:
+            pedido.send_header("ETag", etag)
+        pedido.end_headers()
+        if corpo:
+            pedido.wfile.write(corpo)
@@ -0,0 +1,86 @@
+import gc
+import sys
+import tracemalloc
+from eventos import Evento
+from registro import Registro, UltimasLeituras
+
+# Uso: python bench_memoria.py [N ...]  (padrao: 10000 100000 1000000)
+# Mede os bytes por dispositivo do registro antigo (dict de dicts) e do
+# Registro em colunas, com ids, tipos e ips gerados como chegam da rede
+# (uma string nova por mensagem), e o mesmo para os ultimos valores (um
+# Evento por leitura contra UltimasLeituras).
+#
+# Fora daqui: o estado por dispositivo de estatisticas, qualidade e regras
+# continua em dicts (cresce com o que e consultado/configurado, nao com cada
+# sensor descoberto); anomalias ja guarda colunas NumPy por tipo_leitura.
+
+TIPOS = (b"SENSOR", b"ATUADOR")
+
+
+def entradas(n):
+    for i in range(n):
+        # ~16 dispositivos por ip, como varios sensores atras de um mesmo concentrador
+        # e o tipo decodificado de bytes, como sai do parse da mensagem
+        yield (f"sensor_{i:07d}", f"10.{(i >> 20) & 255}.{(i >> 12) & 255}.{(i >> 4) & 255}",
+               8000 + i % 1000, TIPOS[i % 7 == 0].decode())
+
+
+def legado(n):
+    dispositivos = {}
+    for d_id, ip, porta, tipo in entradas(n):
+        dispositivos[d_id] = {'ip': ip, 'porta': porta, 'tipo': tipo}
+    return dispositivos
+
+
+def compacto(n):
+    registro = Registro(tamanho_diario=0)
+    for d_id, ip, porta, tipo in entradas(n):
+        registro.registrar(d_id, ip, porta, tipo)
+    return registro
+
+
+def leituras(n):
+    for i, (d_id, _, _, _) in enumerate(entradas(n)):
+        yield d_id, b"TEMPERATURA".decode(), 20.0 + i % 100 / 10.0, b"C".decode(), 1.7e9 + i, i + 1
+
+
+def ultimos_legado(n):
+    ultimas = {}
+    for d_id, tipo_leitura, valor, unidade, timestamp, sequencia in leituras(n):
+        evento = Evento.leitura(d_id, tipo_leitura, valor, unidade, timestamp, sequencia)
+        evento.serializar("texto")  # Como depois do broadcast, com a copia em cache
+        ultimas[(d_id, tipo_leitura)] = evento
+    return ultimas
+
+
+def ultimos_compacto(n):
+    ultimas = UltimasLeituras()
+    for item in leituras(n):
+        ultimas.atualizar(*item)
+    return ultimas
+
+
+def medir(construir, n):
+    gc.collect()
+    tracemalloc.start()
+    inicio = tracemalloc.get_traced_memory()[0]
+    estrutura = construir(n)
+    gc.collect()
+    total = tracemalloc.get_traced_memory()[0] - inicio
+    tracemalloc.stop()
+    del estrutura
+    return total / n
+
+
+if __name__ == "__main__":
+    tamanhos = [int(a) for a in sys.argv[1:]] or [10000, 100000, 1000000]
+    print(f"{'dispositivos':>12} {'dict (B/disp)':>14} {'Registro (B/disp)':>18} {'reducao':>8}")
+    for n in tamanhos:
+        antes = medir(legado, n)
+        depois = medir(compacto, n)
+        print(f"{n:>12} {antes:>14.1f} {depois:>18.1f} {100.0 * (1 - depois / antes):>7.1f}%")
+    print(f"{'leituras':>12} {'Evento (B/lei)':>14} {'Ultimas (B/lei)':>18} {'reducao':>8}")
+    for n in tamanhos:
+        antes = medir(ultimos_legado, n)
+        depois = medir(ultimos_compacto, n)
+        print(f"{n:>12} {antes:>14.1f} {depois:>18.1f} {100.0 * (1 - depois / antes):>7.1f}%")
@@ -0,0 +1,62 @@
+import time
+import zlib
+
+
+class CompressorFluxo:
+    """Compressor zlib continuo para uma conexao.
+
+    O mesmo contexto (janela/dicionario LZ77) e usado durante toda a conexao,
+    entao linhas repetitivas continuam comprimindo bem mesmo pequenas. Cada
+    descarga termina com Z_SYNC_FLUSH para o cliente conseguir decodificar
+    imediatamente.
+
+    O custo e medido em tempo de CPU da thread. Se a conexao passar do
+    orcamento (fracao de um nucleo), o fluxo e rebaixado para nivel 0: um
+    Z_FULL_FLUSH fecha o contexto atual e um compressor deflate cru continua o
+    mesmo fluxo apenas com blocos armazenados, que o descompressor do cliente
+    le sem perceber a troca.
+    """
+
+    def __init__(self, nivel=6, janela=15, orcamento_cpu=0.0):
+        self.nivel = nivel
+        self.janela = janela
+        self.orcamento_cpu = orcamento_cpu
+        self.compressor = zlib.compressobj(nivel, zlib.DEFLATED, janela)
+        self.inicio = time.monotonic()
+        self.bytes_entrada = 0
+        self.bytes_saida = 0
+        self.cpu = 0.0
+        self.rebaixado = False
+
+    def comprimir(self, buffers):
+        t0 = time.thread_time()
+        partes = [self.compressor.compress(b) for b in buffers]
+        partes.append(self.compressor.flush(zlib.Z_SYNC_FLUSH))
+        saida = b"".join(partes)
+        self.cpu += time.thread_time() - t0
+
+        self.bytes_entrada += sum(len(b) for b in buffers)
+        self.bytes_saida += len(saida)
+        if self.orcamento_cpu and not self.rebaixado and self.uso_cpu() > self.orcamento_cpu:
+            saida += self._rebaixar()
+        return saida
+
+    def _rebaixar(self):
+        fim = self.compressor.flush(zlib.Z_FULL_FLUSH)
+        self.compressor = zlib.compressobj(0, zlib.DEFLATED, -self.janela)
+        self.nivel = 0
+        self.rebaixado = True
+        self.bytes_saida += len(fim)
+        return fim
+
+    def uso_cpu(self):
+        """Fracao de um nucleo gasta comprimindo desde o inicio da conexao"""
+        decorrido = time.monotonic() - self.inicio
+        return self.cpu / decorrido if decorrido > 0 else 0.0
+
+    def razao(self):
+        return self.bytes_entrada / self.bytes_saida if self.bytes_saida else 0.0
+
+    def resumo(self):
+        return (f"nivel={self.nivel} entrada={self.bytes_entrada} saida={self.bytes_saida}"
+                f" razao={self.razao():.1f} cpu_ms={self.cpu * 1000:.1f} uso_cpu={self.uso_cpu() * 100:.2f}%")
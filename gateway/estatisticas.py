@@ -0,0 +1,234 @@
+import math
+import threading
+import time
+
+MIN_POSITIVO = 1e-9
+
+
+def parse_duracao(texto):
+    """Converte '30s', '5m', '1h', '1d' (ou segundos puros) em segundos"""
+    texto = texto.strip().lower()
+    multiplicadores = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    if texto and texto[-1] in multiplicadores:
+        return float(texto[:-1]) * multiplicadores[texto[-1]]
+    return float(texto)
+
+
+class EsbocoQuantis:
+    """Esboco de quantis com erro relativo limitado (no estilo DDSketch).
+
+    Cada valor cai num balde logaritmico; adicionar e O(1) e dois esbocos com a
+    mesma precisao podem ser mesclados somando os contadores.
+    """
+
+    def __init__(self, precisao=0.01):
+        self.precisao = precisao
+        self.gamma = (1 + precisao) / (1 - precisao)
+        self.log_gamma = math.log(self.gamma)
+        self.positivos = {}
+        self.negativos = {}
+        self.zeros = 0
+        self.contagem = 0
+
+    def _indice(self, x):
+        return math.ceil(math.log(x) / self.log_gamma)
+
+    def _valor(self, indice):
+        return 2 * self.gamma ** indice / (self.gamma + 1)
+
+    def adicionar(self, x):
+        if x > MIN_POSITIVO:
+            k = self._indice(x)
+            self.positivos[k] = self.positivos.get(k, 0) + 1
+        elif x < -MIN_POSITIVO:
+            k = self._indice(-x)
+            self.negativos[k] = self.negativos.get(k, 0) + 1
+        else:
+            self.zeros += 1
+        self.contagem += 1
+
+    def mesclar(self, outro):
+        for k, n in outro.positivos.items():
+            self.positivos[k] = self.positivos.get(k, 0) + n
+        for k, n in outro.negativos.items():
+            self.negativos[k] = self.negativos.get(k, 0) + n
+        self.zeros += outro.zeros
+        self.contagem += outro.contagem
+
+    def quantil(self, q):
+        if self.contagem == 0:
+            return None
+        alvo = q * (self.contagem - 1)
+        acumulado = 0
+        # Negativos do maior modulo para o menor, depois zeros, depois positivos
+        for k in sorted(self.negativos, reverse=True):
+            acumulado += self.negativos[k]
+            if acumulado > alvo:
+                return -self._valor(k)
+        acumulado += self.zeros
+        if acumulado > alvo:
+            return 0.0
+        for k in sorted(self.positivos):
+            acumulado += self.positivos[k]
+            if acumulado > alvo:
+                return self._valor(k)
+        return self._valor(max(self.positivos)) if self.positivos else 0.0
+
+
+class Balde:
+    """Agregado de um intervalo de tempo: contagem, soma, min, max e esboco"""
+
+    def __init__(self, precisao, epoca=None):
+        self.epoca = epoca
+        self.contagem = 0
+        self.soma = 0.0
+        self.minimo = math.inf
+        self.maximo = -math.inf
+        self.esboco = EsbocoQuantis(precisao)
+
+    def adicionar(self, valor):
+        self.contagem += 1
+        self.soma += valor
+        if valor < self.minimo:
+            self.minimo = valor
+        if valor > self.maximo:
+            self.maximo = valor
+        self.esboco.adicionar(valor)
+
+    def mesclar(self, outro):
+        self.contagem += outro.contagem
+        self.soma += outro.soma
+        self.minimo = min(self.minimo, outro.minimo)
+        self.maximo = max(self.maximo, outro.maximo)
+        self.esboco.mesclar(outro.esboco)
+
+    def resumo(self):
+        if self.contagem == 0:
+            return {'n': 0}
+        return {
+            'n': self.contagem,
+            'soma': self.soma,
+            'media': self.soma / self.contagem,
+            'min': self.minimo,
+            'max': self.maximo,
+            'p50': self.esboco.quantil(0.5),
+            'p95': self.esboco.quantil(0.95),
+        }
+
+
+class JanelaDeslizante:
+    """Janela deslizante dividida em um anel de baldes de largura fixa.
+
+    A atualizacao toca apenas o balde atual; a consulta mescla no maximo
+    `n_baldes` agregados, nunca as leituras individuais.
+    """
+
+    def __init__(self, duracao, n_baldes=12, precisao=0.01):
+        self.duracao = duracao
+        self.n_baldes = n_baldes
+        self.largura = duracao / n_baldes
+        self.precisao = precisao
+        self.baldes = [Balde(precisao) for _ in range(n_baldes)]
+
+    def adicionar(self, valor, agora):
+        epoca = int(agora // self.largura)
+        balde = self.baldes[epoca % self.n_baldes]
+        if balde.epoca != epoca:
+            balde = Balde(self.precisao, epoca)
+            self.baldes[epoca % self.n_baldes] = balde
+        balde.adicionar(valor)
+
+    def resumo(self, agora):
+        epoca = int(agora // self.largura)
+        total = Balde(self.precisao)
+        for balde in self.baldes:
+            if balde.epoca is not None and epoca - self.n_baldes < balde.epoca <= epoca:
+                total.mesclar(balde)
+        return total.resumo()
+
+
+class JanelaFixa:
+    """Janela fixa (tumbling) alinhada ao relogio: agrega o periodo atual"""
+
+    def __init__(self, duracao, precisao=0.01):
+        self.duracao = duracao
+        self.precisao = precisao
+        self.balde = Balde(precisao)
+
+    def adicionar(self, valor, agora):
+        epoca = int(agora // self.duracao)
+        if self.balde.epoca != epoca:
+            self.balde = Balde(self.precisao, epoca)
+        self.balde.adicionar(valor)
+
+    def resumo(self, agora):
+        epoca = int(agora // self.duracao)
+        resumo = self.balde.resumo() if self.balde.epoca == epoca else {'n': 0}
+        resumo['inicio'] = epoca * self.duracao
+        return resumo
+
+
+class MotorEstatisticas:
+    """Agregados incrementais por (dispositivo, tipo_leitura) em varias janelas.
+
+    Janelas deslizantes sao nomeadas pela duracao ('5m'); janelas fixas levam
+    o prefixo 'T' ('T1h').
+    """
+
+    def __init__(self, deslizantes=('1m', '5m', '1h'), fixas=('1h',), n_baldes=12, precisao=0.01):
+        self.n_baldes = n_baldes
+        self.precisao = precisao
+        self.definicoes = {}
+        for nome in deslizantes:
+            self.definicoes[nome] = ('deslizante', parse_duracao(nome))
+        for nome in fixas:
+            self.definicoes[f"T{nome}"] = ('fixa', parse_duracao(nome))
+        self.series = {}
+        self.lock = threading.Lock()
+        self.nao_finitos = 0
+
+    def _criar_janelas(self):
+        janelas = {}
+        for nome, (tipo, duracao) in self.definicoes.items():
+            if tipo == 'deslizante':
+                janelas[nome] = JanelaDeslizante(duracao, self.n_baldes, self.precisao)
+            else:
+                janelas[nome] = JanelaFixa(duracao, self.precisao)
+        return janelas
+
+    def registrar(self, d_id, tipo_leitura, valor, agora=None):
+        """Soma o valor nas janelas da serie; inf/nan sao ignorados (retorna False)"""
+        if not math.isfinite(valor):
+            # Antes de qualquer balde: inf quebraria o esboco no meio e nan contaminaria a media
+            self.nao_finitos += 1
+            return False
+        if agora is None:
+            agora = time.time()
+        chave = (d_id, tipo_leitura)
+        with self.lock:
+            janelas = self.series.get(chave)
+            if janelas is None:
+                janelas = self.series[chave] = self._criar_janelas()
+            for janela in janelas.values():
+                janela.adicionar(valor, agora)
+        return True
+
+    def consultar(self, d_id, tipo_leitura, nome_janela, agora=None):
+        """Resumo da janela, {'n': 0} se nao houver dados, ou None se a janela nao existir"""
+        if nome_janela not in self.definicoes:
+            return None
+        if agora is None:
+            agora = time.time()
+        with self.lock:
+            janelas = self.series.get((d_id, tipo_leitura))
+            if janelas is None:
+                return {'n': 0}
+            return janelas[nome_janela].resumo(agora)
+
+    def remover(self, d_id):
+        with self.lock:
+            for chave in [k for k in self.series if k[0] == d_id]:
+                del self.series[chave]
+
+    def nomes_janelas(self):
+        return list(self.definicoes)
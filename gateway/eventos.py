@@ -0,0 +1,142 @@
+import json
+import math
+import struct
+import iot_pb2 as proto
+from websocket_servidor import quadro
+
+# Formatos que um cliente TCP pode pedir com FORMATO:...; 'ws' (JSON em
+# quadros WebSocket) e fixo para as conexoes da porta WebSocket
+FORMATOS = ("texto", "json", "proto")
+
+
+class Evento:
+    """Registro estruturado de algo que vai para os clientes.
+
+    O evento e montado uma vez e cada formato de saida e serializado sob
+    demanda, no maximo uma vez, e guardado em `cache`. Todos os clientes do
+    mesmo formato recebem o mesmo objeto bytes, entao o custo cresce com o
+    numero de formatos em uso, nao com o numero de clientes.
+
+    Tipos: LEITURA, REGISTRO, DESREGISTRO, ALERTA, ANOMALIA e TEXTO (linha
+    livre, usada nas respostas de comandos).
+    """
+
+    __slots__ = ('tipo', 'campos', 'cache')
+
+    def __init__(self, tipo, **campos):
+        self.tipo = tipo
+        self.campos = campos
+        self.cache = {}
+
+    @classmethod
+    def leitura(cls, d_id, tipo_leitura, valor, unidade, timestamp, sequencia=0):
+        return cls("LEITURA", id=d_id, tipo_leitura=tipo_leitura, valor=valor,
+                   unidade=unidade, timestamp=timestamp, sequencia=sequencia)
+
+    @classmethod
+    def registro(cls, d_id, tipo_dispositivo, porta):
+        return cls("REGISTRO", id=d_id, tipo_dispositivo=tipo_dispositivo, porta=porta)
+
+    @classmethod
+    def desregistro(cls, d_id):
+        return cls("DESREGISTRO", id=d_id)
+
+    @classmethod
+    def alerta(cls, regra, d_id, tipo_leitura, valor, operador, limite):
+        return cls("ALERTA", regra=regra, id=d_id, tipo_leitura=tipo_leitura,
+                   valor=valor, operador=operador, limite=limite)
+
+    @classmethod
+    def anomalia(cls, motivo, d_id, tipo_leitura, valor, detalhe):
+        return cls("ANOMALIA", motivo=motivo, id=d_id, tipo_leitura=tipo_leitura,
+                   valor=valor, detalhe=detalhe)
+
+    @classmethod
+    def texto(cls, linha):
+        return cls("TEXTO", texto=linha)
+
+    def __getattr__(self, nome):
+        try:
+            return self.campos[nome]
+        except KeyError:
+            raise AttributeError(nome)
+
+    def linha(self):
+        """Linha do formato texto legado (sem o \\n)"""
+        c = self.campos
+        if self.tipo == "LEITURA":
+            return f"[{c['id']}] {c['tipo_leitura']}: {c['valor']:.1f} {c['unidade']}"
+        if self.tipo == "REGISTRO":
+            return f"[REGISTRO] {c['id']}:{c['tipo_dispositivo']}:{c['porta']}"
+        if self.tipo == "DESREGISTRO":
+            return f"[DESREGISTRO] {c['id']}"
+        if self.tipo == "ALERTA":
+            return (f"[ALERTA] {c['regra']} {c['id']} {c['tipo_leitura']}={c['valor']:.1f}"
+                    f" ({c['operador']} {c['limite']:g})")
+        if self.tipo == "ANOMALIA":
+            return f"[ANOMALIA] {c['motivo']} {c['id']} {c['tipo_leitura']}={c['valor']:.1f} ({c['detalhe']})"
+        return c['texto']
+
+    def serializar(self, formato):
+        dados = self.cache.get(formato)
+        if dados is None:
+            # Sem lock: duas threads podem serializar ao mesmo tempo, mas o
+            # resultado e identico e a ultima escrita no cache vale
+            dados = self.cache[formato] = SERIALIZADORES[formato](self)
+        return dados
+
+
+def _texto(evento):
+    return f"{evento.linha()}\n".encode()
+
+
+def _json_bruto(evento):
+    objeto = {"tipo": evento.tipo, **evento.campos}
+    try:
+        return json.dumps(objeto, separators=(',', ':'), allow_nan=False).encode()
+    except ValueError:
+        # NaN/Infinity nao sao JSON (JSON.parse do navegador rejeita): saem como null
+        objeto = {k: None if isinstance(v, float) and not math.isfinite(v) else v for k, v in objeto.items()}
+        return json.dumps(objeto, separators=(',', ':'), allow_nan=False).encode()
+
+
+def _json(evento):
+    return _json_bruto(evento) + b"\n"
+
+
+def _ws(evento):
+    # Reaproveita o JSON se ele ja foi serializado para clientes TCP
+    linha = evento.cache.get("json")
+    return quadro(linha[:-1] if linha is not None else _json_bruto(evento))
+
+
+def _proto(evento):
+    """Mensagem do iot.proto com prefixo de tamanho (4 bytes, big-endian)"""
+    c = evento.campos
+    msg = proto.Mensagem()
+    msg.tipo_mensagem = evento.tipo
+    if evento.tipo == "LEITURA":
+        msg.tipo_mensagem = "DADOS"
+        msg.id_origem = c['id']
+        msg.dados.valor = c['valor']
+        msg.dados.unidade = c['unidade']
+        msg.dados.tipo_leitura = c['tipo_leitura']
+        msg.dados.sequencia = c['sequencia']
+        msg.dados.timestamp = c['timestamp']
+    elif evento.tipo in ("REGISTRO", "DESREGISTRO"):
+        msg.id_origem = c['id']
+        if evento.tipo == "REGISTRO":
+            msg.registro.porta = c['porta']
+            msg.registro.tipo_dispositivo = c['tipo_dispositivo']
+    elif evento.tipo in ("ALERTA", "ANOMALIA"):
+        msg.id_origem = c['id']
+        msg.dados.valor = c['valor']
+        msg.dados.tipo_leitura = c['tipo_leitura']
+        msg.texto = evento.linha()
+    else:
+        msg.texto = c['texto']
+    corpo = msg.SerializeToString()
+    return struct.pack('>I', len(corpo)) + corpo
+
+
+SERIALIZADORES = {"texto": _texto, "json": _json, "proto": _proto, "ws": _ws}
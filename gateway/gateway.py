@@ -1,3 +1,4 @@
+import math
 import socket
 import struct
 import threading
@@ -6,6 +7,32 @@ import sys
 import time
 import os
 import iot_pb2 as proto
+from estatisticas import MotorEstatisticas
+from regras import MotorRegras
+from saida import Cliente, EstagioSaida
+from compressao import CompressorFluxo
+from admissao import BaldeFichas
+from metricas import Metricas
+from perfil import Perfil, ProfilerAmostragem
+from qualidade import QualidadeFluxo
+from eventos import Evento, FORMATOS
+from websocket_servidor import (responder_handshake, quadro, quadro_fechar, LeitorQuadros, ErroWebSocket,
+                                OP_TEXTO, OP_PING, OP_PONG, OP_FECHAR)
+from api_http import ApiHttp
+from memoria_compartilhada import TabelaCompartilhada
+from video import RetransmissorVideo
+from prioridade import Classificador, FilasPrioridade
+from registro import Registro, UltimasLeituras, REGISTRO
+from agenda import Agenda
+from republicacao import Republicador
+from anomalias import DetectorAnomalias, NUMPY_DISPONIVEL
+import handoff
+
+# Contador de descartes do socket por buffer cheio (Linux); o modulo socket nem sempre exporta a constante
+SO_RXQ_OVFL = getattr(socket, 'SO_RXQ_OVFL', 40 if sys.platform.startswith('linux') else None)
+
+# Mensagens com lote (resumos da borda) passam de 1 KB
+MAX_DATAGRAMA = 65535
 
 running = True
 
@@ -23,14 +50,150 @@ class IoTGateway:
         self.HOST = os.getenv('GATEWAY_HOST', '0.0.0.0')
         self.PORTA_CLIENTES = int(os.getenv('GATEWAY_CLIENT_PORT', '9000'))
         self.PORTA_DADOS = int(os.getenv('GATEWAY_UDP_PORT', '9001'))
+        self.PORTA_WS = int(os.getenv('GATEWAY_WS_PORT', '0'))  # WebSocket para paineis web (0 = desligado)
+        self.WS_PING = float(os.getenv('GATEWAY_WS_PING', '20'))  # Segundos entre pings (0 = sem ping)
+        self.PORTA_HTTP = int(os.getenv('GATEWAY_HTTP_PORT', '0'))  # API HTTP somente leitura (0 = desligada)
+        self.HTTP_INTERVALO = float(os.getenv('GATEWAY_HTTP_INTERVALO', '1'))
+        self.PORTA_VIDEO = int(os.getenv('GATEWAY_VIDEO_PORT', '9002'))  # Canal binario de video das cameras (0 = desligado)
+        self.SHM_NOME = os.getenv('GATEWAY_SHM_NOME', '')  # Tabela de ultimos valores em memoria compartilhada ('' = desligada)
+        self.SHM_SLOTS = int(os.getenv('GATEWAY_SHM_SLOTS', '4096'))
+        self.REPUB_GRUPO = os.getenv('GATEWAY_REPUB_GRUPO', '')  # Republicacao multicast das leituras ('' = desligada)
+        self.REPUB_PORTA = int(os.getenv('GATEWAY_REPUB_PORTA', '9600'))  # Porta do 1o topico; os seguintes vem em sequencia
+        self.REPUB_TOPICOS = [t for t in os.getenv('GATEWAY_REPUB_TOPICOS', 'VELOCIDADE,TEMPERATURA,QUALIDADE_AR,COR_SEMAFORO').split(',') if t]
+        self.REPUB_HISTORICO = int(os.getenv('GATEWAY_REPUB_HISTORICO', '4096'))
+        self.REPUB_TTL = int(os.getenv('GATEWAY_REPUB_TTL', '1'))
+        self.REPUB_PORTA_RECUPERACAO = int(os.getenv('GATEWAY_REPUB_PORTA_RECUPERACAO', '9599'))  # Pedidos de faixas perdidas
         
         # Multicast
         self.MCAST_GRP = os.getenv('MCAST_GRP', '224.1.1.1')
         self.MCAST_PORT = int(os.getenv('MCAST_PORT', '5007'))
 
-        self.dispositivos = {} 
+        # Registro com ids ordenados e diario de mudancas (LISTAR paginado e LISTAR:desde=N)
+        self.dispositivos = Registro(tamanho_diario=int(os.getenv('GATEWAY_REGISTRO_DIARIO', '10000')))
+        self.LISTAR_LIMITE = int(os.getenv('GATEWAY_LISTAR_LIMITE', '500'))
+        self.LISTAR_LIMITE_MAX = int(os.getenv('GATEWAY_LISTAR_LIMITE_MAX', '5000'))
+        # Acima disso, a conexao recebe so o cabecalho do registro e pagina com LISTAR (0 = sem limite)
+        self.SNAPSHOT_MAX = int(os.getenv('GATEWAY_SNAPSHOT_MAX', '0'))
         self.clientes = []
         self.sockets = []
+        # Sockets de escuta por nome (entregues no handoff) e os recebidos do processo anterior
+        self.escutas = {}
+        self.herdados = {}
+
+        # Atualizacao sem parada: o processo novo (gateway.py --upgrade) pede por este
+        # socket Unix os sockets e o estado do atual ('' = desligado; so Unix)
+        self.HANDOFF_SOCK = os.getenv('GATEWAY_HANDOFF_SOCK', '')
+        self.HANDOFF_CLIENTES = os.getenv('GATEWAY_HANDOFF_CLIENTES', '1') == '1'
+        self.handoff = None
+        # Handoff em duas fases: primeiro comandos, conexoes e descoberta (que
+        # podem levar ate 1s para perceber), depois a ingestao UDP e o worker
+        self.pausa = threading.Event()
+        self.pausa_ingestao = threading.Event()
+        self.pausados = set()           # Lacos que ja pararam (nomes ou Cliente)
+
+        # Ultimo valor conhecido por (dispositivo, tipo_leitura), em colunas (ver
+        # registro.py); os Eventos do snapshot sao montados na conexao do cliente.
+        # Com envio por excecao nos sensores, e isso que mantem o estado atual consistente.
+        self.ultimas_leituras = UltimasLeituras()
+        # Muda a cada alteracao do registro ou dos ultimos valores; a API HTTP
+        # so remonta o instantaneo quando ela avanca
+        self.versao_estado = 0
+        # Copia dos ultimos valores para consumidores no mesmo host (ver memoria_compartilhada.py)
+        self.shm = None
+        # Copia das leituras em multicast para ouvintes somente leitura na LAN (ver republicacao.py)
+        self.repub = None
+
+        # Estatisticas incrementais por janela (consulta: STATS:ID:TIPO:JANELA)
+        self.estatisticas = MotorEstatisticas(
+            deslizantes=[j for j in os.getenv('GATEWAY_STATS_JANELAS', '1m,5m,1h').split(',') if j],
+            fixas=[j for j in os.getenv('GATEWAY_STATS_FIXAS', '1h').split(',') if j],
+            n_baldes=int(os.getenv('GATEWAY_STATS_BALDES', '12')),
+            precisao=float(os.getenv('GATEWAY_STATS_PRECISAO', '0.01'))
+        )
+
+        # Regras de automacao (alertas e comandos automaticos)
+        self.ARQUIVO_REGRAS = os.getenv('GATEWAY_REGRAS', 'regras.json')
+        self.regras = MotorRegras()
+
+        # Comandos agendados (AGENDAR/AGENDA/CANCELAR), persistidos em JSON
+        self.agenda = Agenda(
+            executar=self.enviar_comando_device,
+            arquivo=os.getenv('GATEWAY_AGENDA', 'agenda.json') or None,
+            trabalhadores=int(os.getenv('GATEWAY_AGENDA_TRABALHADORES', '4')),
+            atraso_max=float(os.getenv('GATEWAY_AGENDA_ATRASO_MAX', '300')),
+            log=self.log
+        )
+
+        # Latencia por estagio (LATENCIAS), rastreio de 1 a cada N mensagens e
+        # profiler por amostragem sob demanda (PROFILE:SEGUNDOS)
+        self.perfil = Perfil(amostra_trace=int(os.getenv('GATEWAY_TRACE_AMOSTRA', '0')))
+        self.profiler = ProfilerAmostragem(intervalo=float(os.getenv('GATEWAY_PROFILE_INTERVALO_MS', '5')) / 1000.0)
+        self.PROFILE_MAX = float(os.getenv('GATEWAY_PROFILE_MAX', '60'))
+
+        # Qualidade do fluxo UDP por origem (Dados.sequencia/timestamp): QUALIDADE[:ID]
+        self.qualidade = QualidadeFluxo(janela=int(os.getenv('GATEWAY_QUALIDADE_JANELA', '64')),
+                                        salto_max=int(os.getenv('GATEWAY_QUALIDADE_SALTO_MAX', '1000000')))
+
+        # Estagio de saida: agrupa linhas por cliente e descarrega com sendmsg
+        self.TCP_NODELAY = os.getenv('GATEWAY_TCP_NODELAY', '1') == '1'
+        self.saida = EstagioSaida(
+            ao_falhar=self.desconectar_cliente,
+            atraso=float(os.getenv('GATEWAY_FLUSH_MS', '2')) / 1000.0,
+            max_pendente=int(os.getenv('GATEWAY_MAX_PENDENTE', str(8 * 1024 * 1024))),
+            perfil=self.perfil
+        )
+
+        # Compressao opcional por conexao (cliente pede com COMPRIMIR:ZLIB)
+        self.ZLIB_NIVEL = int(os.getenv('GATEWAY_ZLIB_NIVEL', '6'))
+        self.ZLIB_JANELA = int(os.getenv('GATEWAY_ZLIB_JANELA', '15'))
+        self.ZLIB_CPU_MAX = float(os.getenv('GATEWAY_ZLIB_CPU_MAX', '0.05'))
+
+        # Controle de admissao na porta de clientes
+        self.BACKLOG = int(os.getenv('GATEWAY_BACKLOG', '128'))
+        self.MAX_CLIENTES = int(os.getenv('GATEWAY_MAX_CLIENTES', '100'))
+        self.CMD_TAXA = float(os.getenv('GATEWAY_CMD_TAXA', '20'))      # comandos/s por cliente (0 = sem limite)
+        self.CMD_RAJADA = float(os.getenv('GATEWAY_CMD_RAJADA', '40'))
+
+        # Plano de dados UDP: buffer do kernel e filas por prioridade entre o
+        # receptor e o processamento (descarte de telemetria de rotina primeiro)
+        self.UDP_RCVBUF = int(os.getenv('GATEWAY_UDP_RCVBUF', '0'))  # Bytes (0 = padrao do sistema)
+        self.classificador = Classificador(
+            tipos_criticos=[t for t in os.getenv('GATEWAY_PRIORIDADE_CRITICA', 'COR_SEMAFORO').split(',') if t],
+            tipos_baixos=[t for t in os.getenv('GATEWAY_PRIORIDADE_BAIXA', 'TEMPERATURA,QUALIDADE_AR').split(',') if t],
+            tem_regras=self.regras.tem_regras,
+            tipo_dispositivo=self.dispositivos.tipo
+        )
+        self.filas_dados = FilasPrioridade(
+            capacidade=int(os.getenv('GATEWAY_FILA_DADOS', '10000')),
+            limiar=float(os.getenv('GATEWAY_FILA_LIMIAR_AMOSTRA', '0.5')),
+            amostra=int(os.getenv('GATEWAY_FILA_AMOSTRA_BAIXA', '10'))
+        )
+        self.udp_descartes_kernel = 0
+        # Deteccao de sensores quebrados/falsificados em micro-lotes (precisa de NumPy)
+        self.anomalias = None
+        if os.getenv('GATEWAY_ANOMALIAS', '1') == '1':
+            if not NUMPY_DISPONIVEL:
+                self.log("NumPy nao instalado: deteccao de anomalias desligada")
+            else:
+                self.anomalias = DetectorAnomalias(
+                    alfa=float(os.getenv('GATEWAY_ANOMALIA_ALFA', '0.05')),
+                    limiar_z=float(os.getenv('GATEWAY_ANOMALIA_Z', '6')),
+                    repeticoes=int(os.getenv('GATEWAY_ANOMALIA_REPETICOES', '30')),
+                    aquecimento=int(os.getenv('GATEWAY_ANOMALIA_AQUECIMENTO', '20')),
+                    lote=int(os.getenv('GATEWAY_ANOMALIA_LOTE', '256')),
+                    intervalo=float(os.getenv('GATEWAY_ANOMALIA_INTERVALO', '0.5')),
+                    discretos=[t for t in os.getenv('GATEWAY_ANOMALIA_DISCRETOS', 'COR_SEMAFORO').split(',') if t],
+                    sem_travado=[m for m in os.getenv('GATEWAY_ANOMALIA_SEM_TRAVADO', '_CONTAGEM,_HIST_').split(',') if m],
+                    max_pendentes=int(os.getenv('GATEWAY_ANOMALIA_MAX_PENDENTES', '65536'))
+                )
+
+        self.metricas = Metricas()
+        self.api = None
+        self.video = None
+        if self.PORTA_VIDEO:
+            self.video = RetransmissorVideo(self.HOST, self.PORTA_VIDEO, self.log,
+                                            buffer_envio=int(os.getenv('GATEWAY_VIDEO_SNDBUF', str(64 * 1024))),
+                                            tempo_camera=float(os.getenv('GATEWAY_VIDEO_TEMPO_CAMERA', '15')))
 
     def log(self, msg):
         print(f"[GATEWAY] {msg}")
@@ -52,19 +215,24 @@ class IoTGateway:
             self.log(f"Erro ao enviar discovery: {e}")
 
     def iniciar_descoberta(self):
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        sock.bind(('', self.MCAST_PORT))
+        sock = self.herdados.pop('descoberta', None)
+        if sock is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(('', self.MCAST_PORT))
+
+            # Entra no grupo Multicast (um socket herdado ja esta no grupo)
+            mreq = struct.pack("4sl", socket.inet_aton(self.MCAST_GRP), socket.INADDR_ANY)
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
         sock.settimeout(1.0)  # Timeout para permitir verificar flag running
         self.sockets.append(sock)
-        
-        # Entra no grupo Multicast
-        mreq = struct.pack("4sl", socket.inet_aton(self.MCAST_GRP), socket.INADDR_ANY)
-        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+        self.escutas['descoberta'] = sock
         
         self.log(f"Aguardando dispositivos via Multicast em {self.MCAST_GRP}:{self.MCAST_PORT}")
 
         while running:
+            if self.pausar_se_preciso('descoberta'):
+                continue
             try:
                 data, addr = sock.recvfrom(1024)
                 try:
@@ -73,26 +241,33 @@ class IoTGateway:
                     
                     if msg.tipo_mensagem == "REGISTRO":
                         d_id = msg.id_origem
-                        is_new = d_id not in self.dispositivos
-                        self.dispositivos[d_id] = {
-                            'ip': addr[0], 
-                            'porta': msg.registro.porta,
-                            'tipo': msg.registro.tipo_dispositivo
-                        }
+                        try:
+                            is_new = self.dispositivos.registrar(d_id, addr[0], msg.registro.porta,
+                                                                 msg.registro.tipo_dispositivo)
+                        except ValueError as e:
+                            self.log(f"Registro de {d_id} rejeitado: {e}")
+                            continue
                         if is_new:
                             self.log(f"Novo dispositivo registrado: {d_id} ({msg.registro.tipo_dispositivo})")
                         else:
                             self.log(f"Dispositivo reconectado: {d_id}")
                         # Notificar clientes sobre novo dispositivo
-                        self.broadcast_clientes(f"[REGISTRO] {d_id}:{msg.registro.tipo_dispositivo}:{msg.registro.porta}")
+                        self.versao_estado += 1
+                        self.broadcast_evento(Evento.registro(d_id, msg.registro.tipo_dispositivo, msg.registro.porta))
                     
                     elif msg.tipo_mensagem == "DESREGISTRO":
                         d_id = msg.id_origem
-                        if d_id in self.dispositivos:
-                            del self.dispositivos[d_id]
+                        if self.dispositivos.remover(d_id):
+                            self.remover_leituras(d_id)
+                            self.estatisticas.remover(d_id)
+                            self.regras.remover(d_id)
+                            self.qualidade.remover(d_id)
+                            if self.anomalias is not None:
+                                self.anomalias.remover(d_id)
+                            self.versao_estado += 1
                             self.log(f"Dispositivo desregistrado: {d_id}")
                             # Notificar clientes que dispositivo foi removido
-                            self.broadcast_clientes(f"[DESREGISTRO] {d_id}")
+                            self.broadcast_evento(Evento.desregistro(d_id))
                 except: pass
             except socket.timeout:
                 continue
@@ -100,98 +275,646 @@ class IoTGateway:
                 break
 
     def iniciar_dados(self):
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        sock.bind((self.HOST, self.PORTA_DADOS))
+        """Receptor UDP: parse, duplicatas e classificacao; o resto fica para processar_dados"""
+        sock = self.herdados.pop('dados', None)
+        herdado = sock is not None
+        if not herdado:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.UDP_RCVBUF:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.UDP_RCVBUF)
+        # Linux anexa a cada datagrama o total de descartes do socket por buffer cheio
+        anc_tamanho = 0
+        if SO_RXQ_OVFL is not None:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+                anc_tamanho = socket.CMSG_SPACE(4)
+            except OSError:
+                pass
+        if not herdado:
+            sock.bind((self.HOST, self.PORTA_DADOS))
         sock.settimeout(1.0)
         self.sockets.append(sock)
-        self.log(f"Ouvindo dados de sensores na porta {self.PORTA_DADOS}")
+        self.escutas['dados'] = sock
+        rcvbuf = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        self.log(f"Ouvindo dados de sensores na porta {self.PORTA_DADOS} (SO_RCVBUF={rcvbuf})")
 
         while running:
+            if self.pausar_se_preciso('dados', self.pausa_ingestao):
+                continue
             try:
-                data, addr = sock.recvfrom(1024)
+                if anc_tamanho:
+                    data, anc, _, addr = sock.recvmsg(MAX_DATAGRAMA, anc_tamanho)
+                    for nivel, tipo, valor in anc:
+                        if nivel == socket.SOL_SOCKET and tipo == SO_RXQ_OVFL and len(valor) >= 4:
+                            self.udp_descartes_kernel = struct.unpack('I', valor[:4])[0]
+                else:
+                    data, addr = sock.recvfrom(MAX_DATAGRAMA)
                 try:
+                    t = time.perf_counter()
+                    rastro = self.perfil.amostrar()
                     msg = proto.Mensagem()
                     msg.ParseFromString(data)
+                    t = self.perfil.marcar('parse', t, rastro)
                     if msg.tipo_mensagem == "DADOS":
-                        # Registrar dispositivo automaticamente se nao existir
                         d_id = msg.id_origem
-                        if d_id not in self.dispositivos:
-                            self.dispositivos[d_id] = {
-                                'ip': addr[0],
-                                'porta': 0,  # Sensor UDP nao tem porta TCP
-                                'tipo': 'SENSOR'
-                            }
-                            self.log(f"Sensor descoberto via dados: {d_id}")
-                            self.broadcast_clientes(f"[REGISTRO] {d_id}:SENSOR:0")
-                        
-                        txt = f"[{msg.id_origem}] {msg.dados.tipo_leitura}: {msg.dados.valor:.1f} {msg.dados.unidade}"
-                        print(f" -> {txt}")
-                        self.broadcast_clientes(txt)
+                        agora = time.time()
+                        # Duplicatas (sequencia ja vista) param aqui, antes da fila e do fan-out;
+                        # leituras descartadas pela fila depois disso nao contam como perda da rede
+                        if not self.qualidade.registrar(d_id, msg.dados.sequencia, msg.dados.timestamp, agora):
+                            self.metricas.contar('duplicadas_descartadas')
+                            continue
+                        t = self.perfil.marcar('qualidade', t, rastro)
+                        # Lote (resumo da borda): cada item e uma leitura; a sequencia e da mensagem
+                        for dados in (msg.lote if len(msg.lote) else (msg.dados,)):
+                            if not math.isfinite(dados.valor):
+                                # inf/nan nao tem media, quantil nem JSON: sensor com defeito ou forjado
+                                self.metricas.contar('leituras_nao_finitas')
+                                continue
+                            classe = self.classificador.classificar(d_id, dados.tipo_leitura)
+                            self.filas_dados.colocar(classe, (d_id, dados, addr, agora, t, rastro))
+                            rastro = None  # Rastreio so do primeiro item
+                            if self.anomalias is not None:
+                                self.anomalias.adicionar(d_id, dados.tipo_leitura, dados.valor, dados.timestamp or agora)
                 except: pass
             except socket.timeout:
                 continue
             except:
                 break
 
-    def iniciar_clientes(self):
-        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        server.bind((self.HOST, self.PORTA_CLIENTES))
-        server.listen(5)
+    def executar_anomalias(self):
+        """Thread do detector: fora do receptor UDP, que so enfileira as leituras"""
+        while running:
+            self.anomalias.aguardar(self.anomalias.intervalo)
+            if self.pausar_se_preciso('anomalias', self.pausa_ingestao):
+                continue
+            self.verificar_anomalias()
+
+    def verificar_anomalias(self):
+        """Processa o micro-lote do detector quando encheu ou venceu o intervalo"""
+        agora = time.time()
+        if not self.anomalias.vencido(agora):
+            return
+        try:
+            for d_id, tipo_leitura, valor, motivo, detalhe in self.anomalias.processar(agora):
+                evento = Evento.anomalia(motivo, d_id, tipo_leitura, valor, detalhe)
+                self.log(evento.linha())
+                self.broadcast_evento(evento)
+        except Exception as e:
+            self.log(f"Erro na deteccao de anomalias: {e}")
+
+    def processar_dados(self):
+        """Consome as filas de prioridade: registro, estatisticas, fan-out e regras"""
+        while running:
+            if self.pausa_ingestao.is_set() and self.filas_dados.vazia():
+                # Handoff: so para depois de esvaziar a fila (os receptores ja pararam)
+                self.pausados.add('processar')
+                time.sleep(0.01)
+                continue
+            self.pausados.discard('processar')
+            item = self.filas_dados.tirar()
+            if item is None:
+                continue
+            _, (d_id, dados, addr, agora, t, rastro) = item
+            try:
+                t = self.perfil.marcar('fila', t, rastro)
+                self.processar_leitura(d_id, dados, addr, agora, t, rastro)
+            except Exception as e:
+                self.log(f"Erro ao processar leitura de {d_id}: {e}")
+
+    def processar_leitura(self, d_id, dados, addr, agora, t, rastro=None):
+        # Registrar dispositivo automaticamente se nao existir
+        if d_id not in self.dispositivos:
+            self.dispositivos.registrar(d_id, addr[0], 0, 'SENSOR')  # Sensor UDP nao tem porta TCP
+            self.log(f"Sensor descoberto via dados: {d_id}")
+            self.broadcast_evento(Evento.registro(d_id, 'SENSOR', 0))
+        
+        evento = Evento.leitura(d_id, dados.tipo_leitura, dados.valor, dados.unidade,
+                                agora, dados.sequencia)
+        self.ultimas_leituras.atualizar(d_id, dados.tipo_leitura, dados.valor, dados.unidade,
+                                        agora, dados.sequencia)
+        self.versao_estado += 1
+        if self.shm is not None:
+            self.shm.publicar(d_id, dados.tipo_leitura, dados.valor, dados.unidade, agora, dados.sequencia)
+        t = self.perfil.marcar('registro', t, rastro)
+        self.estatisticas.registrar(d_id, dados.tipo_leitura, dados.valor, agora)
+        t = self.perfil.marcar('estatisticas', t, rastro)
+        
+        txt = evento.linha()
+        t = self.perfil.marcar('formatacao', t, rastro)
+        print(f" -> {txt}")
+        t = self.perfil.marcar('log', t, rastro)
+        self.broadcast_evento(evento)
+        if self.repub is not None:
+            self.repub.publicar(evento)
+        t = self.perfil.marcar('broadcast', t, rastro)
+        
+        for regra in self.regras.avaliar(d_id, dados.tipo_leitura, dados.valor):
+            self.executar_regra(regra, d_id, dados.tipo_leitura, dados.valor)
+        self.perfil.marcar('regras', t, rastro)
+        if rastro is not None:
+            self.log(f"[TRACE] {d_id} {dados.tipo_leitura} {self.perfil.formatar_rastro(rastro)}")
+
+    def abrir_escuta(self, nome, porta):
+        """Socket TCP em escuta: o herdado do processo anterior, se houver, ou um novo"""
+        server = self.herdados.pop(nome, None)
+        if server is None:
+            server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            server.bind((self.HOST, porta))
+            server.listen(self.BACKLOG)
         server.settimeout(1.0)
         self.sockets.append(server)
+        self.escutas[nome] = server
+        return server
+
+    def iniciar_clientes(self):
+        server = self.abrir_escuta('clientes', self.PORTA_CLIENTES)
         self.log(f"Painel de Controle disponivel na porta {self.PORTA_CLIENTES}")
         
         while running:
+            # Durante o handoff as conexoes novas esperam no backlog pelo processo novo
+            if self.pausar_se_preciso('clientes'):
+                continue
             try:
                 client, addr = server.accept()
-                self.clientes.append(client)
+                if not self.admitir(client, b"[ERRO] Limite de conexoes atingido, tente novamente mais tarde\n"):
+                    continue
+                cliente = Cliente(client, addr, BaldeFichas(self.CMD_TAXA, self.CMD_RAJADA))
+                self.clientes.append(cliente)
                 self.log(f"Cliente conectado: {addr}")
-                threading.Thread(target=self.handle_client, args=(client,), daemon=True).start()
+                threading.Thread(target=self.handle_client, args=(cliente,), daemon=True).start()
             except socket.timeout:
                 continue
             except:
                 break
 
-    def handle_client(self, client):
-        client.send(b"Conectado. Use: ID:ACAO:PARAM\n")
-        client.settimeout(1.0)
-        
-        # Enviar lista de dispositivos ja registrados
-        for d_id, info in self.dispositivos.items():
-            msg = f"[REGISTRO] {d_id}:{info['tipo']}:{info['porta']}\n"
+    def iniciar_recuperacao_repub(self):
+        """Porta so de recuperacao da republicacao: sem saudacao, snapshot, fan-out nem limite de paineis"""
+        server = self.abrir_escuta('repub', self.REPUB_PORTA_RECUPERACAO)
+        self.repub.porta_recuperacao = self.REPUB_PORTA_RECUPERACAO
+        self.log(f"Recuperacao da republicacao na porta {self.REPUB_PORTA_RECUPERACAO}")
+        while running:
+            if self.pausar_se_preciso('repub'):
+                continue
+            try:
+                conn, _ = server.accept()
+                threading.Thread(target=self.repub.atender_recuperacao, args=(conn,), daemon=True).start()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+
+    def iniciar_websocket(self):
+        server = self.abrir_escuta('websocket', self.PORTA_WS)
+        self.log(f"WebSocket (eventos em JSON) disponivel na porta {self.PORTA_WS}")
+
+        while running:
+            if self.pausar_se_preciso('websocket'):
+                continue
             try:
-                client.send(msg.encode())
+                client, addr = server.accept()
+                if not self.admitir(client, b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"):
+                    continue
+                threading.Thread(target=self.handle_websocket, args=(client, addr), daemon=True).start()
+            except socket.timeout:
+                continue
+            except:
+                break
+
+    def admitir(self, client, recusa):
+        """Conta a conexao e recusa rapido acima de MAX_CLIENTES; retorna se foi aceita"""
+        self.metricas.contar('conexoes_recebidas')
+        if len(self.clientes) >= self.MAX_CLIENTES:
+            # Rejeicao rapida: sem thread, sem snapshot
+            self.metricas.contar('conexoes_rejeitadas')
+            try:
+                client.setblocking(False)
+                client.send(recusa)
             except: pass
+            client.close()
+            return False
+        self.metricas.contar('conexoes_aceitas')
+        if self.TCP_NODELAY:
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return True
+
+    def carregar_regras(self):
+        if not os.path.exists(self.ARQUIVO_REGRAS):
+            self.log(f"Nenhum arquivo de regras em {self.ARQUIVO_REGRAS}")
+            return 0
+        try:
+            total = self.regras.carregar(self.ARQUIVO_REGRAS)
+            self.log(f"{total} regra(s) carregada(s) de {self.ARQUIVO_REGRAS}")
+            return total
+        except Exception as e:
+            self.log(f"Erro ao carregar regras: {e}")
+            return None
+
+    def executar_regra(self, regra, d_id, tipo_leitura, valor):
+        """Emite o alerta e dispara os comandos de uma regra que casou"""
+        if regra.alerta:
+            evento = Evento.alerta(regra.nome, d_id, tipo_leitura, valor, regra.operador, regra.limite)
+            self.log(evento.linha())
+            self.broadcast_evento(evento)
+        for alvo, acao, param in regra.comandos:
+            # Conexao TCP ao dispositivo pode demorar; nao segurar a thread de dados
+            threading.Thread(target=self.enviar_comando_device, args=(alvo, acao, param), daemon=True).start()
+
+    def montar_registros(self):
+        """Eventos REGISTRO de todos os dispositivos conhecidos"""
+        return [Evento.registro(d_id, info['tipo'], info['porta'])
+                for d_id, info in self.dispositivos.items()]
+
+    def formatar_listagem(self, opcoes):
+        """Resposta compacta de LISTAR com opcoes: cabecalho + uma linha '+id tipo porta' / '-id' por dispositivo"""
+        params = {}
+        for par in opcoes.split(';'):
+            if '=' in par:
+                chave, valor = par.split('=', 1)
+                params[chave.strip().lower()] = valor.strip()
+        try:
+            limite = min(int(params.get('limite', self.LISTAR_LIMITE)), self.LISTAR_LIMITE_MAX)
+            desde = int(params['desde']) if 'desde' in params else None
+        except ValueError:
+            return "[ERRO] Use LISTAR:tipo=T;prefixo=P;limite=N;cursor=ID ou LISTAR:desde=VERSAO"
+
+        if desde is not None:
+            mudancas, versao = self.dispositivos.mudancas_desde(desde)
+            if mudancas is None:
+                # Diario nao cobre mais essa versao: listar tudo de novo a partir do inicio
+                return f"[RESYNC] versao={versao} use LISTAR:limite=N"
+            linhas = [f"[MUDANCAS] desde={desde} versao={versao} n={len(mudancas)}"]
+            linhas += [f"+{d_id} {info['tipo']} {info['porta']}" if op == REGISTRO and info else f"-{d_id}"
+                       for op, d_id, info in mudancas]
+            return "\n".join(linhas)
+
+        pagina, proximo, total, versao = self.dispositivos.listar(
+            params.get('tipo'), params.get('prefixo'), max(1, limite), params.get('cursor'))
+        linhas = [f"[REGISTROS] versao={versao} total={total} n={len(pagina)} proximo={proximo or '-'}"]
+        linhas += [f"+{d_id} {info['tipo']} {info['porta']}" for d_id, info in pagina]
+        return "\n".join(linhas)
+
+    def montar_snapshot(self):
+        """Registro completo seguido do ultimo valor de cada leitura"""
+        eventos = self.montar_registros()
+        eventos.extend(Evento.leitura(*item) for item in self.ultimas_leituras.itens())
+        return eventos
+
+    def enviar_cliente(self, cliente, dados):
+        """Enfileira bytes ou eventos no estagio de saida; desconecta clientes lentos demais"""
+        if not self.saida.enviar(cliente, dados):
+            self.log(f"Cliente {cliente.addr} nao acompanha o fluxo, desconectando")
+            self.desconectar_cliente(cliente)
+
+    def responder(self, cliente, texto):
+        """Resposta de comando: cada linha vira um Evento TEXTO no formato do cliente"""
+        self.enviar_cliente(cliente, [Evento.texto(linha) for linha in texto.splitlines()])
+
+    def desconectar_cliente(self, cliente):
+        if cliente in self.clientes:
+            self.clientes.remove(cliente)
+        try:
+            cliente.sock.close()
+        except: pass
+
+    def coletar_metricas(self):
+        contadores = self.metricas.snapshot()
+        contadores['clientes'] = len(self.clientes)
+        contadores['dispositivos'] = len(self.dispositivos)
+        contadores['saida_mensagens'] = self.saida.mensagens
+        contadores['saida_bytes'] = self.saida.bytes
+        contadores['saida_syscalls'] = self.saida.syscalls
+        contadores.update(self.filas_dados.contadores())
+        contadores['agenda'] = len(self.agenda.agendamentos)
+        contadores['agenda_executados'] = self.agenda.executados
+        contadores['udp_descartes_kernel'] = self.udp_descartes_kernel
+        if self.video is not None:
+            contadores.update(self.video.contadores())
+        if self.anomalias is not None:
+            contadores.update(self.anomalias.contadores())
+        if self.shm is not None:
+            contadores['shm_tabela_cheia'] = self.shm.descartes_cheia
+            contadores['shm_campos_longos'] = self.shm.campos_longos
+        if self.repub is not None:
+            contadores['repub_publicadas'] = self.repub.publicadas
+            contadores['repub_recuperadas'] = self.repub.recuperadas
+        if self.api is not None:
+            contadores['http_pedidos'] = self.api.pedidos
+            contadores['http_304'] = self.api.respostas_304
+        return contadores
+
+    def formatar_metricas(self):
+        contadores = self.coletar_metricas()
+        return "[METRICAS] " + " ".join(f"{k}={v}" for k, v in sorted(contadores.items()))
+
+    def montar_estado_http(self):
+        """Copia do registro com os ultimos valores de cada dispositivo (para a API HTTP)"""
+        estado = {d_id: {'id': d_id, 'tipo': info['tipo'], 'porta': info['porta'], 'ip': info['ip'], 'leituras': []}
+                  for d_id, info in self.dispositivos.items()}
+        for d_id, tipo_leitura, valor, unidade, timestamp, sequencia in self.ultimas_leituras.itens():
+            d = estado.get(d_id)
+            if d is not None:
+                d['leituras'].append({'tipo_leitura': tipo_leitura, 'valor': valor, 'unidade': unidade,
+                                      'timestamp': timestamp, 'sequencia': sequencia})
+        return estado
+
+    def consultar_stats(self, d_id, tipo_leitura, janela=None):
+        if janela is None:
+            janelas = self.estatisticas.nomes_janelas()
+            janela = janelas[0] if janelas else ''
+        resumo = self.estatisticas.consultar(d_id, tipo_leitura, janela)
+        return None if resumo is None else {'janela': janela, **resumo}
+
+    def formatar_stats(self, d_id, tipo_leitura, janela=None):
+        janelas = self.estatisticas.nomes_janelas()
+        if janela is None:
+            janela = janelas[0] if janelas else ''
+        resumo = self.estatisticas.consultar(d_id, tipo_leitura, janela)
+        if resumo is None:
+            return f"[ERRO] Janela desconhecida: {janela} (disponiveis: {','.join(janelas)})"
+        txt = f"[STATS] {d_id}:{tipo_leitura}:{janela}"
+        if 'inicio' in resumo:
+            txt += f" inicio={time.strftime('%H:%M:%S', time.localtime(resumo['inicio']))}"
+        txt += f" n={resumo['n']}"
+        if resumo['n']:
+            txt += (f" media={resumo['media']:.1f} min={resumo['min']:.1f} max={resumo['max']:.1f}"
+                    f" p50={resumo['p50']:.1f} p95={resumo['p95']:.1f}")
+        return txt
+
+    def handle_client(self, cliente, saudacao=True):
+        client = cliente.sock
+        client.settimeout(1.0)
+        
+        # Saudacao + dispositivos registrados + ultimos valores em uma unica escrita
+        # (um cliente herdado no handoff ja tem tudo isso e so continua o fluxo)
+        if saudacao and self.SNAPSHOT_MAX and len(self.dispositivos) > self.SNAPSHOT_MAX:
+            # Registro grande demais para despejar na conexao: o cliente pagina com LISTAR
+            self.responder(cliente, f"Conectado. Use: ID:ACAO:PARAM\n"
+                                    f"[REGISTROS] versao={self.dispositivos.versao} total={len(self.dispositivos)}"
+                                    f" use LISTAR:limite=N;cursor=ID")
+        elif saudacao:
+            self.enviar_cliente(cliente, [Evento.texto("Conectado. Use: ID:ACAO:PARAM")] + self.montar_snapshot())
         
         while running:
+            if self.pausar_se_preciso(cliente):
+                continue
             try:
                 data = client.recv(1024)
                 if not data: break
-                cmd_str = data.decode().strip()
-                parts = cmd_str.split(':')
-                
-                if parts[0] == "LISTAR":
-                    # Comando para listar dispositivos
-                    for d_id, info in self.dispositivos.items():
-                        msg = f"[REGISTRO] {d_id}:{info['tipo']}:{info['porta']}\n"
-                        client.send(msg.encode())
-                elif parts[0] == "DISCOVERY":
-                    # Comando para forcar descoberta
-                    self.enviar_discovery()
-                    client.send(b"[OK] Pedido de descoberta enviado\n")
-                elif len(parts) == 3:
-                    self.enviar_comando_device(parts[0], parts[1], parts[2])
-                    client.send(f"[OK] Comando enviado para {parts[0]}\n".encode())
-                else:
-                    client.send(b"Formato invalido. Use: ID:ACAO:PARAM\n")
+                for cmd_str in data.decode().splitlines():
+                    self.receber_comando(cliente, cmd_str)
             except socket.timeout:
                 continue
             except:
-                if client in self.clientes:
-                    self.clientes.remove(client)
                 break
+        self.desconectar_cliente(cliente)
+
+    def handle_websocket(self, client, addr):
+        client.settimeout(5.0)
+        try:
+            caminho = responder_handshake(client)
+        except:
+            caminho = None
+        if caminho is None:
+            client.close()
+            return
+
+        # So entra no fan-out depois do 101: antes disso nenhum quadro pode sair
+        cliente = Cliente(client, addr, BaldeFichas(self.CMD_TAXA, self.CMD_RAJADA))
+        cliente.formato = "ws"
+        self.clientes.append(cliente)
+        self.log(f"Cliente WebSocket conectado: {addr} ({caminho})")
+        self.enviar_cliente(cliente, [Evento.texto("Conectado. Use: ID:ACAO:PARAM")] + self.montar_snapshot())
+
+        leitor = LeitorQuadros()
+        client.settimeout(1.0)
+        ultimo = time.monotonic()
+        proximo_ping = ultimo + self.WS_PING
+        codigo = 1000
+        while running and cliente in self.clientes:
+            try:
+                data = client.recv(4096)
+                if not data: break
+                ultimo = time.monotonic()
+                fechar = False
+                for opcode, payload in leitor.alimentar(data):
+                    if opcode == OP_TEXTO:
+                        for cmd_str in payload.decode().splitlines():
+                            self.receber_comando(cliente, cmd_str)
+                    elif opcode == OP_PING:
+                        self.enviar_cliente(cliente, quadro(payload, OP_PONG))
+                    elif opcode == OP_FECHAR:
+                        fechar = True
+                        break
+                    # OP_PONG so renova `ultimo`; binario e ignorado
+                if fechar:
+                    break
+            except socket.timeout:
+                pass
+            except ErroWebSocket as e:
+                self.log(f"Cliente WebSocket {addr}: {e}")
+                codigo = e.codigo
+                break
+            except:
+                break
+            if self.WS_PING:
+                agora = time.monotonic()
+                if agora - ultimo > 2 * self.WS_PING:
+                    self.log(f"Cliente WebSocket {addr} sem resposta ao ping, desconectando")
+                    codigo = 1001
+                    break
+                if agora >= proximo_ping:
+                    self.enviar_cliente(cliente, quadro(b"", OP_PING))
+                    proximo_ping = agora + self.WS_PING
+        self.fechar_websocket(cliente, codigo)
+
+    def fechar_websocket(self, cliente, codigo):
+        """Tira o cliente do fan-out e manda o quadro de fechamento antes de fechar o socket"""
+        if cliente in self.clientes:
+            self.clientes.remove(cliente)
+        try:
+            cliente.sock.settimeout(0.5)
+            cliente.sock.send(quadro_fechar(codigo))
+        except: pass
+        self.desconectar_cliente(cliente)
+
+    def receber_comando(self, cliente, cmd_str):
+        """Aplica o limite de taxa e executa uma linha de comando de um cliente"""
+        cmd_str = cmd_str.strip()
+        if not cmd_str:
+            return
+        self.metricas.contar('comandos')
+        if not cliente.fichas.consumir():
+            # Rejeicao rapida: nao executa nada para clientes acima da taxa
+            self.metricas.contar('comandos_rejeitados')
+            self.responder(cliente, "[ERRO] Limite de comandos excedido, aguarde")
+            return
+        t = time.perf_counter()
+        self.processar_comando(cliente, cmd_str)
+        self.perfil.marcar('comando', t)
+
+    def processar_comando(self, cliente, cmd_str):
+        parts = cmd_str.split(':')
+        
+        if parts[0] == "LISTAR" and len(parts) > 1 and parts[1]:
+            # LISTAR:tipo=T;prefixo=P;limite=N;cursor=ID ou LISTAR:desde=VERSAO
+            self.responder(cliente, self.formatar_listagem(cmd_str.split(':', 1)[1]))
+        elif parts[0] == "LISTAR":
+            # Comando para listar dispositivos
+            self.enviar_cliente(cliente, self.montar_registros())
+        elif parts[0] == "ESTADO":
+            # Comando para reenviar registro + ultimos valores
+            self.enviar_cliente(cliente, self.montar_snapshot())
+        elif parts[0] == "STATS" and len(parts) in (3, 4):
+            # Comando para consultar agregados: STATS:ID:TIPO[:JANELA]
+            self.responder(cliente, self.formatar_stats(*parts[1:]))
+        elif parts[0] == "REGRAS":
+            # Comando para listar (REGRAS) ou recarregar (REGRAS:RECARREGAR) as regras
+            if len(parts) == 2 and parts[1] == "RECARREGAR":
+                total = self.carregar_regras()
+                resposta = "[ERRO] Falha ao carregar regras\n" if total is None else f"[OK] {total} regra(s) carregada(s)\n"
+            else:
+                resposta = "".join(f"[REGRA] {r}\n" for r in self.regras.listar()) or "[OK] Nenhuma regra\n"
+            self.responder(cliente, resposta)
+        elif parts[0] in ("COMPRIMIR", "FORMATO") and cliente.formato == "ws":
+            # O fluxo WebSocket e sempre JSON em quadros; nao pode virar zlib cru nem texto
+            self.responder(cliente, f"[ERRO] {parts[0]} nao se aplica a conexoes WebSocket")
+        elif parts[0] == "COMPRIMIR":
+            # Comando para ativar compressao do fluxo: COMPRIMIR:ZLIB (apos o [OK] tudo vem comprimido)
+            if cliente.compressor is not None:
+                self.responder(cliente, f"[COMPRESSAO] {cliente.compressor.resumo()}")
+            elif len(parts) == 2 and parts[1].upper() == "ZLIB":
+                compressor = CompressorFluxo(self.ZLIB_NIVEL, self.ZLIB_JANELA, self.ZLIB_CPU_MAX)
+                aviso = Evento.texto("[OK] Compressao zlib ativada").serializar(cliente.formato)
+                cliente.ativar_compressao(compressor, aviso)
+                self.saida.marcar(cliente)
+            else:
+                self.responder(cliente, "[ERRO] Use: COMPRIMIR:ZLIB")
+        elif parts[0] == "FORMATO":
+            # Comando para escolher o formato dos eventos: FORMATO:TEXTO|JSON|PROTO
+            # (o [OK] sai no formato antigo; tudo depois dele, no novo)
+            formato = parts[1].lower() if len(parts) == 2 else ''
+            if formato not in FORMATOS:
+                self.responder(cliente, f"[ERRO] Use: FORMATO:{'|'.join(f.upper() for f in FORMATOS)}")
+                return
+            cliente.trocar_formato(formato, Evento.texto(f"[OK] Formato {formato.upper()}"))
+            self.saida.marcar(cliente)
+        elif parts[0] == "METRICAS":
+            # Comando para consultar carga do gateway
+            self.responder(cliente, self.formatar_metricas())
+        elif parts[0] == "QUALIDADE":
+            # Comando para consultar perdas/duplicatas/reordenacao/atraso: QUALIDADE[:ID]
+            linhas = self.qualidade.resumo(parts[1] if len(parts) > 1 else None)
+            if linhas is None:
+                self.responder(cliente, f"[ERRO] Sem dados de sequencia para {parts[1]}")
+            else:
+                self.responder(cliente, "\n".join(f"[QUALIDADE] {linha}" for linha in linhas))
+        elif parts[0] == "LATENCIAS":
+            # Comando para consultar (LATENCIAS) ou zerar (LATENCIAS:ZERAR) os tempos por estagio
+            if len(parts) == 2 and parts[1] == "ZERAR":
+                self.perfil.zerar()
+                self.responder(cliente, "[OK] Latencias zeradas")
+            else:
+                resposta = "".join(f"[LATENCIA] {estagio} {resumo}\n" for estagio, resumo in self.perfil.resumos())
+                self.responder(cliente, resposta or "[OK] Nenhuma medicao ainda")
+        elif parts[0] == "PROFILE" and len(parts) == 2:
+            # Profiler por amostragem no processo em execucao: PROFILE:SEGUNDOS
+            try:
+                duracao = float(parts[1])
+            except ValueError:
+                duracao = 0
+            if not 0 < duracao <= self.PROFILE_MAX:
+                self.responder(cliente, f"[ERRO] Use: PROFILE:SEGUNDOS (ate {self.PROFILE_MAX:g})")
+                return
+            self.responder(cliente, f"[OK] Amostrando por {duracao:g}s")
+            # Em outra thread: o cliente continua recebendo o fluxo enquanto amostra
+            threading.Thread(target=self.executar_profile, args=(cliente, duracao), daemon=True).start()
+        elif parts[0] == "ONDA_VERDE" and len(parts) == 3:
+            # Coordena semaforos em onda verde: ONDA_VERDE:id1,id2,id3:INTERVALO_S
+            ids = [d for d in parts[1].split(',') if d]
+            try:
+                intervalo = float(parts[2])
+            except ValueError:
+                intervalo = math.nan
+            if not math.isfinite(intervalo):
+                self.responder(cliente, "[ERRO] Use: ONDA_VERDE:ID1,ID2,...:INTERVALO_S")
+                return
+            for i, d_id in enumerate(ids):
+                threading.Thread(target=self.enviar_comando_device,
+                                 args=(d_id, "SET_OFFSET", f"{i * intervalo:g}"), daemon=True).start()
+            self.responder(cliente, f"[OK] Onda verde com {len(ids)} semaforo(s), intervalo {intervalo:g}s")
+        elif parts[0] == "AGENDAR" and len(parts) == 5:
+            # Agenda um comando: AGENDAR:QUANDO:ID:ACAO:PARAM (QUANDO = +30s, @06h00, *06h00 ou *10m)
+            try:
+                ag = self.agenda.agendar(parts[1], parts[2], parts[3], parts[4])
+            except ValueError:
+                self.responder(cliente, "[ERRO] QUANDO invalido. Use +30s/+10m (uma vez), @06h00 (proximo horario),"
+                                        " *06h00 (todo dia) ou *10m (a cada intervalo), ate 366d")
+                return
+            self.responder(cliente, f"[OK] Agendado {ag.linha()}")
+        elif parts[0] == "AGENDA":
+            # Lista os proximos agendamentos: AGENDA[:N]
+            try:
+                limite = int(parts[1]) if len(parts) > 1 and parts[1] else 100
+            except ValueError:
+                limite = 100
+            total, proximos = self.agenda.listar(limite)
+            linhas = [f"[AGENDA] total={total} mostrando={len(proximos)}"]
+            linhas += [f"[AGENDA] {ag.linha()}" for ag in proximos]
+            self.responder(cliente, "\n".join(linhas))
+        elif parts[0] == "CANCELAR" and len(parts) == 2:
+            # Cancela um agendamento: CANCELAR:ID (como mostrado em AGENDA, com ou sem #)
+            try:
+                ag = self.agenda.cancelar(int(parts[1].lstrip('#')))
+            except ValueError:
+                ag = None
+            if ag is None:
+                self.responder(cliente, f"[ERRO] Agendamento {parts[1]} nao encontrado")
+            else:
+                self.responder(cliente, f"[OK] Cancelado {ag.linha()}")
+        elif parts[0] == "ANOMALIAS":
+            # Dispositivos sinalizados agora pelo detector de anomalias
+            if self.anomalias is None:
+                self.responder(cliente, "[ERRO] Deteccao de anomalias desligada")
+                return
+            sinalizados = self.anomalias.sinalizados()
+            linhas = [f"[ANOMALIAS] sinalizados={len(sinalizados)}"]
+            linhas += [f"[ANOMALIAS] {d_id} {tipo_leitura} {','.join(motivos)}" for d_id, tipo_leitura, motivos in sinalizados]
+            self.responder(cliente, "\n".join(linhas))
+        elif parts[0] == "REPUB":
+            # Topicos da republicacao multicast (REPUB) ou recuperacao de perdas: REPUB:INDICE:DE:ATE
+            if self.repub is None:
+                self.responder(cliente, "[ERRO] Republicacao multicast desligada (GATEWAY_REPUB_GRUPO)")
+            elif len(parts) == 1:
+                self.responder(cliente, "\n".join(self.repub.descrever()))
+            else:
+                linhas = self.repub.pedido(cmd_str)
+                if linhas is None:
+                    self.responder(cliente, "[ERRO] Use: REPUB:INDICE:DE:ATE")
+                    return
+                self.responder(cliente, "\n".join(linhas))
+        elif parts[0] == "DISCOVERY":
+            # Comando para forcar descoberta
+            self.enviar_discovery()
+            self.responder(cliente, "[OK] Pedido de descoberta enviado")
+        elif len(parts) == 3:
+            self.enviar_comando_device(parts[0], parts[1], parts[2])
+            self.responder(cliente, f"[OK] Comando enviado para {parts[0]}")
+        else:
+            self.responder(cliente, "Formato invalido. Use: ID:ACAO:PARAM")
+
+    def executar_profile(self, cliente, duracao):
+        linhas = self.profiler.executar(duracao)
+        if linhas is None:
+            linhas = ["[ERRO] Ja existe um PROFILE em andamento"]
+        self.responder(cliente, "\n".join(linhas))
+
+    def remover_leituras(self, d_id):
+        """Descarta os ultimos valores de um dispositivo que saiu da rede"""
+        self.ultimas_leituras.remover(d_id)
+        if self.shm is not None:
+            self.shm.remover(d_id)
 
     def enviar_comando_device(self, d_id, acao, param):
         if d_id in self.dispositivos:
@@ -218,13 +941,138 @@ class IoTGateway:
         else:
             self.log(f"Dispositivo {d_id} desconhecido.")
 
-    def broadcast_clientes(self, txt):
+    def pausar_se_preciso(self, nome, pausa=None):
+        """Lacos de ingestao e de comandos param aqui enquanto o handoff estiver em andamento"""
+        pausa = pausa or self.pausa
+        if not pausa.is_set():
+            return False
+        self.pausados.add(nome)
+        while pausa.is_set() and running:
+            time.sleep(0.01)
+        self.pausados.discard(nome)
+        return True
+
+    def exportar_estado(self):
+        return {'registro': self.dispositivos.exportar(), 'leituras': self.ultimas_leituras.itens(),
+                'qualidade': self.qualidade.exportar(), 'regras': self.regras.exportar(),
+                'agenda': self.agenda.exportar(), 'repub': self.repub.exportar() if self.repub else {},
+                'versao_estado': self.versao_estado}
+
+    def importar_estado(self, estado):
+        self.dispositivos.importar(estado['registro'])
+        for item in estado['leituras']:
+            self.ultimas_leituras.atualizar(*item)
+        self.qualidade.importar(estado['qualidade'])
+        self.versao_estado = estado['versao_estado'] + 1
+
+    def entregar_processo(self, conn):
+        """Passa sockets e estado para o processo novo e encerra este quando ele assumir.
+
+        Para a ingestao (os datagramas esperam no buffer do socket, que passa a
+        ser lido pelo processo novo), esvazia a fila de dados e a saida dos
+        clientes que vao junto e so entao tira o instantaneo. Se o processo
+        novo nao confirmar, este retoma como se nada tivesse acontecido.
+        Clientes com compressao e WebSocket nao sao passados (o estado do
+        zlib/dos quadros fica neste processo): eles reconectam.
+        """
+        global running
+        self.log("Processo novo pediu o handoff: pausando a ingestao")
+        clientes = []
+        if self.HANDOFF_CLIENTES:
+            clientes = [c for c in self.clientes[:] if c.compressor is None and c.formato != "ws"]
+        esperados = {'descoberta', 'clientes', *clientes}
+        if self.PORTA_WS:
+            esperados.add('websocket')
+        if self.repub is not None and self.REPUB_PORTA_RECUPERACAO:
+            esperados.add('repub')
+        self.agenda.suspensa = True
+        self.pausa.set()
+        # A telemetria segue enquanto os lacos ociosos (timeout de 1s) param; a
+        # ingestao so para depois, e fica parada o minimo possivel
+        if not self.aguardar_pausa(esperados):
+            return
+        self.pausa_ingestao.set()
+        ingestao = {'dados', 'processar'}
+        if self.anomalias is not None:
+            ingestao.add('anomalias')
+        if not self.aguardar_pausa(ingestao, clientes):
+            return
+
+        # O segmento nao e apagado: o processo novo adota o mesmo, e leitores
+        # ligados a ele nao percebem a troca
+        if self.shm is not None:
+            self.shm.soltar()
+            self.shm = None
+        sockets = [(nome, sock, None) for nome, sock in self.escutas.items()]
+        if self.video is not None and self.video.server is not None:
+            sockets.append(('video', self.video.server, None))
+        if self.api is not None:
+            sockets.append(('http', self.api.server.socket, None))
+        sockets += [('cliente', c.sock, {'addr': list(c.addr), 'formato': c.formato}) for c in clientes]
+        try:
+            handoff.enviar(conn, sockets, self.exportar_estado())
+            assumiu = handoff.aguardar_confirmacao(conn)
+        except Exception as e:
+            self.log(f"Erro ao entregar o estado: {e}")
+            assumiu = False
+        if not assumiu:
+            self.log("Processo novo nao assumiu: retomando")
+            if self.SHM_NOME:
+                try:
+                    self.shm = TabelaCompartilhada(self.SHM_NOME, self.SHM_SLOTS, adotar=True)
+                    for item in self.ultimas_leituras.itens():
+                        self.shm.publicar(*item)
+                except Exception as e:
+                    self.log(f"Erro ao retomar memoria compartilhada: {e}")
+            self.retomar()
+            return
+
+        # Daqui em diante o processo novo atende: este so fecha suas copias e sai
+        for c in clientes:
+            if c in self.clientes:
+                self.clientes.remove(c)
+        self.agenda.arquivo = None
+        self.log(f"Processo novo assumiu {len(sockets)} socket(s), {len(clientes)} cliente(s); encerrando")
+        running = False
+
+    def aguardar_pausa(self, esperados, clientes=(), timeout=5.0):
+        """Espera os lacos pararem, a fila de dados e a saida dos `clientes` esvaziarem; retoma e retorna False se passar do tempo"""
+        limite = time.monotonic() + timeout
+        while time.monotonic() < limite:
+            if (esperados <= self.pausados and self.filas_dados.vazia()
+                    and all(c.vazio() for c in clientes)):
+                return True
+            time.sleep(0.001)
+        self.log("Handoff cancelado: a ingestao nao parou a tempo")
+        self.retomar()
+        return False
+
+    def retomar(self):
+        self.pausa_ingestao.clear()
+        self.pausa.clear()
+        self.agenda.suspensa = False
+
+    def receber_handoff(self):
+        """Pede sockets e estado ao processo em execucao; retorna (conexao, clientes herdados, estado)"""
+        if not handoff.DISPONIVEL or not self.HANDOFF_SOCK:
+            raise RuntimeError("--upgrade precisa de GATEWAY_HANDOFF_SOCK e de um sistema Unix")
+        self.log(f"Pedindo o handoff ao processo atual em {self.HANDOFF_SOCK}...")
+        conn, sockets, estado = handoff.receber(self.HANDOFF_SOCK)
+        clientes = []
+        for nome, sock, meta in sockets:
+            if nome == 'cliente':
+                clientes.append((sock, meta))
+            else:
+                self.herdados[nome] = sock
+        self.importar_estado(estado)
+        self.log(f"Recebidos {len(self.herdados)} socket(s) de escuta, {len(clientes)} cliente(s)"
+                 f" e {len(self.dispositivos)} dispositivo(s)")
+        return conn, clientes, estado
+
+    def broadcast_evento(self, evento):
+        # Cada formato e serializado uma vez (cache no Evento) e compartilhado
         for c in self.clientes[:]:  # Copia da lista para evitar problemas
-            try: 
-                c.send(f"{txt}\n".encode())
-            except: 
-                if c in self.clientes:
-                    self.clientes.remove(c)
+            self.enviar_cliente(c, evento)
 
     def cleanup(self):
         """Limpa recursos ao encerrar"""
@@ -233,19 +1081,114 @@ class IoTGateway:
                 sock.close()
             except:
                 pass
-        for client in self.clientes:
+        for cliente in self.clientes:
+            try:
+                cliente.sock.close()
+            except:
+                pass
+        if self.api is not None:
+            try:
+                self.api.fechar()
+            except:
+                pass
+        if self.video is not None:
+            self.video.fechar()
+        if self.handoff is not None:
+            self.handoff.fechar()  # Sem apagar o caminho: o processo novo ja pode estar escutando nele
+        self.agenda.salvar()
+        if self.shm is not None:
             try:
-                client.close()
+                self.shm.fechar()
             except:
                 pass
 
-    def start(self):
+    def start(self, atualizar=False):
+        conn_handoff = clientes_herdados = estado = None
+        if atualizar:
+            # Se algo falhar antes da confirmacao, o processo atual retoma sozinho
+            conn_handoff, clientes_herdados, estado = self.receber_handoff()
+        self.carregar_regras()
+        if estado is not None:
+            self.regras.importar(estado['regras'])
+            total = self.agenda.importar(estado['agenda'])
+            self.log(f"{total} agendamento(s) recebido(s) do processo anterior")
+        else:
+            try:
+                total = self.agenda.carregar()
+                if total:
+                    self.log(f"{total} agendamento(s) carregado(s) de {self.agenda.arquivo}")
+            except Exception as e:
+                self.log(f"Erro ao carregar agenda: {e}")
+        threading.Thread(target=self.agenda.executar_laco, args=(lambda: running,), daemon=True).start()
+        if self.SHM_NOME:
+            try:
+                self.shm = TabelaCompartilhada(self.SHM_NOME, self.SHM_SLOTS, adotar=estado is not None)
+                for item in self.ultimas_leituras.itens():
+                    self.shm.publicar(*item)
+                self.log(f"Ultimos valores publicados na memoria compartilhada '{self.SHM_NOME}' ({self.SHM_SLOTS} slots)")
+            except Exception as e:
+                self.log(f"Erro ao criar memoria compartilhada: {e}")
+        if self.REPUB_GRUPO:
+            self.repub = Republicador(self.REPUB_GRUPO, self.REPUB_PORTA, self.REPUB_TOPICOS,
+                                      self.REPUB_HISTORICO, self.REPUB_TTL)
+            if estado is not None:
+                self.repub.importar(estado['repub'])
+            threading.Thread(target=self.repub.executar_heartbeat, args=(lambda: running,), daemon=True).start()
+            if self.REPUB_PORTA_RECUPERACAO:
+                threading.Thread(target=self.iniciar_recuperacao_repub, daemon=True).start()
+            self.log(f"Leituras republicadas em {self.REPUB_GRUPO}, portas {self.REPUB_PORTA}"
+                     f"-{self.REPUB_PORTA + len(self.repub.topicos) - 1}")
+        
+        if conn_handoff is not None:
+            # Clientes herdados entram no fan-out antes dos receptores: nenhuma leitura passa sem eles
+            for sock, meta in clientes_herdados:
+                cliente = Cliente(sock, tuple(meta['addr']), BaldeFichas(self.CMD_TAXA, self.CMD_RAJADA))
+                cliente.formato = meta['formato']
+                self.clientes.append(cliente)
+                threading.Thread(target=self.handle_client, args=(cliente, False), daemon=True).start()
+
         t1 = threading.Thread(target=self.iniciar_descoberta, daemon=True)
         t2 = threading.Thread(target=self.iniciar_dados, daemon=True)
         t3 = threading.Thread(target=self.iniciar_clientes, daemon=True)
+        t4 = threading.Thread(target=self.saida.executar, args=(lambda: running,), daemon=True)
+        t5 = threading.Thread(target=self.processar_dados, daemon=True)
         t1.start()
         t2.start()
         t3.start()
+        t4.start()
+        t5.start()
+        if self.anomalias is not None:
+            threading.Thread(target=self.executar_anomalias, daemon=True).start()
+        if self.PORTA_WS:
+            threading.Thread(target=self.iniciar_websocket, daemon=True).start()
+        if self.video is not None:
+            threading.Thread(target=self.video.executar, args=(lambda: running, self.herdados.pop('video', None)),
+                             daemon=True).start()
+        if self.PORTA_HTTP:
+            self.api = ApiHttp(self.HOST, self.PORTA_HTTP, self.montar_estado_http, self.coletar_metricas,
+                               self.consultar_stats, lambda: self.versao_estado, self.HTTP_INTERVALO,
+                               sock=self.herdados.pop('http', None))
+            threading.Thread(target=self.api.executar, daemon=True).start()
+            threading.Thread(target=self.api.executar_atualizacao, args=(lambda: running,), daemon=True).start()
+            self.log(f"API HTTP somente leitura na porta {self.PORTA_HTTP}")
+        
+        if conn_handoff is not None:
+            usados = {'descoberta', 'dados', 'clientes'}
+            usados.update(nome for nome, ligado in (('websocket', self.PORTA_WS), ('video', self.video),
+                                                    ('http', self.PORTA_HTTP)) if ligado)
+            for nome in set(self.herdados) - usados:
+                self.log(f"Socket herdado '{nome}' sem uso nesta configuracao")
+                self.herdados.pop(nome).close()
+            # Os receptores ja estao lendo os sockets herdados: o processo anterior pode sair
+            handoff.confirmar(conn_handoff)
+            self.log("Handoff concluido: processo anterior encerrando")
+        if self.HANDOFF_SOCK:
+            if not handoff.DISPONIVEL:
+                self.log("Handoff indisponivel neste sistema (precisa de socket Unix com SCM_RIGHTS)")
+            else:
+                self.handoff = handoff.ServidorHandoff(self.HANDOFF_SOCK, self.entregar_processo, self.log)
+                threading.Thread(target=self.handoff.executar, args=(lambda: running,), daemon=True).start()
+                self.log(f"Atualizacao sem parada: python gateway.py --upgrade (handoff em {self.HANDOFF_SOCK})")
         
         self.log("Gateway iniciado! Pressione Ctrl+C para encerrar.")
         
@@ -273,4 +1216,4 @@ class IoTGateway:
 
 if __name__ == "__main__":
     print("[GATEWAY] Iniciando... (Ctrl+C para encerrar)")
-    IoTGateway().start()
+    IoTGateway().start(atualizar='--upgrade' in sys.argv)
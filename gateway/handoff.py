@@ -0,0 +1,124 @@
+import json
+import os
+import socket
+import struct
+
+# Passagem de descritores entre processos (SCM_RIGHTS): so Unix, Python 3.9+
+DISPONIVEL = hasattr(socket, 'AF_UNIX') and hasattr(socket, 'send_fds')
+
+PEDIDO = b"HANDOFF\n"
+CONFIRMACAO = b"OK\n"
+MAX_FDS = 200  # Por mensagem (o Linux aceita ate 253)
+TAMANHO = struct.Struct('>I')
+
+# Protocolo no socket Unix (processo novo -> antigo e volta):
+#   novo:   HANDOFF\n
+#   antigo: JSON com a lista de sockets [{"nome", "meta"}], com prefixo de tamanho
+#           os descritores, na mesma ordem, em mensagens de ate MAX_FDS
+#           JSON com o estado, com prefixo de tamanho
+#   novo:   OK\n quando ja assumiu; qualquer outra coisa (ou fechar) = desistiu
+
+
+def _enviar_json(conn, objeto):
+    corpo = json.dumps(objeto, separators=(',', ':')).encode()
+    conn.sendall(TAMANHO.pack(len(corpo)) + corpo)
+
+
+def _ler_exato(conn, n):
+    partes = []
+    while n:
+        parte = conn.recv(min(n, 1 << 20))
+        if not parte:
+            raise ConnectionError("handoff interrompido")
+        partes.append(parte)
+        n -= len(parte)
+    return b"".join(partes)
+
+
+def _ler_json(conn):
+    return json.loads(_ler_exato(conn, TAMANHO.unpack(_ler_exato(conn, TAMANHO.size))[0]))
+
+
+class ServidorHandoff:
+    """Ponto de encontro do processo atual com o que vai substitui-lo.
+
+    Escuta em `caminho` (permissao 0600: quem conecta leva os sockets do
+    gateway) e, a cada pedido, chama `entregar(conn)`, que pausa a ingestao
+    e usa `enviar` e `aguardar_confirmacao`.
+    """
+
+    def __init__(self, caminho, entregar, log):
+        self.caminho = caminho
+        self.entregar = entregar
+        self.log = log
+        if os.path.exists(caminho):
+            os.unlink(caminho)  # Sobra de um processo anterior (ou do que esta saindo)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(caminho)
+        os.chmod(caminho, 0o600)
+        self.server.listen(1)
+        self.server.settimeout(1.0)
+
+    def executar(self, ativo):
+        while ativo():
+            try:
+                conn, _ = self.server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            with conn:
+                try:
+                    conn.settimeout(10.0)
+                    if _ler_exato(conn, len(PEDIDO)) == PEDIDO:
+                        self.entregar(conn)
+                except Exception as e:
+                    self.log(f"Erro no handoff: {e}")
+
+    def fechar(self):
+        try:
+            self.server.close()
+        except OSError:
+            pass
+
+
+def enviar(conn, sockets, estado):
+    """Manda [(nome, socket, meta)] e o estado para o processo novo"""
+    _enviar_json(conn, [{"nome": nome, "meta": meta} for nome, _, meta in sockets])
+    fds = [sock.fileno() for _, sock, _ in sockets]
+    for i in range(0, len(fds), MAX_FDS):
+        socket.send_fds(conn, [b"F"], fds[i:i + MAX_FDS])
+    _enviar_json(conn, estado)
+
+
+def aguardar_confirmacao(conn, timeout=30.0):
+    conn.settimeout(timeout)
+    try:
+        return _ler_exato(conn, len(CONFIRMACAO)) == CONFIRMACAO
+    except (OSError, ConnectionError):
+        return False
+
+
+def receber(caminho, timeout=10.0):
+    """Pede a entrega ao processo atual: (conexao, [(nome, socket, meta)], estado).
+
+    A conexao fica aberta: o processo antigo so sai depois de `confirmar`.
+    """
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.settimeout(timeout)
+    conn.connect(caminho)
+    conn.sendall(PEDIDO)
+    descricoes = _ler_json(conn)
+    fds = []
+    while len(fds) < len(descricoes):
+        _, recebidos, _, _ = socket.recv_fds(conn, 1, MAX_FDS)
+        if not recebidos:
+            raise ConnectionError("handoff sem descritores")
+        fds.extend(recebidos)
+    sockets = [(d["nome"], socket.socket(fileno=fd), d["meta"]) for d, fd in zip(descricoes, fds)]
+    return conn, sockets, _ler_json(conn)
+
+
+def confirmar(conn):
+    conn.sendall(CONFIRMACAO)
+    conn.close()
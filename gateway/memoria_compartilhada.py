@@ -0,0 +1,289 @@
+import struct
+import sys
+import threading
+import time
+from multiprocessing import shared_memory
+
+# Cabecalho: magica, versao do layout, numero de slots, tamanho do slot,
+# slots ja usados e versao global (incrementada a cada escrita)
+CABECALHO = struct.Struct('<4sIIIIQ')
+MAGICA = b'IOTM'
+MAGICA_FECHADA = b'IOTX'  # Gravada antes de apagar o segmento: leitores ligados a ele reabrem pelo nome
+VERSAO_LAYOUT = 1
+
+# Slot: contador do seqlock, id, tipo_leitura, unidade, valor, timestamp de
+# recebimento e sequencia da origem. Strings em UTF-8 completadas com zeros.
+SEQLOCK = struct.Struct('<Q')
+DADOS_SLOT = struct.Struct('<40s24s8sddQ')
+TAMANHO_SLOT = SEQLOCK.size + DADOS_SLOT.size
+MAX_ID, MAX_TIPO, MAX_UNIDADE = 40, 24, 8  # Bytes (UTF-8) de cada campo de texto do slot
+
+
+def _texto(campo):
+    return campo.rstrip(b'\0').decode('utf-8', 'replace')
+
+
+class TabelaCompartilhada:
+    """Ultimo valor por (dispositivo, tipo_leitura) numa memoria compartilhada.
+
+    O layout e fixo: cabecalho seguido de `n_slots` slots de TAMANHO_SLOT
+    bytes. Cada chave ganha um slot na primeira leitura e fica com ele; slots
+    de dispositivos desregistrados voltam para uma lista livre. Cada slot tem
+    um contador de seqlock: impar durante a escrita, par quando estavel. O
+    leitor copia o slot e so aceita a copia se o contador era par e nao mudou,
+    entao nao ha lock entre processos e os leitores nao atrasam o gateway.
+
+    Com a tabela cheia, chaves novas sao descartadas; id, tipo_leitura ou
+    unidade maiores que o campo do slot tambem (o struct cortaria a string,
+    as vezes no meio de um caractere). Nos dois casos `publicar` retorna
+    False e conta em `descartes_cheia` ou `campos_longos`.
+
+    Um segmento com o mesmo nome so e apagado e recriado se o cabecalho
+    mostra que e uma tabela do gateway (sobra de um processo que nao
+    encerrou direito); qualquer outro da FileExistsError. Com `adotar`
+    (handoff: o processo anterior fez `soltar`), uma tabela nossa com o mesmo
+    numero de slots e reaproveitada no lugar: leitores ja ligados seguem
+    lendo o mesmo segmento, sem interrupcao.
+    """
+
+    def __init__(self, nome, n_slots=4096, adotar=False):
+        tamanho = CABECALHO.size + n_slots * TAMANHO_SLOT
+        self.nome = nome
+        self.n_slots = n_slots
+        self.slots = {}    # (id, tipo_leitura) -> indice do slot
+        self.livres = []
+        self.usados = 0
+        self.versao = 0
+        self.descartes_cheia = 0
+        self.campos_longos = 0
+        self.lock = threading.Lock()  # Dados e descoberta escrevem de threads diferentes
+        try:
+            self.shm = shared_memory.SharedMemory(name=nome, create=True, size=tamanho)
+        except FileExistsError:
+            if adotar and self._adotar(nome):
+                return
+            self._recuperar_segmento(nome)
+            self.shm = shared_memory.SharedMemory(name=nome, create=True, size=tamanho)
+        self.buf = self.shm.buf
+        self.buf[:tamanho] = bytes(tamanho)
+        self._cabecalho()
+
+    def _adotar(self, nome):
+        """Assume a tabela deixada pelo processo anterior; False se o layout nao bate"""
+        shm = shared_memory.SharedMemory(name=nome)
+        if shm.size < CABECALHO.size + self.n_slots * TAMANHO_SLOT:
+            shm.close()
+            return False
+        magica, layout, n_slots, tamanho_slot, usados, versao = CABECALHO.unpack_from(shm.buf, 0)
+        if (magica, layout, n_slots, tamanho_slot) != (MAGICA, VERSAO_LAYOUT, self.n_slots, TAMANHO_SLOT):
+            shm.close()
+            return False
+        self.shm, self.buf = shm, shm.buf
+        self.usados, self.versao = usados, versao
+        # Reconstroi o indice a partir dos proprios slots (ninguem escreve durante o handoff)
+        for indice in range(usados):
+            campos = DADOS_SLOT.unpack_from(self.buf, CABECALHO.size + indice * TAMANHO_SLOT + SEQLOCK.size)
+            d_id = _texto(campos[0])
+            if d_id:
+                self.slots[(d_id, _texto(campos[1]))] = indice
+            else:
+                self.livres.append(indice)
+        return True
+
+    @staticmethod
+    def _recuperar_segmento(nome):
+        """Apaga um segmento que sobrou de outro gateway; FileExistsError se ele nao for uma tabela nossa"""
+        antiga = shared_memory.SharedMemory(name=nome)
+        nosso = False
+        try:
+            if antiga.size >= CABECALHO.size:
+                magica, layout, _, tamanho_slot, _, _ = CABECALHO.unpack_from(antiga.buf, 0)
+                nosso = magica == MAGICA and layout == VERSAO_LAYOUT and tamanho_slot == TAMANHO_SLOT
+            if nosso:
+                antiga.buf[:len(MAGICA_FECHADA)] = MAGICA_FECHADA  # Leitores ligados a ela reabrem pelo nome
+        finally:
+            antiga.close()
+        if not nosso:
+            # Sem isso o resource_tracker deste processo apagaria o segmento alheio na saida
+            try:
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(antiga._name, "shared_memory")
+            except Exception:
+                pass
+            raise FileExistsError(f"Segmento {nome} ja existe e nao e uma tabela do gateway; nao foi apagado")
+        antiga.unlink()
+
+    def _cabecalho(self):
+        CABECALHO.pack_into(self.buf, 0, MAGICA, VERSAO_LAYOUT, self.n_slots, TAMANHO_SLOT,
+                            self.usados, self.versao)
+
+    def _escrever(self, indice, *campos):
+        pos = CABECALHO.size + indice * TAMANHO_SLOT
+        seq = SEQLOCK.unpack_from(self.buf, pos)[0]
+        SEQLOCK.pack_into(self.buf, pos, seq + 1)
+        DADOS_SLOT.pack_into(self.buf, pos + SEQLOCK.size, *campos)
+        SEQLOCK.pack_into(self.buf, pos, seq + 2)
+
+    def publicar(self, d_id, tipo_leitura, valor, unidade, timestamp, sequencia=0):
+        chave = (d_id, tipo_leitura)
+        campos = d_id.encode(), tipo_leitura.encode(), unidade.encode()
+        if len(campos[0]) > MAX_ID or len(campos[1]) > MAX_TIPO or len(campos[2]) > MAX_UNIDADE:
+            self.campos_longos += 1
+            return False
+        with self.lock:
+            indice = self.slots.get(chave)
+            if indice is None:
+                if self.livres:
+                    indice = self.livres.pop()
+                elif self.usados < self.n_slots:
+                    indice = self.usados
+                    self.usados += 1
+                else:
+                    self.descartes_cheia += 1
+                    return False
+                self.slots[chave] = indice
+            self._escrever(indice, *campos, valor, timestamp, sequencia)
+            self.versao += 1
+            self._cabecalho()
+        return True
+
+    def remover(self, d_id):
+        """Libera os slots de um dispositivo (id vazio = slot livre para o leitor)"""
+        with self.lock:
+            for chave in [k for k in self.slots if k[0] == d_id]:
+                indice = self.slots.pop(chave)
+                self._escrever(indice, b'', b'', b'', 0.0, 0.0, 0)
+                self.livres.append(indice)
+            self.versao += 1
+            self._cabecalho()
+
+    def fechar(self):
+        self.buf[:len(MAGICA_FECHADA)] = MAGICA_FECHADA  # Leitores percebem que este segmento acabou
+        self.buf = None
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+    def soltar(self):
+        """Desliga este processo do segmento sem apagar: o processo novo do handoff adota"""
+        self.buf = None
+        self.shm.close()
+        # Sem isso o resource_tracker apagaria o segmento quando este processo saisse
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+        except Exception:
+            pass
+
+
+class LeitorTabela:
+    """Leitor da tabela para processos locais (analytics, exportadores).
+
+        tabela = LeitorTabela("iot_gateway")
+        valor, unidade, ts, seq = tabela.ler("sensor_temp_01", "TEMPERATURA")
+        for d_id, tipo_leitura, valor, unidade, ts, seq in tabela.leituras(): ...
+
+    Le direto do segmento, sem socket nem parse de texto. `versao()` muda a
+    cada escrita do gateway: quem faz polling pode pular a varredura quando
+    ela nao mudou.
+
+    Se o gateway apaga o segmento (encerrou, ou recriou a tabela com outro
+    tamanho), o cabecalho fica marcado como fechado e o leitor reabre pelo
+    nome na proxima chamada; sem tabela nova, FileNotFoundError. No handoff
+    o segmento passa de um processo para o outro e nada muda para o leitor.
+    """
+
+    TENTATIVAS = 100
+
+    def __init__(self, nome):
+        self.nome = nome
+        self._abrir()
+        self.indice = {}  # Cache (id, tipo_leitura) -> slot, conferido a cada leitura
+
+    def _abrir(self):
+        nome = self.nome
+        self.shm = shared_memory.SharedMemory(name=nome)
+        # O gateway e o dono do segmento: sem isso o resource_tracker deste
+        # processo apagaria a memoria quando o leitor encerrasse
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+        except Exception:
+            pass
+        self.buf = self.shm.buf
+        magica, layout, self.n_slots, tamanho_slot, _, _ = CABECALHO.unpack_from(self.buf, 0)
+        if magica != MAGICA or layout != VERSAO_LAYOUT or tamanho_slot != TAMANHO_SLOT:
+            self.fechar()
+            raise ValueError(f"Segmento {nome} nao e uma tabela do gateway (layout {layout})")
+
+    def _cabecalho(self):
+        if self.buf is None or self.buf[:len(MAGICA_FECHADA)] == MAGICA_FECHADA:
+            # O gateway apagou este segmento: liga no atual com o mesmo nome
+            self.fechar()
+            self.indice.clear()
+            self._abrir()
+        return CABECALHO.unpack_from(self.buf, 0)
+
+    def versao(self):
+        return self._cabecalho()[5]
+
+    def _usados(self):
+        return self._cabecalho()[4]
+
+    def _ler_slot(self, indice):
+        """Copia consistente do slot, ou None se o gateway escreveu demais durante a leitura"""
+        pos = CABECALHO.size + indice * TAMANHO_SLOT
+        for _ in range(self.TENTATIVAS):
+            antes = SEQLOCK.unpack_from(self.buf, pos)[0]
+            if antes & 1:
+                time.sleep(0)
+                continue
+            campos = DADOS_SLOT.unpack_from(self.buf, pos + SEQLOCK.size)
+            if SEQLOCK.unpack_from(self.buf, pos)[0] == antes:
+                return campos
+        return None
+
+    def leituras(self):
+        """Lista de (id, tipo_leitura, valor, unidade, timestamp, sequencia) de todos os slots ocupados"""
+        saida = []
+        for indice in range(self._usados()):
+            campos = self._ler_slot(indice)
+            if campos is None or not campos[0].strip(b'\0'):
+                continue
+            d_id, tipo_leitura = _texto(campos[0]), _texto(campos[1])
+            self.indice[(d_id, tipo_leitura)] = indice
+            saida.append((d_id, tipo_leitura, campos[3], _texto(campos[2]), campos[4], campos[5]))
+        return saida
+
+    def ler(self, d_id, tipo_leitura):
+        """(valor, unidade, timestamp, sequencia) da chave, ou None se ela nao esta na tabela"""
+        chave = (d_id, tipo_leitura)
+        self._cabecalho()
+        indice = self.indice.get(chave)
+        if indice is not None:
+            campos = self._ler_slot(indice)
+            if campos is not None and (_texto(campos[0]), _texto(campos[1])) == chave:
+                return campos[3], _texto(campos[2]), campos[4], campos[5]
+        # Slot desconhecido ou reaproveitado: varre e refaz o cache
+        self.indice.clear()
+        for l in self.leituras():
+            if (l[0], l[1]) == chave:
+                return l[2], l[3], l[4], l[5]
+        return None
+
+    def fechar(self):
+        self.buf = None
+        self.shm.close()
+
+
+if __name__ == "__main__":
+    # Uso: python memoria_compartilhada.py [nome] -> imprime a tabela atual
+    tabela = LeitorTabela(sys.argv[1] if len(sys.argv) > 1 else "iot_gateway")
+    try:
+        for d_id, tipo_leitura, valor, unidade, ts, seq in sorted(tabela.leituras()):
+            print(f"[{d_id}] {tipo_leitura}={valor:.1f} {unidade} seq={seq} "
+                  f"idade={time.time() - ts:.1f}s")
+    finally:
+        tabela.fechar()
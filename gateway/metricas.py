@@ -0,0 +1,20 @@
+import threading
+
+
+class Metricas:
+    """Contadores do gateway, seguros para uso entre threads"""
+
+    def __init__(self):
+        self.contadores = {}
+        self.lock = threading.Lock()
+
+    def contar(self, nome, n=1):
+        with self.lock:
+            self.contadores[nome] = self.contadores.get(nome, 0) + n
+
+    def valor(self, nome):
+        return self.contadores.get(nome, 0)
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.contadores)
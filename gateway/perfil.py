@@ -0,0 +1,208 @@
+import collections
+import os
+import sys
+import threading
+import time
+
+N_BALDES = 40  # 2^40 us ~ 12 dias: sobra para qualquer latencia real
+
+
+class HistogramaLog2:
+    """Histograma de latencias com baldes em potencias de 2 (microssegundos).
+
+    O balde i guarda duracoes com `us.bit_length() == i`, ou seja, de 2^(i-1)
+    a 2^i - 1 us. Registrar custa uma conversao e um incremento; os quantis
+    saem com erro de no maximo um fator 2, suficiente para achar o gargalo.
+    """
+
+    def __init__(self):
+        self.baldes = [0] * N_BALDES
+        self.n = 0
+        self.soma = 0.0
+        self.max = 0.0
+
+    def registrar(self, segundos):
+        us = int(segundos * 1e6)
+        self.baldes[min(us.bit_length(), N_BALDES - 1)] += 1
+        self.n += 1
+        self.soma += segundos
+        if segundos > self.max:
+            self.max = segundos
+
+    def quantil(self, q):
+        """Limite superior (us) do balde que contem o quantil q"""
+        if not self.n:
+            return 0
+        alvo = q * self.n
+        acumulado = 0
+        for i, contagem in enumerate(self.baldes):
+            acumulado += contagem
+            if acumulado >= alvo:
+                return (1 << i) - 1 if i else 0
+        return (1 << (N_BALDES - 1)) - 1
+
+    def resumo(self):
+        media = self.soma / self.n * 1e6 if self.n else 0.0
+        return (f"n={self.n} media={media:.1f}us p50<={self.quantil(0.5)}us"
+                f" p99<={self.quantil(0.99)}us max={self.max * 1e6:.0f}us")
+
+
+class Perfil:
+    """Temporizadores por estagio do gateway e rastreio amostrado.
+
+    Uso no caminho quente:
+        t = time.perf_counter()
+        ...
+        t = perfil.marcar('parse', t, rastro)
+
+    `marcar` registra o tempo desde `t` no histograma do estagio e devolve o
+    instante atual, que vira o inicio do proximo estagio. Quando `rastro` nao
+    e None (mensagem sorteada por `amostrar`), os tempos tambem sao guardados
+    para imprimir o caminho completo daquela mensagem.
+    """
+
+    def __init__(self, amostra_trace=0):
+        self.histogramas = collections.defaultdict(HistogramaLog2)
+        self.lock = threading.Lock()
+        self.amostra_trace = amostra_trace  # 1 a cada N mensagens (0 = desligado)
+        self.contador = 0
+
+    def amostrar(self):
+        """Lista para os tempos da mensagem atual se ela foi sorteada, senao None"""
+        if not self.amostra_trace:
+            return None
+        self.contador += 1
+        if self.contador % self.amostra_trace:
+            return None
+        return []
+
+    def marcar(self, estagio, inicio, rastro=None):
+        agora = time.perf_counter()
+        with self.lock:
+            self.histogramas[estagio].registrar(agora - inicio)
+        if rastro is not None:
+            rastro.append((estagio, agora - inicio))
+        return agora
+
+    def formatar_rastro(self, rastro):
+        total = sum(d for _, d in rastro)
+        return " ".join(f"{estagio}={d * 1e6:.0f}us" for estagio, d in rastro) + f" total={total * 1e6:.0f}us"
+
+    def resumos(self):
+        with self.lock:
+            return [(estagio, h.resumo()) for estagio, h in sorted(self.histogramas.items())]
+
+    def zerar(self):
+        with self.lock:
+            self.histogramas.clear()
+
+
+class ProfilerAmostragem:
+    """Profiler por amostragem do processo em execucao.
+
+    Uma thread le `sys._current_frames()` a cada `intervalo` segundos e atribui
+    a pilha de cada thread a funcao do topo (tempo proprio) e a todas as
+    funcoes da pilha (tempo inclusivo). Onde o sistema expoe o tempo de CPU
+    por thread (Linux, /proc/self/task/<tid>/schedstat), cada amostra pesa a
+    CPU que a thread gastou desde a amostra anterior, entao threads paradas
+    em recv/accept nao aparecem; nos demais sistemas cada amostra pesa 1
+    (tempo de parede).
+
+    O /proc e lido por um descritor aberto por thread: se a thread saiu
+    entre uma amostra e outra a leitura so falha. (pthread_getcpuclockid com
+    o ident de uma thread que ja saiu e comportamento indefinido.)
+    """
+
+    def __init__(self, intervalo=0.005, top=10):
+        self.intervalo = intervalo
+        self.top = top
+        self.lock = threading.Lock()  # Um perfil por vez
+
+    def executar(self, duracao):
+        """Amostra por `duracao` segundos e devolve as linhas do resumo (None se ocupado)"""
+        if not self.lock.acquire(blocking=False):
+            return None
+        try:
+            return self._amostrar(duracao)
+        finally:
+            self.lock.release()
+
+    @staticmethod
+    def _cpu_thread(descritores, tid):
+        """CPU (segundos) gasta pela thread de id nativo `tid`, ou None se ela ja saiu"""
+        try:
+            fd = descritores.get(tid)
+            if fd is None:
+                fd = descritores[tid] = os.open(f"/proc/self/task/{tid}/schedstat", os.O_RDONLY)
+            return int(os.pread(fd, 64, 0).split()[0]) / 1e9
+        except (OSError, ValueError, IndexError):
+            fd = descritores.pop(tid, None)
+            if fd is not None:
+                os.close(fd)  # Thread saiu (ou o tid foi reaproveitado): reabre na proxima
+            return None
+
+    def _amostrar(self, duracao):
+        descritores = {}  # tid -> fd do schedstat
+        try:
+            return self._amostrar_com(duracao, descritores)
+        finally:
+            for fd in descritores.values():
+                os.close(fd)
+
+    def _amostrar_com(self, duracao, descritores):
+        proprio = collections.Counter()
+        inclusivo = collections.Counter()
+        cpu_anterior = {}
+        total = 0.0
+        amostras = 0
+        modo_cpu = hasattr(threading, 'get_native_id') and \
+            self._cpu_thread(descritores, threading.get_native_id()) is not None
+        eu = threading.get_ident()
+        fim = time.monotonic() + duracao
+        proximo = time.monotonic()
+        while time.monotonic() < fim:
+            nativos = {t.ident: t.native_id for t in threading.enumerate()} if modo_cpu else {}
+            for ident, frame in sys._current_frames().items():
+                if ident == eu:
+                    continue
+                if modo_cpu:
+                    tid = nativos.get(ident)
+                    cpu = None if tid is None else self._cpu_thread(descritores, tid)
+                    if cpu is None:
+                        continue
+                    peso = cpu - cpu_anterior.get(tid, cpu)
+                    cpu_anterior[tid] = cpu
+                    if peso <= 0:
+                        continue
+                else:
+                    peso = 1
+                amostras += 1
+                total += peso
+                proprio[self._local(frame, True)] += peso
+                vistos = set()
+                while frame is not None:
+                    chave = self._local(frame, False)
+                    if chave not in vistos:  # Recursao conta uma vez por amostra
+                        vistos.add(chave)
+                        inclusivo[chave] += peso
+                    frame = frame.f_back
+            proximo += self.intervalo
+            espera = proximo - time.monotonic()
+            if espera > 0:
+                time.sleep(espera)
+
+        medida = f"cpu={total * 1000:.1f}ms" if modo_cpu else "modo=parede"
+        linhas = [f"[PROFILE] {duracao:g}s amostras={amostras} intervalo={self.intervalo * 1000:g}ms {medida}"]
+        if not total:
+            return linhas
+        linhas += [f"[PROFILE] proprio {100.0 * n / total:5.1f}% {local}" for local, n in proprio.most_common(self.top)]
+        linhas += [f"[PROFILE] inclusivo {100.0 * n / total:5.1f}% {local}" for local, n in inclusivo.most_common(self.top)]
+        return linhas
+
+    @staticmethod
+    def _local(frame, com_linha):
+        codigo = frame.f_code
+        arquivo = os.path.basename(codigo.co_filename)
+        if com_linha:
+            return f"{arquivo}:{frame.f_lineno} {codigo.co_name}"
+        return f"{arquivo} {codigo.co_name}"
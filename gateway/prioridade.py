@@ -0,0 +1,112 @@
+import collections
+import threading
+
+CRITICA, NORMAL, BAIXA = 0, 1, 2
+NOMES = ("critica", "normal", "baixa")
+
+
+class Classificador:
+    """Classe de prioridade de uma leitura.
+
+    CRITICA: estado de atuadores (dispositivos ATUADOR ou tipos de leitura
+             listados, como COR_SEMAFORO) e leituras com regra associada,
+             para que os alertas nao sejam perdidos
+    BAIXA:   telemetria de rotina listada (temperatura, qualidade do ar...)
+    NORMAL:  todo o resto
+    """
+
+    def __init__(self, tipos_criticos, tipos_baixos, tem_regras, tipo_dispositivo):
+        self.tipos_criticos = set(tipos_criticos)
+        self.tipos_baixos = set(tipos_baixos)
+        self.tem_regras = tem_regras
+        self.tipo_dispositivo = tipo_dispositivo  # Funcao d_id -> tipo registrado (ou None)
+
+    def classificar(self, d_id, tipo_leitura):
+        if tipo_leitura in self.tipos_criticos or self.tipo_dispositivo(d_id) == "ATUADOR":
+            return CRITICA
+        if self.tem_regras(d_id, tipo_leitura):
+            return CRITICA
+        if tipo_leitura in self.tipos_baixos:
+            return BAIXA
+        return NORMAL
+
+
+class FilasPrioridade:
+    """Filas por classe entre o receptor UDP e o processamento, com descarte por classe.
+
+    A capacidade e compartilhada. Sob carga:
+    - acima de `limiar` da capacidade, a classe BAIXA passa a ser amostrada
+      (1 a cada `amostra` leituras entra);
+    - cheia, uma leitura NORMAL ou CRITICA que chega expulsa a BAIXA mais
+      antiga; sem BAIXA, a NORMAL e recusada e a CRITICA expulsa a NORMAL
+      mais antiga (ou a CRITICA mais antiga, ja que o estado novo vale mais);
+    - o processamento sempre tira da classe mais alta que tiver algo.
+    """
+
+    def __init__(self, capacidade=10000, limiar=0.5, amostra=10):
+        self.capacidade = capacidade
+        self.limiar = int(capacidade * limiar)
+        self.amostra = max(1, amostra)
+        self.filas = [collections.deque() for _ in NOMES]
+        self.total = 0
+        self.cond = threading.Condition()
+        self.enfileiradas = [0] * len(NOMES)
+        self.descartadas = [0] * len(NOMES)
+        self.amostradas = 0  # BAIXA descartadas pela amostragem
+        self.contador_amostra = 0
+        self.maior_total = 0
+
+    def _expulsar(self, ate_classe):
+        """Remove a mais antiga da classe mais baixa ate `ate_classe`; False se nao havia nada"""
+        for classe in range(len(NOMES) - 1, ate_classe - 1, -1):
+            if self.filas[classe]:
+                self.filas[classe].popleft()
+                self.descartadas[classe] += 1
+                self.total -= 1
+                return True
+        return False
+
+    def colocar(self, classe, item):
+        """Enfileira o item; retorna False se ele foi descartado pela politica"""
+        with self.cond:
+            if classe == BAIXA and self.total >= self.limiar:
+                self.contador_amostra += 1
+                if self.contador_amostra % self.amostra:
+                    self.amostradas += 1
+                    self.descartadas[BAIXA] += 1
+                    return False
+            if self.total >= self.capacidade:
+                if classe == BAIXA or not self._expulsar(BAIXA if classe == NORMAL else CRITICA):
+                    self.descartadas[classe] += 1
+                    return False
+            self.filas[classe].append(item)
+            self.enfileiradas[classe] += 1
+            self.total += 1
+            if self.total > self.maior_total:
+                self.maior_total = self.total
+            self.cond.notify()
+            return True
+
+    def tirar(self, timeout=1.0):
+        """(classe, item) da classe mais alta com itens, ou None se nada chegou no timeout"""
+        with self.cond:
+            if not self.total:
+                self.cond.wait(timeout)
+                if not self.total:
+                    return None
+            for classe, fila in enumerate(self.filas):
+                if fila:
+                    self.total -= 1
+                    return classe, fila.popleft()
+
+    def vazia(self):
+        return not self.total
+
+    def contadores(self):
+        with self.cond:
+            saida = {'fila_dados': self.total, 'fila_dados_max': self.maior_total,
+                     'dados_amostrados_baixa': self.amostradas}
+            for classe, nome in enumerate(NOMES):
+                saida[f'dados_{nome}_enfileirados'] = self.enfileiradas[classe]
+                saida[f'dados_{nome}_descartados'] = self.descartadas[classe]
+            return saida
@@ -0,0 +1,131 @@
+import threading
+from perfil import HistogramaLog2
+
+
+class EstadoOrigem:
+    def __init__(self):
+        self.maior = 0          # Maior sequencia ja vista
+        self.ts_maior = 0.0     # Timestamp de origem da mensagem com a maior sequencia
+        self.vistos = 0         # Bit i = sequencia (maior - i) ja recebida
+        self.recebidas = 0
+        self.perdidas = 0
+        self.duplicadas = 0
+        self.fora_de_ordem = 0
+        self.reinicios = 0
+        self.atraso = HistogramaLog2()
+
+    def resumo(self):
+        esperadas = self.recebidas + self.perdidas
+        perda = 100.0 * self.perdidas / esperadas if esperadas else 0.0
+        return (f"recebidas={self.recebidas} perdidas={self.perdidas} ({perda:.2f}%)"
+                f" duplicadas={self.duplicadas} fora_de_ordem={self.fora_de_ordem} reinicios={self.reinicios}"
+                f" atraso_p50<={self.atraso.quantil(0.5)}us atraso_p99<={self.atraso.quantil(0.99)}us")
+
+
+class QualidadeFluxo:
+    """Perdas, duplicatas, reordenacao e atraso por origem a partir de Dados.sequencia/timestamp.
+
+    Cada origem guarda a maior sequencia vista e um bitmap das `janela`
+    sequencias anteriores (como a janela anti-replay do IPsec):
+    - acima da maior: o salto conta como perda;
+    - dentro da janela e ja marcada: duplicata (descartada antes do fan-out);
+    - dentro da janela e nao marcada: chegou fora de ordem e desfaz uma perda.
+    Sequencia menor com timestamp de origem mais novo que o da maior significa
+    que o dispositivo reiniciou o contador. Um salto maior que `salto_max`
+    (datagrama corrompido ou forjado) tambem conta como reinicio, nao como
+    bilhoes de perdas. Mensagens sem sequencia (0) sao aceitas sem
+    acompanhamento.
+    """
+
+    def __init__(self, janela=64, salto_max=1000000):
+        self.janela = janela
+        self.salto_max = salto_max
+        self.origens = {}
+        self.total = EstadoOrigem()
+        self.atrasos_negativos = 0  # Relogio da origem adiantado em relacao ao gateway
+        self.lock = threading.Lock()
+
+    def registrar(self, d_id, sequencia, timestamp, agora):
+        """Contabiliza uma leitura; retorna False se for duplicata"""
+        if not sequencia:
+            return True
+        with self.lock:
+            estado = self.origens.get(d_id)
+            if estado is None:
+                estado = self.origens[d_id] = EstadoOrigem()
+            aceita = self._sequencia(estado, sequencia, timestamp)
+            if aceita and timestamp:
+                atraso = agora - timestamp
+                if atraso < 0:
+                    self.atrasos_negativos += 1
+                    atraso = 0.0
+                estado.atraso.registrar(atraso)
+                self.total.atraso.registrar(atraso)
+            return aceita
+
+    def _sequencia(self, estado, seq, ts):
+        total = self.total
+        if estado.maior and seq <= estado.maior and ts and ts > estado.ts_maior:
+            # Contador voltou mas a leitura e mais nova: a origem reiniciou
+            estado.reinicios += 1
+            total.reinicios += 1
+            estado.maior, estado.vistos = 0, 0
+
+        if seq > estado.maior:
+            deslocamento = seq - estado.maior
+            if estado.maior and deslocamento > self.salto_max:
+                estado.reinicios += 1
+                total.reinicios += 1
+            elif estado.maior:
+                estado.perdidas += deslocamento - 1
+                total.perdidas += deslocamento - 1
+            if deslocamento >= self.janela:
+                # Sem deslocar: vistos << 1e9 montaria um inteiro de ~125 MB no receptor UDP
+                estado.vistos = 1
+            else:
+                estado.vistos = ((estado.vistos << deslocamento) | 1) & ((1 << self.janela) - 1)
+            estado.maior, estado.ts_maior = seq, ts
+        else:
+            distancia = estado.maior - seq
+            if distancia >= self.janela:
+                # Velha demais para saber; trata como atrasada (ja contada como perda)
+                estado.fora_de_ordem += 1
+                total.fora_de_ordem += 1
+            elif estado.vistos >> distancia & 1:
+                estado.duplicadas += 1
+                total.duplicadas += 1
+                return False
+            else:
+                estado.vistos |= 1 << distancia
+                estado.fora_de_ordem += 1
+                total.fora_de_ordem += 1
+                estado.perdidas -= 1
+                total.perdidas -= 1
+        estado.recebidas += 1
+        total.recebidas += 1
+        return True
+
+    def remover(self, d_id):
+        with self.lock:
+            self.origens.pop(d_id, None)
+
+    def exportar(self):
+        """Janela de sequencias de cada origem (so o necessario para continuar detectando duplicatas)"""
+        with self.lock:
+            return {d_id: [e.maior, e.ts_maior, e.vistos] for d_id, e in self.origens.items()}
+
+    def importar(self, janelas):
+        with self.lock:
+            for d_id, (maior, ts_maior, vistos) in janelas.items():
+                estado = self.origens[d_id] = EstadoOrigem()
+                estado.maior, estado.ts_maior, estado.vistos = maior, ts_maior, vistos
+
+    def resumo(self, d_id=None):
+        """Linhas do resumo geral e por origem (ou so de `d_id`); None se a origem nao existe"""
+        with self.lock:
+            if d_id is not None:
+                estado = self.origens.get(d_id)
+                return None if estado is None else [f"{d_id} {estado.resumo()}"]
+            linhas = [f"total origens={len(self.origens)} {self.total.resumo()} atrasos_negativos={self.atrasos_negativos}"]
+            linhas += [f"{d} {e.resumo()}" for d, e in sorted(self.origens.items())]
+            return linhas
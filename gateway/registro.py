@@ -0,0 +1,284 @@
+import array
+import bisect
+import collections
+import sys
+import threading
+import time
+
+REGISTRO, DESREGISTRO = "+", "-"
+
+
+class TabelaStrings:
+    """Strings repetidas (tipo, ip) guardadas uma vez e referenciadas por codigo inteiro.
+
+    `limite` e o maior codigo que a coluna que guarda os codigos comporta;
+    uma string nova alem dele da ValueError sem entrar na tabela.
+    """
+
+    def __init__(self, limite=0xFFFF):
+        self.valores = [None]  # Codigo 0 = vazio
+        self.codigos = {}
+        self.limite = limite
+
+    def codigo(self, valor):
+        c = self.codigos.get(valor)
+        if c is None:
+            if len(self.valores) > self.limite:
+                raise ValueError(f"tabela de strings cheia ({self.limite} valores)")
+            c = self.codigos[valor] = len(self.valores)
+            self.valores.append(sys.intern(valor))
+        return c
+
+
+class Registro:
+    """Dispositivos conhecidos, com ids ordenados e diario de mudancas.
+
+    Leitura como um dicionario (`d_id in registro`, `registro[d_id]`,
+    `items()`); escrita so por `registrar` e `remover`, que mantem:
+    - `ids`: lista ordenada, para paginar por cursor e filtrar por prefixo
+      com busca binaria em vez de varrer tudo;
+    - `versao`: avanca a cada mudanca;
+    - `diario`: as ultimas `tamanho_diario` mudancas (versao, op, id), para
+      um cliente que volta pedir so o que mudou desde a versao que ele tinha.
+
+    O estado de cada dispositivo fica em colunas (`array`) indexadas por um
+    handle inteiro, com tipo e ip como codigos de TabelaStrings: o custo por
+    dispositivo e o id (internado) mais alguns bytes, em vez de um dict com
+    strings proprias. `registro[d_id]` monta o dict sob demanda. Handles de
+    dispositivos removidos sao reaproveitados.
+    """
+
+    def __init__(self, tamanho_diario=10000):
+        self.handles = {}               # id -> handle
+        self.ids_handle = []            # handle -> id (None = livre)
+        self.col_ip = array.array('I')
+        self.col_tipo = array.array('H')
+        self.col_porta = array.array('H')
+        self.ips = TabelaStrings(0xFFFFFFFF)   # Limites das colunas 'I' e 'H'
+        self.tipos = TabelaStrings(0xFFFF)
+        self.livres = []
+        self.ids = []
+        # Versao comeca no instante da partida (segundos << 32): depois de um
+        # reinicio do gateway, qualquer versao antiga e anterior ao diario e
+        # o cliente recebe RESYNC em vez de mudancas de outro processo
+        self.versao = int(time.time()) << 32
+        self.diario = collections.deque(maxlen=tamanho_diario)
+        self.lock = threading.Lock()
+
+    def _info(self, h):
+        return {'ip': self.ips.valores[self.col_ip[h]],
+                'porta': self.col_porta[h],
+                'tipo': self.tipos.valores[self.col_tipo[h]]}
+
+    def __contains__(self, d_id):
+        return d_id in self.handles
+
+    def __getitem__(self, d_id):
+        # Sob o lock: sem ele um `remover` seguido de `registrar` de outro id
+        # podia reaproveitar o handle entre a busca e a leitura das colunas
+        with self.lock:
+            return self._info(self.handles[d_id])
+
+    def __len__(self):
+        return len(self.handles)
+
+    def get(self, d_id, padrao=None):
+        with self.lock:
+            h = self.handles.get(d_id)
+            return padrao if h is None else self._info(h)
+
+    def tipo(self, d_id):
+        with self.lock:
+            h = self.handles.get(d_id)
+            return None if h is None else self.tipos.valores[self.col_tipo[h]]
+
+    def items(self):
+        with self.lock:
+            return [(d_id, self._info(h)) for d_id, h in self.handles.items()]
+
+    def registrar(self, d_id, ip, porta, tipo):
+        """Cria ou atualiza o dispositivo; retorna True se ele era novo.
+
+        Reanuncio com ip, porta e tipo iguais nao muda a versao nem o diario:
+        dispositivos que se registram de novo a cada poucos segundos encheriam
+        o diario e mandariam os clientes de LISTAR:desde para RESYNC.
+
+        Valor que nao cabe nas colunas (porta fora de 0..65535, tabela de
+        tipos cheia) da ValueError antes de qualquer coluna mudar.
+        """
+        if not 0 <= porta <= 0xFFFF:
+            raise ValueError(f"porta fora da faixa: {porta}")
+        with self.lock:
+            h = self.handles.get(d_id)
+            novo = h is None
+            # Codigos antes do handle: se algum nao cabe, nada foi alterado
+            codigo_ip, codigo_tipo = self.ips.codigo(ip), self.tipos.codigo(tipo)
+            if not novo and (self.col_ip[h], self.col_porta[h], self.col_tipo[h]) == (codigo_ip, porta, codigo_tipo):
+                return False
+            if novo:
+                d_id = sys.intern(d_id)
+                if self.livres:
+                    h = self.livres.pop()
+                    self.ids_handle[h] = d_id
+                else:
+                    h = len(self.ids_handle)
+                    self.ids_handle.append(d_id)
+                    self.col_ip.append(0)
+                    self.col_tipo.append(0)
+                    self.col_porta.append(0)
+                self.handles[d_id] = h
+                bisect.insort(self.ids, d_id)
+            self.col_ip[h] = codigo_ip
+            self.col_tipo[h] = codigo_tipo
+            self.col_porta[h] = porta
+            self._anotar(REGISTRO, d_id)
+            return novo
+
+    def remover(self, d_id):
+        """Retorna False se o dispositivo nao estava registrado"""
+        with self.lock:
+            h = self.handles.pop(d_id, None)
+            if h is None:
+                return False
+            self.ids_handle[h] = None
+            self.col_ip[h] = self.col_tipo[h] = self.col_porta[h] = 0
+            self.livres.append(h)
+            i = bisect.bisect_left(self.ids, d_id)
+            del self.ids[i]
+            self._anotar(DESREGISTRO, d_id)
+            return True
+
+    def exportar(self):
+        """Estado completo (dispositivos, versao e diario) para outro processo do gateway"""
+        with self.lock:
+            return {'versao': self.versao, 'diario': list(self.diario),
+                    # Em ordem de id: ao importar, cada insercao em `ids` cai no fim
+                    'dispositivos': [(d_id, *self._info(self.handles[d_id]).values()) for d_id in self.ids]}
+
+    def importar(self, estado):
+        for d_id, ip, porta, tipo in estado['dispositivos']:
+            self.registrar(d_id, ip, porta, tipo)
+        # Mesma versao e diario: clientes com LISTAR:desde=N seguem sem RESYNC
+        with self.lock:
+            self.versao = estado['versao']
+            self.diario.clear()
+            self.diario.extend(tuple(item) for item in estado['diario'])
+
+    def _anotar(self, op, d_id):
+        self.versao += 1
+        self.diario.append((self.versao, op, d_id))
+
+    def listar(self, tipo=None, prefixo=None, limite=500, cursor=None):
+        """Uma pagina de (id, info) em ordem de id, apos `cursor` (exclusivo).
+
+        Retorna (pagina, proximo_cursor ou None, total no prefixo, versao).
+        """
+        with self.lock:
+            ids = self.ids
+            inicio, fim = 0, len(ids)
+            if prefixo:
+                inicio = bisect.bisect_left(ids, prefixo)
+                fim = bisect.bisect_left(ids, prefixo + "\U0010ffff")
+            total = fim - inicio
+            if cursor:
+                inicio = max(inicio, bisect.bisect_right(ids, cursor))
+            codigo_tipo = self.tipos.codigos.get(tipo, -1) if tipo else None
+            pagina = []
+            i = inicio
+            while i < fim and len(pagina) < limite:
+                d_id = ids[i]
+                h = self.handles[d_id]
+                if codigo_tipo is None or self.col_tipo[h] == codigo_tipo:
+                    pagina.append((d_id, self._info(h)))
+                i += 1
+            # Parou com a pagina cheia antes do fim da faixa: ha mais a listar
+            proximo = pagina[-1][0] if pagina and i < fim else None
+            return pagina, proximo, total, self.versao
+
+    def mudancas_desde(self, versao):
+        """Ultima operacao por id desde `versao`: [(op, id, info ou None)], versao atual.
+
+        Retorna (None, versao atual) se o diario ja nao cobre `versao`: o
+        cliente precisa refazer a listagem completa.
+        """
+        with self.lock:
+            atual = self.versao
+            if versao > atual:
+                return None, atual
+            if versao < atual and (not self.diario or self.diario[0][0] > versao + 1):
+                return None, atual
+            ultimas = {}
+            for v, op, d_id in reversed(self.diario):
+                if v <= versao:
+                    break
+                if d_id not in ultimas:
+                    ultimas[d_id] = op
+            mudancas = [(op, d_id, self._info(self.handles[d_id])
+                         if op == REGISTRO and d_id in self.handles else None)
+                        for d_id, op in sorted(ultimas.items())]
+            return mudancas, atual
+
+
+class UltimasLeituras:
+    """Ultimo valor de cada (dispositivo, tipo_leitura), em colunas como o Registro.
+
+    Em vez de um Evento por leitura (objeto, dict de campos e as copias
+    serializadas em cache), cada par ocupa um handle com valor, timestamp e
+    sequencia em `array` e tipo_leitura/unidade como codigos de
+    TabelaStrings. Os Eventos do snapshot sao montados sob demanda.
+    """
+
+    def __init__(self):
+        self.handles = {}      # (id, tipo_leitura) -> handle
+        self.chaves = []       # handle -> (id, tipo_leitura) (None = livre)
+        self.col_valor = array.array('d')
+        self.col_timestamp = array.array('d')
+        self.col_sequencia = array.array('Q')
+        self.col_unidade = array.array('H')
+        self.tipos = TabelaStrings(sys.maxsize)  # So interna: o codigo nao vai para coluna
+        self.unidades = TabelaStrings(0xFFFF)
+        self.livres = []
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.handles)
+
+    def atualizar(self, d_id, tipo_leitura, valor, unidade, timestamp, sequencia):
+        chave = (d_id, tipo_leitura)
+        with self.lock:
+            # Antes de alocar o handle: se a tabela de unidades estiver cheia, nada muda
+            codigo_unidade = self.unidades.codigo(unidade)
+            h = self.handles.get(chave)
+            if h is None:
+                # Strings internadas: a chave nao guarda uma copia por mensagem recebida
+                chave = (sys.intern(d_id), self.tipos.valores[self.tipos.codigo(tipo_leitura)])
+                if self.livres:
+                    h = self.livres.pop()
+                    self.chaves[h] = chave
+                else:
+                    h = len(self.chaves)
+                    self.chaves.append(chave)
+                    self.col_valor.append(0.0)
+                    self.col_timestamp.append(0.0)
+                    self.col_sequencia.append(0)
+                    self.col_unidade.append(0)
+                self.handles[chave] = h
+            self.col_valor[h] = valor
+            self.col_timestamp[h] = timestamp
+            self.col_sequencia[h] = sequencia
+            self.col_unidade[h] = codigo_unidade
+
+    def remover(self, d_id):
+        with self.lock:
+            for chave in [k for k in self.handles if k[0] == d_id]:
+                h = self.handles.pop(chave)
+                self.chaves[h] = None
+                self.livres.append(h)
+
+    def itens(self):
+        """[(id, tipo_leitura, valor, unidade, timestamp, sequencia)] de todas as leituras"""
+        with self.lock:
+            unidades = self.unidades.valores
+            return [(d_id, tipo_leitura, self.col_valor[h], unidades[self.col_unidade[h]],
+                     self.col_timestamp[h], self.col_sequencia[h])
+                    for (d_id, tipo_leitura), h in self.handles.items()]
@@ -0,0 +1,147 @@
+import json
+import operator
+import threading
+import time
+
+OPERADORES = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+}
+
+
+class Regra:
+    """Regra declarativa de limite com histerese e cooldown"""
+
+    def __init__(self, definicao):
+        self.nome = definicao['nome']
+        self.dispositivo = definicao.get('dispositivo', '*')
+        self.tipo_leitura = definicao['tipo_leitura']
+        self.operador = definicao.get('operador', '>')
+        if self.operador not in OPERADORES:
+            raise ValueError(f"operador invalido na regra {self.nome}: {self.operador}")
+        self.limite = float(definicao['limite'])
+        self.histerese = float(definicao.get('histerese', 0))
+        self.cooldown = float(definicao.get('cooldown', 0))
+        self.alerta = bool(definicao.get('alerta', True))
+        self.comandos = [(c['dispositivo'], c['acao'], str(c.get('param', '')))
+                         for c in definicao.get('comandos', [])]
+
+    def disparou(self, valor):
+        return OPERADORES[self.operador](valor, self.limite)
+
+    def normalizou(self, valor):
+        """So rearma depois que o valor volta alem da faixa de histerese"""
+        if self.operador in ('>', '>='):
+            return valor < self.limite - self.histerese
+        return valor > self.limite + self.histerese
+
+    def casa_dispositivo(self, d_id):
+        if self.dispositivo == '*':
+            return True
+        if self.dispositivo.endswith('*'):
+            return d_id.startswith(self.dispositivo[:-1])
+        return d_id == self.dispositivo
+
+    def __str__(self):
+        return (f"{self.nome} {self.dispositivo} {self.tipo_leitura} {self.operador} {self.limite:g}"
+                f" histerese={self.histerese:g} cooldown={self.cooldown:g}s")
+
+
+class MotorRegras:
+    """Avalia regras indexadas por (dispositivo, tipo_leitura).
+
+    Regras com dispositivo exato ficam num indice direto; regras com curinga
+    ('*' ou prefixo 'radar*') ficam indexadas por tipo_leitura. A lista de
+    regras relevantes para cada (dispositivo, tipo) e resolvida uma vez e
+    guardada em cache, entao cada leitura so toca as regras que lhe dizem respeito.
+    """
+
+    def __init__(self):
+        self.regras = []
+        self.exatas = {}
+        self.curingas = {}
+        self.cache = {}
+        self.estado = {}  # (indice_regra, d_id) -> [ativa, ultimo_disparo]
+        self.lock = threading.Lock()
+
+    def carregar(self, caminho):
+        """Carrega regras de um arquivo JSON ({"regras": [...]}) e retorna a quantidade"""
+        with open(caminho, encoding='utf-8') as f:
+            conteudo = json.load(f)
+        definicoes = conteudo.get('regras', []) if isinstance(conteudo, dict) else conteudo
+        regras = [Regra(d) for d in definicoes]
+
+        exatas, curingas = {}, {}
+        for indice, regra in enumerate(regras):
+            if regra.dispositivo == '*' or regra.dispositivo.endswith('*'):
+                curingas.setdefault(regra.tipo_leitura, []).append(indice)
+            else:
+                exatas.setdefault((regra.dispositivo, regra.tipo_leitura), []).append(indice)
+
+        with self.lock:
+            self.regras = regras
+            self.exatas = exatas
+            self.curingas = curingas
+            self.cache = {}
+            self.estado = {}
+        return len(regras)
+
+    def _relevantes(self, d_id, tipo_leitura):
+        chave = (d_id, tipo_leitura)
+        indices = self.cache.get(chave)
+        if indices is None:
+            indices = list(self.exatas.get(chave, []))
+            indices += [i for i in self.curingas.get(tipo_leitura, [])
+                        if self.regras[i].casa_dispositivo(d_id)]
+            self.cache[chave] = indices
+        return indices
+
+    def tem_regras(self, d_id, tipo_leitura):
+        with self.lock:
+            return bool(self._relevantes(d_id, tipo_leitura))
+
+    def avaliar(self, d_id, tipo_leitura, valor, agora=None):
+        """Retorna as regras que dispararam com esta leitura"""
+        if not self.regras:
+            return []
+        if agora is None:
+            agora = time.monotonic()
+        disparos = []
+        with self.lock:
+            for indice in self._relevantes(d_id, tipo_leitura):
+                regra = self.regras[indice]
+                estado = self.estado.setdefault((indice, d_id), [False, None])
+                if estado[0]:
+                    if regra.normalizou(valor):
+                        estado[0] = False
+                elif regra.disparou(valor):
+                    if estado[1] is None or agora - estado[1] >= regra.cooldown:
+                        estado[0] = True
+                        estado[1] = agora
+                        disparos.append(regra)
+        return disparos
+
+    def remover(self, d_id):
+        with self.lock:
+            for chave in [k for k in self.estado if k[1] == d_id]:
+                del self.estado[chave]
+            for chave in [k for k in self.cache if k[0] == d_id]:
+                del self.cache[chave]
+
+    def exportar(self):
+        """Estado de disparo (ativa, ultimo disparo em time.monotonic) por regra e dispositivo"""
+        with self.lock:
+            return [[indice, d_id, ativa, ultimo] for (indice, d_id), (ativa, ultimo) in self.estado.items()]
+
+    def importar(self, estado):
+        # Indices valem para o mesmo arquivo de regras; os que nao existem mais sao ignorados
+        with self.lock:
+            for indice, d_id, ativa, ultimo in estado:
+                if indice < len(self.regras):
+                    self.estado[(indice, d_id)] = [ativa, ultimo]
+
+    def listar(self):
+        with self.lock:
+            return [str(r) for r in self.regras]
@@ -0,0 +1,270 @@
+import base64
+import socket
+import struct
+import sys
+import threading
+import time
+import iot_pb2 as proto
+
+# Datagrama: magica, indice do topico, sequencia do topico + Evento no formato
+# PROTO (prefixo de tamanho + Mensagem). Sem payload = heartbeat com a ultima
+# sequencia publicada, para o receptor perceber perdas no fim do fluxo.
+CABECALHO = struct.Struct('>4sHQ')
+MAGICA = b'IOTR'
+MAX_FAIXA = 1000  # Sequencias por pedido de recuperacao
+MAX_CONEXOES_RECUPERACAO = 64
+
+
+class Republicador:
+    """Republica as leituras normalizadas em multicast, um topico por porta.
+
+    Topicos sao prefixos de tipo_leitura (VELOCIDADE cobre VELOCIDADE_MEDIA
+    etc.); o que nao casa vai para OUTROS, a ultima porta. O topico i sai em
+    (grupo, porta_base + i). Cada leitura custa um sendto, qualquer que seja o
+    numero de ouvintes, e reaproveita a serializacao PROTO do Evento.
+
+    Cada topico numera seus datagramas e guarda os ultimos `historico` num
+    anel: um receptor que perdeu algo pede a faixa (INDICE:DE:ATE) numa
+    porta TCP propria de recuperacao e recebe os datagramas em base64. Essa
+    porta nao manda snapshot nem entra no fan-out dos paineis, e uma
+    conexao serve varios pedidos. (REPUB:INDICE:DE:ATE na porta de comandos
+    continua valendo para uso manual.)
+    """
+
+    def __init__(self, grupo, porta_base, topicos, historico=4096, ttl=1):
+        self.grupo = grupo
+        self.porta_base = porta_base
+        self.topicos = list(topicos) + ["OUTROS"]
+        self.historico = historico
+        self.sequencias = [0] * len(self.topicos)
+        self.aneis = [[None] * historico for _ in self.topicos]
+        self.cache_topico = {}
+        self.lock = threading.Lock()
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, struct.pack('b', ttl))
+        self.publicadas = 0
+        self.recuperadas = 0
+        self.porta_recuperacao = None
+        self.conexoes_recuperacao = 0
+
+    def topico(self, tipo_leitura):
+        indice = self.cache_topico.get(tipo_leitura)
+        if indice is None:
+            indice = len(self.topicos) - 1
+            for i, nome in enumerate(self.topicos[:-1]):
+                if tipo_leitura == nome or tipo_leitura.startswith(nome + "_"):
+                    indice = i
+                    break
+            self.cache_topico[tipo_leitura] = indice
+        return indice
+
+    def publicar(self, evento):
+        indice = self.topico(evento.tipo_leitura)
+        payload = evento.serializar("proto")
+        with self.lock:
+            seq = self.sequencias[indice] = self.sequencias[indice] + 1
+            datagrama = CABECALHO.pack(MAGICA, indice, seq) + payload
+            self.aneis[indice][seq % self.historico] = (seq, datagrama)
+        try:
+            self.sock.sendto(datagrama, (self.grupo, self.porta_base + indice))
+            self.publicadas += 1
+        except OSError:
+            pass  # Multicast e melhor esforco; quem perdeu recupera pelo TCP
+
+    def anunciar(self):
+        """Heartbeat de cada topico ja usado (so cabecalho, com a ultima sequencia)"""
+        for indice, seq in enumerate(self.sequencias):
+            if seq:
+                try:
+                    self.sock.sendto(CABECALHO.pack(MAGICA, indice, seq), (self.grupo, self.porta_base + indice))
+                except OSError:
+                    pass
+
+    def recuperar(self, indice, de, ate):
+        """Linhas '[REPUB] indice seq base64' da faixa pedida, '[REPUB] perdido de-ate' do que saiu do anel e 'fim'"""
+        ate = min(ate, de + MAX_FAIXA - 1)
+        linhas = []
+        perdido = None
+        with self.lock:
+            anel = self.aneis[indice]
+            for seq in range(de, ate + 1):
+                item = anel[seq % self.historico]
+                if item is not None and item[0] == seq:
+                    if perdido is not None:
+                        linhas.append(f"[REPUB] perdido {perdido}-{seq - 1}")
+                        perdido = None
+                    linhas.append(f"[REPUB] {indice} {seq} {base64.b64encode(item[1]).decode()}")
+                    self.recuperadas += 1
+                elif perdido is None:
+                    perdido = seq
+        if perdido is not None:
+            linhas.append(f"[REPUB] perdido {perdido}-{ate}")
+        linhas.append(f"[REPUB] fim {indice} {de}-{ate}")
+        return linhas
+
+    def pedido(self, texto):
+        """Linhas de resposta a 'INDICE:DE:ATE' (ou 'REPUB:INDICE:DE:ATE'); None se o pedido for invalido"""
+        partes = texto.strip().split(':')
+        if partes and partes[0].upper() == "REPUB":
+            partes = partes[1:]
+        try:
+            indice, de, ate = (int(p) for p in partes)
+        except ValueError:
+            return None
+        if not 0 <= indice < len(self.topicos) or not 0 < de <= ate:
+            return None
+        return self.recuperar(indice, de, ate)
+
+    def descrever(self):
+        recuperacao = f" recuperacao={self.porta_recuperacao}" if self.porta_recuperacao else ""
+        return [f"[REPUB] topico={nome} indice={i} grupo={self.grupo} porta={self.porta_base + i}"
+                f" seq={self.sequencias[i]} historico={self.historico}{recuperacao}"
+                for i, nome in enumerate(self.topicos)]
+
+    def atender_recuperacao(self, conn):
+        """Conexao da porta de recuperacao: um pedido por linha ate o receptor fechar"""
+        with self.lock:
+            if self.conexoes_recuperacao >= MAX_CONEXOES_RECUPERACAO:
+                conn.close()
+                return
+            self.conexoes_recuperacao += 1
+        try:
+            conn.settimeout(30.0)  # Receptor ocioso libera a vaga
+            for linha in conn.makefile('r', encoding='utf-8', errors='replace'):
+                if not linha.strip():
+                    continue
+                linhas = self.pedido(linha)
+                if linhas is None:
+                    linhas = ["[ERRO] Use: INDICE:DE:ATE"]
+                conn.sendall(("\n".join(linhas) + "\n").encode())
+        except OSError:
+            pass
+        finally:
+            with self.lock:
+                self.conexoes_recuperacao -= 1
+            conn.close()
+
+    def exportar(self):
+        with self.lock:
+            return dict(zip(self.topicos, self.sequencias))
+
+    def importar(self, sequencias):
+        # Sequencias continuam de onde o processo anterior parou: sem isso os
+        # receptores veriam a numeracao voltar e descartariam tudo como repetido
+        with self.lock:
+            for i, nome in enumerate(self.topicos):
+                self.sequencias[i] = max(self.sequencias[i], sequencias.get(nome, 0))
+
+    def executar_heartbeat(self, ativo, intervalo=1.0):
+        while ativo():
+            self.anunciar()
+            time.sleep(intervalo)
+
+
+def decodificar(datagrama):
+    """(indice do topico, sequencia, Mensagem ou None para heartbeat); None se nao for da republicacao"""
+    if len(datagrama) < CABECALHO.size:
+        return None
+    magica, indice, seq = CABECALHO.unpack_from(datagrama)
+    if magica != MAGICA:
+        return None
+    if len(datagrama) == CABECALHO.size:
+        return indice, seq, None
+    msg = proto.Mensagem()
+    msg.ParseFromString(datagrama[CABECALHO.size + 4:])
+    return indice, seq, msg
+
+
+class ReceptorRepublicacao:
+    """Ouvinte de um topico com entrega em ordem e recuperacao de perdas.
+
+        receptor = ReceptorRepublicacao("239.1.1.2", 9600 + indice, ("gateway", 9599))
+        for seq, msg in receptor.mensagens():
+            ...
+
+    Quando a sequencia salta (ou um heartbeat mostra que algo passou), pede a
+    faixa que falta pela porta de recuperacao do gateway e entrega tudo em ordem; o que
+    ja saiu do historico do gateway e contado em `perdidas` e pulado.
+    """
+
+    def __init__(self, grupo, porta, gateway, timeout=5.0):
+        self.gateway = gateway  # (host, porta de recuperacao) do gateway
+        self.timeout = timeout
+        self.conexao = None
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('', porta))
+        mreq = struct.pack("4sl", socket.inet_aton(grupo), socket.INADDR_ANY)
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+        self.esperada = None
+        self.recuperadas = 0
+        self.perdidas = 0
+
+    def pedir_faixa(self, indice, de, ate):
+        """{seq: Mensagem} recuperadas pela porta de recuperacao do gateway (conexao reaproveitada)"""
+        if self.conexao is None:
+            s = socket.create_connection(self.gateway, timeout=self.timeout)
+            self.conexao = (s, s.makefile('r', encoding='utf-8', errors='replace'))
+        s, arquivo = self.conexao
+        recebidas = {}
+        try:
+            s.sendall(f"{indice}:{de}:{ate}\n".encode())
+            for linha in arquivo:
+                partes = linha.split()
+                if len(partes) < 2 or partes[0] != "[REPUB]":
+                    raise OSError(f"resposta inesperada: {linha.strip()}")
+                if partes[1] == "fim":
+                    return recebidas
+                if len(partes) == 4 and partes[1] == str(indice):
+                    item = decodificar(base64.b64decode(partes[3]))
+                    if item is not None and item[2] is not None:
+                        recebidas[item[1]] = item[2]
+            raise OSError("gateway fechou a conexao de recuperacao")
+        except OSError:
+            self.conexao = None  # Proximo pedido abre outra
+            s.close()
+            raise
+
+    def _recuperar(self, indice, de, ate):
+        entregues = []
+        while de <= ate:
+            fim = min(ate, de + MAX_FAIXA - 1)
+            try:
+                recebidas = self.pedir_faixa(indice, de, fim)
+            except OSError:
+                recebidas = {}
+            for seq in range(de, fim + 1):
+                if seq in recebidas:
+                    self.recuperadas += 1
+                    entregues.append((seq, recebidas[seq]))
+                else:
+                    self.perdidas += 1
+            de = fim + 1
+        return entregues
+
+    def mensagens(self):
+        while True:
+            datagrama, _ = self.sock.recvfrom(65535)
+            item = decodificar(datagrama)
+            if item is None:
+                continue
+            indice, seq, msg = item
+            if self.esperada is None:
+                self.esperada = seq if msg is not None else seq + 1
+            ultima = seq if msg is None else seq - 1  # Ultima sequencia que ja deveria ter chegado
+            if ultima >= self.esperada:
+                yield from self._recuperar(indice, self.esperada, ultima)
+                self.esperada = ultima + 1
+            if msg is not None and seq == self.esperada:
+                self.esperada = seq + 1
+                yield seq, msg
+
+
+if __name__ == "__main__":
+    # Uso: python republicacao.py GRUPO PORTA [HOST_GATEWAY] [PORTA_RECUPERACAO]
+    grupo, porta = sys.argv[1], int(sys.argv[2])
+    gateway = (sys.argv[3] if len(sys.argv) > 3 else "localhost", int(sys.argv[4]) if len(sys.argv) > 4 else 9599)
+    receptor = ReceptorRepublicacao(grupo, porta, gateway)
+    for seq, msg in receptor.mensagens():
+        print(f"#{seq} [{msg.id_origem}] {msg.dados.tipo_leitura}: {msg.dados.valor:.1f} {msg.dados.unidade}"
+              f" (recuperadas={receptor.recuperadas} perdidas={receptor.perdidas})")
@@ -0,0 +1,206 @@
+import select
+import socket
+import threading
+import time
+
+# Limite de buffers por chamada de sendmsg (IOV_MAX costuma ser 1024)
+MAX_BUFFERS = 1024
+TEM_SENDMSG = hasattr(socket.socket, 'sendmsg')  # Nao existe no Windows
+NAO_BLOQUEAR = getattr(socket, 'MSG_DONTWAIT', 0)  # Idem; la o socket com timeout ja e nao bloqueante
+ESPERA_BLOQUEADOS = 0.005  # Intervalo entre tentativas para clientes com o buffer do socket cheio
+
+
+def _gravaveis(clientes):
+    """Clientes cujo socket aceita escrita agora (ou deu erro, para a escrita falhar e desconectar)"""
+    por_fd = {}
+    for cliente in clientes:
+        fd = cliente.sock.fileno()
+        if fd >= 0:  # -1: ja foi fechado (cliente desconectado)
+            por_fd[fd] = cliente
+    if not por_fd:
+        return []
+    if hasattr(select, 'poll'):
+        p = select.poll()
+        for fd in por_fd:
+            p.register(fd, select.POLLOUT)
+        return [por_fd[fd] for fd, _ in p.poll(0)]
+    _, gravaveis, _ = select.select([], list(por_fd), [], 0)
+    return [por_fd[fd] for fd in gravaveis]
+
+
+class Cliente:
+    """Conexao de painel com fila de saida propria"""
+
+    def __init__(self, sock, addr, fichas=None):
+        self.sock = sock
+        self.addr = addr
+        self.fichas = fichas  # Limite de taxa de comandos (BaldeFichas)
+        self.pendentes = []
+        self.bytes_pendentes = 0
+        # Ja tirados da fila (e comprimidos) mas ainda nao aceitos pelo socket:
+        # o resto de uma escrita parcial. So a thread de saida mexe nessa lista.
+        self.nao_enviados = []
+        self.bytes_nao_enviados = 0
+        self.lock = threading.Lock()
+        self.compressor = None
+        self.corte = None  # Indice em pendentes a partir do qual comeca a compressao
+        self.formato = "texto"  # Formato dos eventos para esta conexao (FORMATO:...)
+
+    def enfileirar(self, dados, max_pendente):
+        """Adiciona bytes, um Evento ou uma lista de Eventos a fila.
+
+        Eventos sao serializados aqui, sob o lock, no formato atual do cliente:
+        assim nada no formato antigo entra na fila depois de uma troca de
+        formato. Retorna o tamanho enfileirado ou None se o cliente ficou para
+        tras demais.
+        """
+        with self.lock:
+            if isinstance(dados, list):
+                dados = b"".join(evento.serializar(self.formato) for evento in dados)
+            elif not isinstance(dados, (bytes, bytearray)):
+                dados = dados.serializar(self.formato)
+            if self.bytes_pendentes + self.bytes_nao_enviados + len(dados) > max_pendente:
+                return None
+            self.pendentes.append(dados)
+            self.bytes_pendentes += len(dados)
+            return len(dados)
+
+    def trocar_formato(self, formato, aviso):
+        """Enfileira o aviso (Evento) no formato atual; os eventos seguintes saem no novo"""
+        with self.lock:
+            dados = aviso.serializar(self.formato)
+            self.pendentes.append(dados)
+            self.bytes_pendentes += len(dados)
+            self.formato = formato
+
+    def ativar_compressao(self, compressor, aviso):
+        """Enfileira o aviso em texto puro; tudo que vier depois dele sai comprimido"""
+        with self.lock:
+            self.pendentes.append(aviso)
+            self.bytes_pendentes += len(aviso)
+            self.corte = len(self.pendentes)
+            self.compressor = compressor
+
+    def vazio(self):
+        """True so quando nada ficou na fila nem no resto de uma escrita parcial"""
+        with self.lock:
+            return self.bytes_pendentes == 0 and self.bytes_nao_enviados == 0
+
+    def descarregar(self):
+        """Uma escrita vetorizada sem bloquear; retorna o numero de syscalls.
+
+        O que o socket nao aceitou fica em `nao_enviados` para a proxima vez
+        que ele estiver gravavel. Chamar so com o socket gravavel: com timeout,
+        o Python espera o socket antes do sendmsg mesmo com MSG_DONTWAIT.
+        """
+        with self.lock:
+            buffers, self.pendentes = self.pendentes, []
+            # Conta como nao enviado ja aqui: `vazio` nunca ve os bytes em transito
+            self.bytes_nao_enviados += self.bytes_pendentes
+            self.bytes_pendentes = 0
+            corte, self.corte = self.corte, None
+        if self.compressor is not None:
+            corte = corte or 0
+            if corte < len(buffers):
+                antes = sum(len(b) for b in buffers[corte:])
+                buffers = buffers[:corte] + [self.compressor.comprimir(buffers[corte:])]
+                with self.lock:
+                    self.bytes_nao_enviados += len(buffers[-1]) - antes
+        self.nao_enviados.extend(buffers)
+        if not self.nao_enviados:
+            return 0
+        lote = self.nao_enviados[:MAX_BUFFERS]
+        try:
+            if TEM_SENDMSG:
+                enviados = self.sock.sendmsg(lote, (), NAO_BLOQUEAR)
+            else:
+                enviados = self.sock.send(b"".join(lote), NAO_BLOQUEAR)
+        except BlockingIOError:
+            return 1
+        # Descarta o que foi enviado; escrita parcial mantem o resto do buffer
+        with self.lock:
+            self.bytes_nao_enviados -= enviados
+        buffers = self.nao_enviados
+        i = 0
+        while i < len(buffers) and enviados >= len(buffers[i]):
+            enviados -= len(buffers[i])
+            i += 1
+        del buffers[:i]
+        if enviados:
+            buffers[0] = memoryview(buffers[0])[enviados:]
+        return 1
+
+
+class EstagioSaida:
+    """Agrupa as mensagens pendentes de cada cliente e descarrega em lote.
+
+    As escritas so marcam o cliente como pendente; uma thread acorda, espera
+    `atraso` segundos para acumular mais linhas e faz uma escrita vetorizada
+    (sendmsg com varios buffers) por cliente.
+
+    A thread nunca bloqueia num cliente: so escreve nos sockets que o poll
+    diz gravaveis, sem esperar, e o que nao coube fica no buffer do proprio
+    cliente. Um painel lento acumula ali (ate `max_pendente`, depois e
+    desconectado) sem atrasar os outros.
+    """
+
+    def __init__(self, ao_falhar, atraso=0.002, max_pendente=8 * 1024 * 1024, perfil=None):
+        self.ao_falhar = ao_falhar
+        self.perfil = perfil  # Opcional: registra o tempo de cada descarga (estagio 'descarga')
+        self.atraso = atraso
+        self.max_pendente = max_pendente
+        self.sujos = set()
+        self.lock = threading.Lock()
+        self.evento = threading.Event()
+
+        # Metricas
+        self.mensagens = 0
+        self.bytes = 0
+        self.syscalls = 0
+        self.descargas = 0
+
+    def enviar(self, cliente, dados):
+        """Enfileira bytes ou eventos para um cliente; retorna False se ele deve ser desconectado"""
+        n = cliente.enfileirar(dados, self.max_pendente)
+        if n is None:
+            return False
+        with self.lock:
+            self.mensagens += 1
+            self.bytes += n
+        self.marcar(cliente)
+        return True
+
+    def marcar(self, cliente):
+        """Agenda a descarga de um cliente que tem dados pendentes"""
+        with self.lock:
+            self.sujos.add(cliente)
+        self.evento.set()
+
+    def executar(self, ativo):
+        bloqueados = set()  # Clientes com dados que o socket ainda nao aceitou
+        while ativo():
+            novo = self.evento.wait(ESPERA_BLOQUEADOS if bloqueados else 1.0)
+            if not novo and not bloqueados:
+                continue
+            if novo and self.atraso:
+                time.sleep(self.atraso)
+            self.evento.clear()
+            with self.lock:
+                sujos, self.sujos = self.sujos, set()
+            sujos |= bloqueados
+            prontos = _gravaveis(sujos)
+            # Quem nao esta gravavel espera a proxima volta (se o socket fechou, sai da lista)
+            bloqueados = {c for c in sujos if c.sock.fileno() >= 0} - set(prontos)
+            for cliente in prontos:
+                t = time.perf_counter()
+                try:
+                    n = cliente.descarregar()
+                except OSError:
+                    self.ao_falhar(cliente)
+                    continue
+                if cliente.nao_enviados:
+                    bloqueados.add(cliente)
+                if self.perfil is not None:
+                    self.perfil.marcar('descarga', t)
+                self.syscalls += n
+                self.descargas += 1
@@ -0,0 +1,64 @@
+import json
+import os
+import tempfile
+import unittest
+from agenda import Agenda, DURACAO_MAX
+
+# Uso (na pasta gateway): python -m unittest test_agenda
+
+
+class TestAgendaDuracoes(unittest.TestCase):
+
+    def setUp(self):
+        self.agenda = Agenda(executar=lambda *a: None, log=lambda m: None)
+        self.agora = 1_700_000_000.0
+
+    def test_rejeita_infinito(self):
+        for quando in ('+infs', '*infm', '+-infh'):
+            with self.assertRaises(ValueError):
+                self.agenda.agendar(quando, 'radar_x', 'A', 'B', self.agora)
+
+    def test_rejeita_nan(self):
+        for quando in ('*nanm', '+nans'):
+            with self.assertRaises(ValueError):
+                self.agenda.agendar(quando, 'radar_x', 'A', 'B', self.agora)
+
+    def test_rejeita_acima_do_maximo(self):
+        with self.assertRaises(ValueError):
+            self.agenda.agendar('+999999999h', 'radar_x', 'A', 'B', self.agora)
+        with self.assertRaises(ValueError):
+            self.agenda.agendar('+367d', 'radar_x', 'A', 'B', self.agora)
+
+    def test_aceita_ate_o_maximo(self):
+        ag = self.agenda.agendar('+366d', 'radar_x', 'A', 'B', self.agora)
+        self.assertEqual(ag.proximo, self.agora + DURACAO_MAX)
+        ag.linha()  # Formatar nao pode falhar
+        self.agenda.agendar('*10m', 'radar_x', 'A', 'B', self.agora)
+        self.assertEqual(len(self.agenda.agendamentos), 2)
+
+    def test_importar_descarta_invalidos(self):
+        valido = {'id': 3, 'quando': '*10m', 'alvo': 'x', 'acao': 'A', 'param': 'B', 'proximo': self.agora + 600}
+        dados = {'proximo_id': 4, 'agendamentos': [
+            {'id': 1, 'quando': '+infs', 'alvo': 'x', 'acao': 'A', 'param': 'B', 'proximo': float('inf')},
+            {'id': 2, 'quando': '*nanm', 'alvo': 'x', 'acao': 'A', 'param': 'B', 'proximo': float('nan')},
+            {'id': 4, 'quando': '+999999999h', 'alvo': 'x', 'acao': 'A', 'param': 'B', 'proximo': self.agora + 3.6e12},
+            {'id': 5, 'quando': '+30s', 'alvo': 'x', 'acao': 'A', 'param': 'B', 'proximo': float('inf')},
+            valido,
+        ]}
+        self.assertEqual(self.agenda.importar(dados, self.agora), 1)
+        self.assertEqual(list(self.agenda.agendamentos), [3])
+
+    def test_arquivo_com_infinity_nao_volta(self):
+        # json.dump grava float('inf') como Infinity; carregar precisa descartar
+        with tempfile.TemporaryDirectory() as pasta:
+            arquivo = os.path.join(pasta, 'agenda.json')
+            with open(arquivo, 'w', encoding='utf-8') as f:
+                json.dump({'proximo_id': 2, 'agendamentos': [
+                    {'id': 1, 'quando': '+infs', 'alvo': 'x', 'acao': 'A', 'param': 'B', 'proximo': float('inf')}]}, f)
+            agenda = Agenda(executar=lambda *a: None, arquivo=arquivo, log=lambda m: None)
+            self.assertEqual(agenda.carregar(self.agora), 0)
+            self.assertEqual(agenda.listar(), (0, []))
+
+
+if __name__ == "__main__":
+    unittest.main()
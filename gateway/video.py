@@ -0,0 +1,259 @@
+import socket
+import struct
+import threading
+
+# Cabecalho de cada quadro (igual em sensors/video.py): tamanho do payload,
+# numero do quadro, largura, altura, fps e timestamp da camera
+CABECALHO_QUADRO = struct.Struct('>IQHHBd')
+MAX_QUADRO = 8 * 1024 * 1024
+MAX_LINHA = 256
+
+
+def _ler_linha(sock):
+    """Linha de apresentacao (CAMERA id / ASSISTIR id) lida byte a byte: nada do fluxo binario e consumido"""
+    linha = b""
+    while not linha.endswith(b"\n"):
+        c = sock.recv(1)
+        if not c or len(linha) > MAX_LINHA:
+            return None
+        linha += c
+    return linha.decode(errors='replace').strip()
+
+
+def _recv_exato(sock, visao):
+    """Preenche o memoryview inteiro com recv_into; False se a conexao fechou"""
+    while len(visao):
+        n = sock.recv_into(visao)
+        if not n:
+            return False
+        visao = visao[n:]
+    return True
+
+
+class Espectador:
+    """Cliente assistindo uma camera, com espaco para um unico quadro pendente.
+
+    Quadro novo substitui o pendente que ainda nao saiu (conta como
+    descartado): um espectador lento ve menos quadros, nunca quadros velhos,
+    e a memoria por espectador fica limitada a um quadro.
+    """
+
+    def __init__(self, sock, addr, camera):
+        self.sock = sock
+        self.addr = addr
+        self.camera = camera
+        self.pendente = None
+        self.fechado = False
+        self.cond = threading.Condition()
+        self.enviados = 0
+        self.descartados = 0
+
+    def entregar(self, quadro):
+        with self.cond:
+            if self.pendente is not None:
+                self.descartados += 1
+            self.pendente = quadro
+            self.cond.notify()
+
+    def fechar(self):
+        with self.cond:
+            self.fechado = True
+            self.cond.notify()
+        try:
+            self.sock.close()
+        except: pass
+
+    def executar(self, ativo):
+        while ativo():
+            with self.cond:
+                while self.pendente is None and not self.fechado:
+                    self.cond.wait(1.0)
+                    if not ativo():
+                        return
+                if self.fechado:
+                    return
+                quadro, self.pendente = self.pendente, None
+            # Mesmo objeto para todos os espectadores; sendall de memoryview nao copia
+            self.sock.sendall(memoryview(quadro))
+            self.enviados += 1
+
+
+class RetransmissorVideo:
+    """Canal binario de video, separado das portas de controle e telemetria.
+
+    Conexoes comecam com uma linha de texto:
+      CAMERA <id>    a camera publica quadros (cabecalho + payload) em seguida
+      ASSISTIR <id>  o cliente recebe "OK <id>" e depois os quadros da camera,
+                     no mesmo formato, comecando pelo ultimo ja recebido
+
+    Camera sem espectadores recebe "PAUSAR" e para de mandar quadros (so
+    manda um cabecalho com tamanho 0 de tempos em tempos, para mostrar que
+    esta viva); o primeiro espectador faz o gateway mandar "RETOMAR". Camera
+    que fica `tempo_camera` segundos sem mandar nada e desconectada e o id
+    fica livre para ela reconectar.
+
+    Cada quadro e lido com recv_into num bytearray proprio e esse mesmo objeto
+    e repassado a todos os espectadores. Quem nao acompanha perde quadros
+    (ver Espectador), entao video nunca acumula fila nem atrasa o resto do
+    gateway.
+    """
+
+    def __init__(self, host, porta, log, backlog=32, tempo_envio=10.0, buffer_envio=64 * 1024,
+                 tempo_camera=15.0):
+        self.host = host
+        self.porta = porta
+        self.log = log
+        self.backlog = backlog
+        self.tempo_envio = tempo_envio  # Espectador parado por mais que isso e desconectado
+        # SO_SNDBUF dos espectadores: pequeno para o atraso ficar no slot do
+        # Espectador (onde quadros velhos sao trocados) e nao no kernel
+        self.buffer_envio = buffer_envio
+        self.tempo_camera = tempo_camera  # Camera muda por mais que isso (meia conexao) libera o id
+        self.espectadores = {}  # camera -> lista de Espectador
+        self.ultimos = {}       # camera -> ultimo quadro completo
+        self.cameras = {}       # camera -> socket, para PAUSAR/RETOMAR
+        self.lock = threading.Lock()
+        self.quadros_recebidos = 0
+        self.bytes_recebidos = 0
+        self.enviados_encerrados = 0     # Contadores de espectadores que ja sairam
+        self.descartados_encerrados = 0
+        self.server = None
+
+    def executar(self, ativo, server=None):
+        if server is None:
+            server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            server.bind((self.host, self.porta))
+            server.listen(self.backlog)
+        server.settimeout(1.0)
+        self.server = server
+        self.log(f"Canal de video disponivel na porta {self.porta}")
+
+        while ativo():
+            try:
+                sock, addr = server.accept()
+                sock.settimeout(self.tempo_envio)
+                threading.Thread(target=self.atender, args=(sock, addr, ativo), daemon=True).start()
+            except socket.timeout:
+                continue
+            except:
+                break
+
+    def atender(self, sock, addr, ativo):
+        try:
+            linha = _ler_linha(sock)
+            partes = linha.split(None, 1) if linha else []
+            if len(partes) == 2 and partes[0].upper() == "CAMERA":
+                self.receber_camera(sock, partes[1], ativo)
+            elif len(partes) == 2 and partes[0].upper() == "ASSISTIR":
+                self.assistir(sock, addr, partes[1], ativo)
+            else:
+                sock.sendall(b"ERRO Use CAMERA <id> ou ASSISTIR <id>\n")
+        except Exception:
+            pass
+        finally:
+            try:
+                sock.close()
+            except: pass
+
+    def receber_camera(self, sock, camera, ativo):
+        with self.lock:
+            if camera in self.cameras:
+                sock.sendall(b"ERRO Camera ja conectada\n")
+                return
+            self.cameras[camera] = sock
+            if camera not in self.espectadores:
+                self._avisar(sock, b"PAUSAR\n")
+        self.log(f"Camera {camera} transmitindo video")
+        sock.settimeout(self.tempo_camera)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        cabecalho = bytearray(CABECALHO_QUADRO.size)
+        try:
+            while ativo():
+                if not _recv_exato(sock, memoryview(cabecalho)):
+                    break
+                tamanho = CABECALHO_QUADRO.unpack_from(cabecalho)[0]
+                if tamanho == 0:
+                    continue  # Camera pausada avisando que segue conectada
+                if tamanho > MAX_QUADRO:
+                    self.log(f"Camera {camera} enviou quadro de {tamanho} bytes, desconectando")
+                    break
+                quadro = bytearray(CABECALHO_QUADRO.size + tamanho)
+                quadro[:CABECALHO_QUADRO.size] = cabecalho
+                if not _recv_exato(sock, memoryview(quadro)[CABECALHO_QUADRO.size:]):
+                    break
+                self.publicar(camera, quadro)
+        except socket.timeout:
+            self.log(f"Camera {camera} sem dados ha {self.tempo_camera:g}s, desconectando")
+        finally:
+            with self.lock:
+                self.cameras.pop(camera, None)
+                self.ultimos.pop(camera, None)  # Sem camera, nao ha quadro atual para mostrar
+            self.log(f"Camera {camera} parou de transmitir video")
+
+    @staticmethod
+    def _avisar(sock, comando):
+        """PAUSAR/RETOMAR para a camera (chamado sob o lock, na ordem das mudancas de espectadores)"""
+        try:
+            sock.sendall(comando)
+        except OSError:
+            pass  # A thread da camera percebe a conexao quebrada e libera o id
+
+    def publicar(self, camera, quadro):
+        with self.lock:
+            self.ultimos[camera] = quadro
+            self.quadros_recebidos += 1
+            self.bytes_recebidos += len(quadro)
+            espectadores = list(self.espectadores.get(camera, ()))
+        for espectador in espectadores:
+            espectador.entregar(quadro)
+
+    def assistir(self, sock, addr, camera, ativo):
+        sock.sendall(f"OK {camera}\n".encode())
+        if self.buffer_envio:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.buffer_envio)
+        espectador = Espectador(sock, addr, camera)
+        with self.lock:
+            if camera not in self.espectadores and camera in self.cameras:
+                self._avisar(self.cameras[camera], b"RETOMAR\n")
+            self.espectadores.setdefault(camera, []).append(espectador)
+            ultimo = self.ultimos.get(camera)
+        if ultimo is not None:
+            espectador.entregar(ultimo)
+        self.log(f"Espectador {addr} assistindo {camera}")
+        try:
+            espectador.executar(ativo)
+        finally:
+            with self.lock:
+                lista = self.espectadores.get(camera, [])
+                if espectador in lista:
+                    lista.remove(espectador)
+                if not lista and self.espectadores.pop(camera, None) is not None and camera in self.cameras:
+                    self._avisar(self.cameras[camera], b"PAUSAR\n")
+                    self.ultimos.pop(camera, None)  # Ficaria velho durante a pausa
+                self.enviados_encerrados += espectador.enviados
+                self.descartados_encerrados += espectador.descartados
+            espectador.fechar()
+            self.log(f"Espectador {addr} saiu de {camera} (enviados={espectador.enviados} descartados={espectador.descartados})")
+
+    def contadores(self):
+        with self.lock:
+            todos = [e for lista in self.espectadores.values() for e in lista]
+            return {
+                'video_cameras': len(self.cameras),
+                'video_espectadores': len(todos),
+                'video_quadros_recebidos': self.quadros_recebidos,
+                'video_bytes_recebidos': self.bytes_recebidos,
+                'video_quadros_enviados': self.enviados_encerrados + sum(e.enviados for e in todos),
+                'video_quadros_descartados': self.descartados_encerrados + sum(e.descartados for e in todos),
+            }
+
+    def fechar(self):
+        if self.server is not None:
+            try:
+                self.server.close()
+            except: pass
+        with self.lock:
+            todos = [e for lista in self.espectadores.values() for e in lista]
+        for espectador in todos:
+            espectador.fechar()
@@ -0,0 +1,151 @@
+import base64
+import hashlib
+import struct
+
+GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"  # RFC 6455, secao 1.3
+MAX_CABECALHO = 8192
+MAX_MENSAGEM = 64 * 1024
+
+OP_CONTINUACAO = 0x0
+OP_TEXTO = 0x1
+OP_BINARIO = 0x2
+OP_FECHAR = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+
+class ErroWebSocket(Exception):
+    def __init__(self, mensagem, codigo=1002):
+        super().__init__(mensagem)
+        self.codigo = codigo  # Codigo de status do quadro de fechamento
+
+
+def responder_handshake(sock):
+    """Le o pedido HTTP de upgrade e responde 101; retorna o caminho pedido ou None"""
+    dados = b""
+    while b"\r\n\r\n" not in dados:
+        parte = sock.recv(1024)
+        if not parte or len(dados) + len(parte) > MAX_CABECALHO:
+            return None
+        dados += parte
+    linhas = dados.split(b"\r\n\r\n", 1)[0].decode('latin-1').split("\r\n")
+    pedido = linhas[0].split()
+    cabecalhos = {}
+    for linha in linhas[1:]:
+        if ':' in linha:
+            nome, valor = linha.split(':', 1)
+            cabecalhos[nome.strip().lower()] = valor.strip()
+
+    chave = cabecalhos.get('sec-websocket-key')
+    if (len(pedido) < 2 or pedido[0] != "GET" or not chave
+            or cabecalhos.get('upgrade', '').lower() != "websocket"
+            or cabecalhos.get('sec-websocket-version') != "13"):
+        sock.sendall(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+        return None
+
+    aceite = base64.b64encode(hashlib.sha1((chave + GUID).encode()).digest()).decode()
+    sock.sendall(("HTTP/1.1 101 Switching Protocols\r\n"
+                  "Upgrade: websocket\r\n"
+                  "Connection: Upgrade\r\n"
+                  f"Sec-WebSocket-Accept: {aceite}\r\n\r\n").encode())
+    return pedido[1]
+
+
+def quadro(payload, opcode=OP_TEXTO):
+    """Quadro servidor -> cliente (FIN=1, sem mascara)"""
+    n = len(payload)
+    if n < 126:
+        cabecalho = struct.pack('!BB', 0x80 | opcode, n)
+    elif n < 65536:
+        cabecalho = struct.pack('!BBH', 0x80 | opcode, 126, n)
+    else:
+        cabecalho = struct.pack('!BBQ', 0x80 | opcode, 127, n)
+    return cabecalho + payload
+
+
+def quadro_fechar(codigo=1000):
+    return quadro(struct.pack('!H', codigo), OP_FECHAR)
+
+
+class LeitorQuadros:
+    """Decodifica quadros cliente -> servidor de um fluxo de bytes.
+
+    `alimentar` recebe o que chegou do socket e devolve a lista de
+    (opcode, payload) completos. Mensagens fragmentadas sao remontadas e
+    entregues com o opcode do primeiro fragmento; quadros de controle podem
+    chegar no meio delas, como permite a RFC.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.fragmentos = None  # (opcode, bytearray) de uma mensagem em andamento
+
+    def alimentar(self, dados):
+        self.buffer.extend(dados)
+        saida = []
+        while True:
+            quadro_lido = self._proximo()
+            if quadro_lido is None:
+                return saida
+            fin, opcode, payload = quadro_lido
+            if opcode >= OP_FECHAR:
+                if not fin or len(payload) > 125:
+                    raise ErroWebSocket("Quadro de controle invalido")
+                saida.append((opcode, payload))
+            elif opcode == OP_CONTINUACAO:
+                if self.fragmentos is None:
+                    raise ErroWebSocket("Continuacao sem mensagem inicial")
+                self.fragmentos[1].extend(payload)
+                self._checar_tamanho(len(self.fragmentos[1]))
+                if fin:
+                    saida.append((self.fragmentos[0], bytes(self.fragmentos[1])))
+                    self.fragmentos = None
+            else:
+                if self.fragmentos is not None:
+                    raise ErroWebSocket("Nova mensagem no meio de uma fragmentada")
+                if fin:
+                    saida.append((opcode, payload))
+                else:
+                    self.fragmentos = (opcode, bytearray(payload))
+
+    def _proximo(self):
+        b = self.buffer
+        if len(b) < 2:
+            return None
+        fin = b[0] & 0x80
+        opcode = b[0] & 0x0F
+        if not b[1] & 0x80:
+            raise ErroWebSocket("Quadro do cliente sem mascara")
+        n = b[1] & 0x7F
+        pos = 2
+        if n == 126:
+            if len(b) < 4:
+                return None
+            n = struct.unpack_from('!H', b, 2)[0]
+            pos = 4
+        elif n == 127:
+            if len(b) < 10:
+                return None
+            n = struct.unpack_from('!Q', b, 2)[0]
+            pos = 10
+        self._checar_tamanho(n)
+        if len(b) < pos + 4 + n:
+            return None
+        mascara = bytes(b[pos:pos + 4])
+        payload = self._desmascarar(bytes(b[pos + 4:pos + 4 + n]), mascara)
+        del b[:pos + 4 + n]
+        return fin, opcode, payload
+
+    @staticmethod
+    def _checar_tamanho(n):
+        if n > MAX_MENSAGEM:
+            raise ErroWebSocket("Mensagem grande demais", 1009)
+
+    @staticmethod
+    def _desmascarar(payload, mascara):
+        # XOR com a mascara repetida, feito como um unico inteiro grande
+        n = len(payload)
+        if not n:
+            return payload
+        chave = (mascara * (n // 4 + 1))[:n]
+        return (int.from_bytes(payload, 'big') ^ int.from_bytes(chave, 'big')).to_bytes(n, 'big')
@@ -0,0 +1,68 @@
+class AgregadorJanela:
+    """Resumo de leituras de alta frequencia acumulado na borda.
+
+    Em vez de enviar cada evento (cada carro do radar), o sensor acumula a
+    janela e envia um lote de Dados com:
+      <TIPO>_CONTAGEM, <TIPO>_MEDIA, <TIPO>_MIN, <TIPO>_MAX
+      <TIPO>_HIST_ATE_50, <TIPO>_HIST_50_60, ..., <TIPO>_HIST_100_MAIS
+    Os baldes do histograma saem de `limites` (ordenados). Janela vazia
+    envia so a contagem zero.
+    """
+
+    def __init__(self, tipo_leitura, unidade, limites):
+        self.tipo_leitura = tipo_leitura
+        self.unidade = unidade
+        self.limites = sorted(limites)
+        self.nomes_baldes = self._nomes_baldes()
+        self.zerar()
+
+    def _nomes_baldes(self):
+        nomes = []
+        anterior = None
+        for limite in self.limites:
+            nomes.append(f"ATE_{limite:g}" if anterior is None else f"{anterior:g}_{limite:g}")
+            anterior = limite
+        nomes.append(f"{anterior:g}_MAIS" if anterior is not None else "TODOS")
+        return [f"{self.tipo_leitura}_HIST_{n}" for n in nomes]
+
+    def zerar(self):
+        self.contagem = 0
+        self.soma = 0.0
+        self.minimo = None
+        self.maximo = None
+        self.baldes = [0] * len(self.nomes_baldes)
+
+    def adicionar(self, valor):
+        self.contagem += 1
+        self.soma += valor
+        if self.minimo is None or valor < self.minimo:
+            self.minimo = valor
+        if self.maximo is None or valor > self.maximo:
+            self.maximo = valor
+        i = 0
+        while i < len(self.limites) and valor >= self.limites[i]:
+            i += 1
+        self.baldes[i] += 1
+
+    def preencher(self, msg, sequencia, timestamp):
+        """Coloca o resumo em msg.lote (e sequencia/timestamp em msg.dados), zera a janela e retorna a contagem"""
+        msg.dados.sequencia = sequencia
+        msg.dados.timestamp = timestamp
+        itens = [(f"{self.tipo_leitura}_CONTAGEM", self.contagem, "n")]
+        if self.contagem:
+            itens += [
+                (f"{self.tipo_leitura}_MEDIA", self.soma / self.contagem, self.unidade),
+                (f"{self.tipo_leitura}_MIN", self.minimo, self.unidade),
+                (f"{self.tipo_leitura}_MAX", self.maximo, self.unidade),
+            ]
+            itens += [(nome, n, "n") for nome, n in zip(self.nomes_baldes, self.baldes)]
+        for tipo_leitura, valor, unidade in itens:
+            dados = msg.lote.add()
+            dados.tipo_leitura = tipo_leitura
+            dados.valor = valor
+            dados.unidade = unidade
+            dados.sequencia = sequencia
+            dados.timestamp = timestamp
+        contagem = self.contagem
+        self.zerar()
+        return contagem
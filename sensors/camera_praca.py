@@ -1,11 +1,11 @@
 import socket
 import struct
-import threading
-import time
 import signal
-import sys
+import threading
 import iot_pb2 as proto
 import config
+from reator import Reator, ServidorComandos, EscutaDiscovery
+from video import TransmissorVideo, RESOLUCOES
 
 MEU_ID = "camera_praca_central_02"
 MINHA_PORTA_TCP = config.CAMERA_PRACA_PORT
@@ -13,6 +13,7 @@ MCAST_GRP = config.MCAST_GRP
 MCAST_PORT = config.MCAST_PORT
 
 running = True
+reator = Reator()
 
 def enviar_desregistro():
     try:
@@ -34,15 +35,16 @@ def signal_handler(sig, frame):
     global running
     print("\n[CAM-PRACA] Encerrando...")
     running = False
-    enviar_desregistro()
-    sys.exit(0)
+    reator.parar()  # Acorda o laco; o DESREGISTRO sai no finally de start()
 
 signal.signal(signal.SIGINT, signal_handler)
 
 class CameraPraca:
     def __init__(self):
         self.ligada = True
-        self.resolucao = "FullHD" 
+        self.resolucao = "FullHD"
+        self.video = TransmissorVideo(MEU_ID, config.GATEWAY_VIDEO_HOST, config.GATEWAY_VIDEO_PORT,
+                                      self.resolucao, config.VIDEO_BITS_POR_PIXEL, "[CAM-PRACA]")
 
     def anunciar_presenca(self):
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
@@ -58,85 +60,41 @@ class CameraPraca:
         sock.sendto(msg.SerializeToString(), (MCAST_GRP, MCAST_PORT))
         sock.close()
 
-    def ouvir_discovery(self):
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        sock.bind(('', MCAST_PORT))
-        sock.settimeout(1.0)
-        
-        mreq = struct.pack("4sl", socket.inet_aton(MCAST_GRP), socket.INADDR_ANY)
-        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
-        
-        while running:
-            try:
-                data, addr = sock.recvfrom(1024)
-                try:
-                    msg = proto.Mensagem()
-                    msg.ParseFromString(data)
-                    if msg.tipo_mensagem == "DISCOVERY":
-                        print(f"[CAM-PRACA] Recebido pedido de descoberta do Gateway")
-                        time.sleep(0.5)
-                        self.anunciar_presenca()
-                except:
-                    pass
-            except socket.timeout:
-                continue
-            except:
-                break
-
-    def ouvir_comandos(self):
-        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        server.bind(('0.0.0.0', MINHA_PORTA_TCP))
-        server.listen(5)
-        server.settimeout(1.0)
-        print(f"[CAM-PRACA] Aguardando comandos na porta {MINHA_PORTA_TCP}")
-        
-        while running:
-            try:
-                client, _ = server.accept()
-                try:
-                    data = client.recv(1024)
-                    msg = proto.Mensagem()
-                    msg.ParseFromString(data)
-                    
-                    if msg.tipo_mensagem == "COMANDO":
-                        acao = msg.comando.acao
-                        param = msg.comando.param
-
-                        if acao == "LIGAR":
-                            self.ligada = True
-                            print(f"[ACAO] Camera ligada.")
-                        elif acao == "DESLIGAR":
-                            self.ligada = False
-                            print(f"[ACAO] Camera desligada.")
-                        elif acao == "SET_RESOLUCAO":
-                            if self.ligada:
-                                 self.resolucao = param
-                                 print(f"[CONFIG] Resolucao alterada para: {self.resolucao}")
-                            else:
-                                 print(f"[ERRO] Camera desligada.")
+    def responder_discovery(self):
+        print(f"[CAM-PRACA] Recebido pedido de descoberta do Gateway")
+        self.anunciar_presenca()
 
-                except: pass
-                client.close()
-            except socket.timeout:
-                continue
-            except:
-                break
+    def executar_comando(self, acao, param):
+        if acao == "LIGAR":
+            self.ligada = True
+            self.video.ligado = True
+            print(f"[ACAO] Camera ligada.")
+        elif acao == "DESLIGAR":
+            self.ligada = False
+            self.video.ligado = False
+            print(f"[ACAO] Camera desligada.")
+        elif acao == "SET_RESOLUCAO":
+            if self.ligada:
+                 if self.video.configurar(param):
+                     self.resolucao = param
+                     largura, altura, fps, tamanho = self.video.modo
+                     print(f"[CONFIG] Resolucao alterada para: {self.resolucao} ({largura}x{altura} @ {fps} fps, ~{tamanho * fps // 1024} KB/s)")
+                 else:
+                     print(f"[ERRO] Resolucao invalida: {param} (opcoes: {', '.join(RESOLUCOES)})")
+            else:
+                 print(f"[ERRO] Camera desligada.")
 
     def start(self):
-        t1 = threading.Thread(target=self.ouvir_comandos, daemon=True)
-        t1.start()
+        ServidorComandos(reator, MINHA_PORTA_TCP, self.executar_comando)
+        print(f"[CAM-PRACA] Aguardando comandos na porta {MINHA_PORTA_TCP}")
         
-        t2 = threading.Thread(target=self.ouvir_discovery, daemon=True)
-        t2.start()
+        EscutaDiscovery(reator, MCAST_GRP, MCAST_PORT, 0.5, self.responder_discovery)
         
-        time.sleep(1) 
-        self.anunciar_presenca()
+        reator.chamar_depois(1, self.anunciar_presenca)
+        threading.Thread(target=self.video.executar, args=(lambda: running,), daemon=True).start()
         
         try:
-            while running:
-                time.sleep(0.5)
+            reator.executar()
         except KeyboardInterrupt:
             pass
         finally:
@@ -14,4 +14,36 @@ CAMERA_PRACA_PORT = int(os.getenv('CAMERA_PRACA_PORT', '8005'))
 SENSOR_TEMPERATURA_PORT = int(os.getenv('SENSOR_TEMPERATURA_PORT', '8006'))
 SENSOR_AR_PORT = int(os.getenv('SENSOR_AR_PORT', '8007'))
 
+# Semaforos extras no mesmo processo (semaforo_01, semaforo_02... na porta SEMAFORO_PORTA_EXTRA + i)
+SEMAFORO_QTD = int(os.getenv('SEMAFORO_QTD', '1'))
+SEMAFORO_PORTA_EXTRA = int(os.getenv('SEMAFORO_PORTA_EXTRA', '8100'))
 
+# Canal de video das cameras (retransmissor no gateway)
+GATEWAY_VIDEO_HOST = os.getenv('GATEWAY_VIDEO_HOST', 'localhost')
+GATEWAY_VIDEO_PORT = int(os.getenv('GATEWAY_VIDEO_PORT', '9002'))
+VIDEO_BITS_POR_PIXEL = float(os.getenv('VIDEO_BITS_POR_PIXEL', '0.15'))
+
+
+
+# Politica de envio por excecao (banda morta + intervalos em segundos)
+# *_INTERVALO_MAX funciona como heartbeat: reenvia o valor atual mesmo sem mudanca
+TEMP_BANDA_ABS = float(os.getenv('TEMP_BANDA_ABS', '0.5'))
+TEMP_BANDA_PCT = float(os.getenv('TEMP_BANDA_PCT', '0'))
+TEMP_INTERVALO_MIN = float(os.getenv('TEMP_INTERVALO_MIN', '0'))
+TEMP_INTERVALO_MAX = float(os.getenv('TEMP_INTERVALO_MAX', '300'))
+
+AR_BANDA_ABS = float(os.getenv('AR_BANDA_ABS', '0'))
+AR_BANDA_PCT = float(os.getenv('AR_BANDA_PCT', '5'))
+AR_INTERVALO_MIN = float(os.getenv('AR_INTERVALO_MIN', '0'))
+AR_INTERVALO_MAX = float(os.getenv('AR_INTERVALO_MAX', '300'))
+
+RADAR_BANDA_ABS = float(os.getenv('RADAR_BANDA_ABS', '0'))
+RADAR_BANDA_PCT = float(os.getenv('RADAR_BANDA_PCT', '0'))
+RADAR_INTERVALO_MIN = float(os.getenv('RADAR_INTERVALO_MIN', '0'))
+RADAR_INTERVALO_MAX = float(os.getenv('RADAR_INTERVALO_MAX', '0'))
+
+# Agregacao na borda do radar: BRUTO (cada carro) ou RESUMO (lote por janela)
+# Troca em execucao com o comando MODO_ENVIO:BRUTO|RESUMO
+RADAR_MODO_ENVIO = os.getenv('RADAR_MODO_ENVIO', 'BRUTO').upper()
+RADAR_JANELA_RESUMO = float(os.getenv('RADAR_JANELA_RESUMO', '60'))
+RADAR_HIST_LIMITES = [float(v) for v in os.getenv('RADAR_HIST_LIMITES', '50,60,70,80,90,100').split(',') if v]
@@ -0,0 +1,58 @@
+import heapq
+import itertools
+import threading
+import time
+
+
+class Tarefa:
+    def __init__(self, prazo, callback):
+        self.prazo = prazo
+        self.callback = callback
+        self.cancelada = False
+
+    def cancelar(self):
+        self.cancelada = True
+
+
+class Escalonador:
+    """Escalonador por prazos absolutos (relogio monotonico) em uma unica thread.
+
+    As tarefas ficam num heap ordenado por prazo; a thread dorme ate o proximo
+    prazo e acorda antes se uma tarefa mais cedo for agendada. Cancelar apenas
+    marca a tarefa, que e descartada quando chega ao topo do heap.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.contador = itertools.count()
+        self.cond = threading.Condition()
+        self.atraso_max = 0.0  # Maior atraso observado entre prazo e execucao (s)
+
+    def agendar(self, prazo, callback):
+        tarefa = Tarefa(prazo, callback)
+        with self.cond:
+            heapq.heappush(self.heap, (prazo, next(self.contador), tarefa))
+            if self.heap[0][2] is tarefa:
+                self.cond.notify()
+        return tarefa
+
+    def executar(self, ativo):
+        while ativo():
+            with self.cond:
+                while self.heap and self.heap[0][2].cancelada:
+                    heapq.heappop(self.heap)
+                if not self.heap:
+                    self.cond.wait(1.0)
+                    continue
+                espera = self.heap[0][0] - time.monotonic()
+                if espera > 0:
+                    self.cond.wait(min(espera, 1.0))
+                    continue
+                _, _, tarefa = heapq.heappop(self.heap)
+            if tarefa.cancelada:
+                continue
+            self.atraso_max = max(self.atraso_max, time.monotonic() - tarefa.prazo)
+            try:
+                tarefa.callback()
+            except Exception as e:
+                print(f"[ESCALONADOR] Erro em tarefa: {e}")
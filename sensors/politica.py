@@ -0,0 +1,48 @@
+import time
+
+
+class PoliticaEnvio:
+    """Politica de envio por excecao (report-by-exception) para sensores.
+
+    Uma leitura so e enviada quando sai da banda morta em relacao ao ultimo
+    valor enviado, respeitando o intervalo minimo entre envios. Se nada mudar,
+    o valor atual e reenviado ao atingir o intervalo maximo (heartbeat).
+    """
+
+    def __init__(self, banda_abs=0.0, banda_pct=0.0, intervalo_min=0.0, intervalo_max=0.0):
+        self.banda_abs = banda_abs          # Variacao absoluta minima
+        self.banda_pct = banda_pct          # Variacao percentual minima (sobre o ultimo enviado)
+        self.intervalo_min = intervalo_min  # Segundos minimos entre envios (0 = sem limite)
+        self.intervalo_max = intervalo_max  # Heartbeat: segundos maximos sem envio (0 = desligado)
+
+        self.ultimo_valor = None
+        self.ultimo_envio = 0.0
+        self.enviadas = 0
+        self.suprimidas = 0
+
+    def avaliar(self, valor, agora=None):
+        """Retorna o motivo do envio ('PRIMEIRA', 'MUDANCA', 'HEARTBEAT') ou None para suprimir"""
+        if agora is None:
+            agora = time.monotonic()
+
+        if self.ultimo_valor is None:
+            return "PRIMEIRA"
+
+        decorrido = agora - self.ultimo_envio
+        if self.intervalo_max > 0 and decorrido >= self.intervalo_max:
+            return "HEARTBEAT"
+        if decorrido < self.intervalo_min:
+            return None
+
+        limite = max(self.banda_abs, abs(self.ultimo_valor) * self.banda_pct / 100.0)
+        if abs(valor - self.ultimo_valor) > limite:
+            return "MUDANCA"
+        return None
+
+    def registrar_envio(self, valor, agora=None):
+        self.ultimo_valor = valor
+        self.ultimo_envio = time.monotonic() if agora is None else agora
+        self.enviadas += 1
+
+    def registrar_supressao(self):
+        self.suprimidas += 1
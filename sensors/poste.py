@@ -1,11 +1,9 @@
 import socket
 import struct
-import threading
-import time
 import signal
-import sys
 import iot_pb2 as proto
 import config
+from reator import Reator, ServidorComandos, EscutaDiscovery
 
 MEU_ID = "poste_avenida"
 MINHA_PORTA_TCP = config.POSTE_PORT
@@ -13,6 +11,7 @@ MCAST_GRP = config.MCAST_GRP
 MCAST_PORT = config.MCAST_PORT
 
 running = True
+reator = Reator()
 
 def enviar_desregistro():
     """Envia mensagem de DESREGISTRO ao encerrar"""
@@ -35,8 +34,7 @@ def signal_handler(sig, frame):
     global running
     print("\n[POSTE] Encerrando...")
     running = False
-    enviar_desregistro()
-    sys.exit(0)
+    reator.parar()  # Acorda o laco; o DESREGISTRO sai no finally de start()
 
 signal.signal(signal.SIGINT, signal_handler)
 
@@ -58,71 +56,24 @@ class Poste:
         sock.sendto(msg.SerializeToString(), (MCAST_GRP, MCAST_PORT))
         sock.close()
 
-    def ouvir_discovery(self):
-        """Escuta mensagens de DISCOVERY do Gateway e re-anuncia"""
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        sock.bind(('', MCAST_PORT))
-        sock.settimeout(1.0)
-        
-        mreq = struct.pack("4sl", socket.inet_aton(MCAST_GRP), socket.INADDR_ANY)
-        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
-        
-        while running:
-            try:
-                data, addr = sock.recvfrom(1024)
-                try:
-                    msg = proto.Mensagem()
-                    msg.ParseFromString(data)
-                    if msg.tipo_mensagem == "DISCOVERY":
-                        print(f"[POSTE] Recebido pedido de descoberta do Gateway")
-                        time.sleep(0.2)
-                        self.anunciar_presenca()
-                except:
-                    pass
-            except socket.timeout:
-                continue
-            except:
-                break
-
-    def ouvir_comandos(self):
-        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        server.bind(('0.0.0.0', MINHA_PORTA_TCP))
-        server.listen(5)
-        server.settimeout(1.0)
-        print(f"[POSTE] Aguardando comandos na porta {MINHA_PORTA_TCP}")
+    def responder_discovery(self):
+        print(f"[POSTE] Recebido pedido de descoberta do Gateway")
+        self.anunciar_presenca()
 
-        while running:
-            try:
-                client, _ = server.accept()
-                try:
-                    data = client.recv(1024)
-                    msg = proto.Mensagem()
-                    msg.ParseFromString(data)
-                    if msg.tipo_mensagem == "COMANDO":
-                        self.intensidade = int(msg.comando.param.replace('%',''))
-                        print(f"[ACAO] Intensidade ajustada para: {self.intensidade}%")
-                except: pass
-                client.close()
-            except socket.timeout:
-                continue
-            except:
-                break
+    def executar_comando(self, acao, param):
+        self.intensidade = int(param.replace('%',''))
+        print(f"[ACAO] Intensidade ajustada para: {self.intensidade}%")
 
     def start(self):
-        t1 = threading.Thread(target=self.ouvir_comandos, daemon=True)
-        t1.start()
+        ServidorComandos(reator, MINHA_PORTA_TCP, self.executar_comando)
+        print(f"[POSTE] Aguardando comandos na porta {MINHA_PORTA_TCP}")
         
-        t2 = threading.Thread(target=self.ouvir_discovery, daemon=True)
-        t2.start()
+        EscutaDiscovery(reator, MCAST_GRP, MCAST_PORT, 0.2, self.responder_discovery)
         
-        time.sleep(1)
-        self.anunciar_presenca()
+        reator.chamar_depois(1, self.anunciar_presenca)
         
         try:
-            while running:
-                time.sleep(0.5)
+            reator.executar()
         except KeyboardInterrupt:
             pass
         finally:
@@ -1,12 +1,13 @@
 import socket
 import struct
-import threading
 import time
 import random
 import signal
-import sys
 import iot_pb2 as proto
 import config
+from reator import Reator, ServidorComandos, EscutaDiscovery
+from politica import PoliticaEnvio
+from agregacao import AgregadorJanela
 
 MEU_ID = "radar_velocidade_01"
 MINHA_PORTA_TCP = config.RADAR_PORT
@@ -15,6 +16,7 @@ MCAST_GRP = config.MCAST_GRP
 MCAST_PORT = config.MCAST_PORT
 
 running = True
+reator = Reator()
 
 def enviar_desregistro():
     """Envia mensagem de DESREGISTRO ao encerrar"""
@@ -37,8 +39,7 @@ def signal_handler(sig, frame):
     global running
     print("\n[RADAR] Encerrando...")
     running = False
-    enviar_desregistro()
-    sys.exit(0)
+    reator.parar()  # Acorda o laco; o DESREGISTRO sai no finally de start()
 
 signal.signal(signal.SIGINT, signal_handler)
 
@@ -46,6 +47,16 @@ class Radar:
     def __init__(self):
         self.resolucao = "720p"
         self.ligado = True  # Estado ligado/desligado
+        self.sequencia = 0  # Numera as leituras enviadas (perdas/duplicatas no gateway)
+        self.politica = PoliticaEnvio(
+            banda_abs=config.RADAR_BANDA_ABS,
+            banda_pct=config.RADAR_BANDA_PCT,
+            intervalo_min=config.RADAR_INTERVALO_MIN,
+            intervalo_max=config.RADAR_INTERVALO_MAX,
+        )
+        # RESUMO: acumula os carros e envia um lote por janela em vez de cada deteccao
+        self.modo_envio = config.RADAR_MODO_ENVIO if config.RADAR_MODO_ENVIO in ("BRUTO", "RESUMO") else "BRUTO"
+        self.agregador = AgregadorJanela("VELOCIDADE", "km/h", config.RADAR_HIST_LIMITES)
 
     def anunciar_presenca(self):
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
@@ -61,108 +72,89 @@ class Radar:
         sock.sendto(msg.SerializeToString(), (MCAST_GRP, MCAST_PORT))
         sock.close()
 
-    def ouvir_discovery(self):
-        """Escuta mensagens de DISCOVERY do Gateway e re-anuncia"""
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        sock.bind(('', MCAST_PORT))
-        sock.settimeout(1.0)
-        
-        mreq = struct.pack("4sl", socket.inet_aton(MCAST_GRP), socket.INADDR_ANY)
-        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
-        
-        while running:
-            try:
-                data, addr = sock.recvfrom(1024)
-                try:
-                    msg = proto.Mensagem()
-                    msg.ParseFromString(data)
-                    if msg.tipo_mensagem == "DISCOVERY":
-                        print(f"[RADAR] Recebido pedido de descoberta do Gateway")
-                        time.sleep(0.3)
-                        self.anunciar_presenca()
-                except:
-                    pass
-            except socket.timeout:
-                continue
-            except:
-                break
+    def responder_discovery(self):
+        print(f"[RADAR] Recebido pedido de descoberta do Gateway")
+        self.anunciar_presenca()
 
-    def ouvir_comandos(self):
-        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        server.bind(('0.0.0.0', MINHA_PORTA_TCP))
-        server.listen(5)
-        server.settimeout(1.0)
-        print(f"[RADAR] Aguardando comandos na porta {MINHA_PORTA_TCP}")
-        
-        while running:
-            try:
-                client, _ = server.accept()
-                try:
-                    data = client.recv(1024)
-                    msg = proto.Mensagem()
-                    msg.ParseFromString(data)
-                    
-                    if msg.tipo_mensagem == "COMANDO":
-                        acao = msg.comando.acao
-                        param = msg.comando.param
-                        
-                        if acao == "SET_RESOLUCAO":
-                            self.resolucao = param
-                            print(f"[CONFIG] Resolucao alterada para: {self.resolucao}")
-                        elif acao == "LIGAR":
-                            self.ligado = True
-                            print(f"[ACAO] Radar LIGADO - Iniciando captura de velocidade")
-                        elif acao == "DESLIGAR":
-                            self.ligado = False
-                            print(f"[ACAO] Radar DESLIGADO - Parando captura")
-                        elif acao == "TOGGLE":
-                            self.ligado = not self.ligado
-                            estado = "LIGADO" if self.ligado else "DESLIGADO"
-                            print(f"[ACAO] Radar {estado}")
-                            
-                except: pass
-                client.close()
-            except socket.timeout:
-                continue
-            except:
-                break
+    def executar_comando(self, acao, param):
+        if acao == "SET_RESOLUCAO":
+            self.resolucao = param
+            print(f"[CONFIG] Resolucao alterada para: {self.resolucao}")
+        elif acao == "LIGAR":
+            self.ligado = True
+            print(f"[ACAO] Radar LIGADO - Iniciando captura de velocidade")
+        elif acao == "DESLIGAR":
+            self.ligado = False
+            print(f"[ACAO] Radar DESLIGADO - Parando captura")
+        elif acao == "MODO_ENVIO":
+            modo = param.upper()
+            if modo not in ("BRUTO", "RESUMO"):
+                print(f"[ERRO] Modo de envio invalido: {param} (use BRUTO ou RESUMO)")
+                return
+            if self.modo_envio == "RESUMO" and modo == "BRUTO":
+                self.enviar_resumo(forcar=True)  # Nao perde a janela parcial
+            self.modo_envio = modo
+            print(f"[CONFIG] Modo de envio: {modo}")
+        elif acao == "TOGGLE":
+            self.ligado = not self.ligado
+            estado = "LIGADO" if self.ligado else "DESLIGADO"
+            print(f"[ACAO] Radar {estado}")
 
     def enviar_velocidade(self):
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        while running:
-            time.sleep(4)
-            if not running:
-                break
+        # Só envia dados se estiver ligado
+        if not self.ligado:
+            return
             
-            # Só envia dados se estiver ligado
-            if not self.ligado:
-                continue
-                
-            velocidade = random.uniform(40.0, 110.0)
-            
-            msg = proto.Mensagem()
-            msg.id_origem = MEU_ID
-            msg.tipo_mensagem = "DADOS"
-            msg.dados.valor = velocidade
-            msg.dados.unidade = "km/h"
-            msg.dados.tipo_leitura = "VELOCIDADE"
-            
-            print(f"[ENVIO] Carro detectado: {velocidade:.1f} km/h")
-            sock.sendto(msg.SerializeToString(), ('localhost', GATEWAY_UDP_PORT))
+        velocidade = random.uniform(40.0, 110.0)
+        if self.modo_envio == "RESUMO":
+            self.agregador.adicionar(velocidade)
+            return
+        
+        motivo = self.politica.avaliar(velocidade)
+        if motivo is None:
+            self.politica.registrar_supressao()
+            return
+        
+        msg = proto.Mensagem()
+        msg.id_origem = MEU_ID
+        msg.tipo_mensagem = "DADOS"
+        msg.dados.valor = velocidade
+        msg.dados.unidade = "km/h"
+        msg.dados.tipo_leitura = "VELOCIDADE"
+        self.sequencia += 1
+        msg.dados.sequencia = self.sequencia
+        msg.dados.timestamp = time.time()
+        
+        print(f"[ENVIO] Carro detectado: {velocidade:.1f} km/h")
+        self.sock_dados.sendto(msg.SerializeToString(), ('localhost', GATEWAY_UDP_PORT))
+        self.politica.registrar_envio(velocidade)
+
+    def enviar_resumo(self, forcar=False):
+        if self.modo_envio != "RESUMO" and not forcar:
+            return
+        msg = proto.Mensagem()
+        msg.id_origem = MEU_ID
+        msg.tipo_mensagem = "DADOS"
+        self.sequencia += 1
+        contagem = self.agregador.preencher(msg, self.sequencia, time.time())
+        
+        print(f"[ENVIO] Resumo da janela: {contagem} carro(s), {len(msg.lote)} valores")
+        self.sock_dados.sendto(msg.SerializeToString(), ('localhost', GATEWAY_UDP_PORT))
 
     def start(self):
-        threading.Thread(target=self.ouvir_comandos, daemon=True).start()
-        threading.Thread(target=self.enviar_velocidade, daemon=True).start()
-        threading.Thread(target=self.ouvir_discovery, daemon=True).start()
+        ServidorComandos(reator, MINHA_PORTA_TCP, self.executar_comando)
+        print(f"[RADAR] Aguardando comandos na porta {MINHA_PORTA_TCP}")
         
-        time.sleep(1)
-        self.anunciar_presenca()
+        EscutaDiscovery(reator, MCAST_GRP, MCAST_PORT, 0.3, self.responder_discovery)
+        
+        self.sock_dados = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        reator.repetir(4, self.enviar_velocidade)
+        reator.repetir(config.RADAR_JANELA_RESUMO, self.enviar_resumo)
+        
+        reator.chamar_depois(1, self.anunciar_presenca)
         
         try:
-            while running:
-                time.sleep(0.5)
+            reator.executar()
         except KeyboardInterrupt:
             pass
         finally:
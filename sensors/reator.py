@@ -0,0 +1,219 @@
+import heapq
+import itertools
+import selectors
+import socket
+import struct
+import threading
+import time
+import iot_pb2 as proto
+
+
+class Temporizador:
+    def __init__(self, prazo, callback):
+        self.prazo = prazo
+        self.callback = callback
+        self.cancelado = False
+
+    def cancelar(self):
+        self.cancelado = True
+
+
+class Reator:
+    """Laco de eventos por prontidao (selectors) para os dispositivos.
+
+    Sockets sao registrados com um callback de leitura e temporizadores ficam
+    num heap por prazo monotonico. O laco so acorda quando ha dados, quando
+    vence um temporizador ou quando alguem escreve no par de sockets de
+    despertar (usado para encerrar e para agendar a partir de outras threads).
+    """
+
+    def __init__(self):
+        self.seletor = selectors.DefaultSelector()
+        # socketpair em vez de os.pipe: select no Windows so aceita sockets
+        self.despertar_leitura, self.despertar_escrita = socket.socketpair()
+        self.despertar_leitura.setblocking(False)
+        self.despertar_escrita.setblocking(False)
+        self.seletor.register(self.despertar_leitura, selectors.EVENT_READ, self._drenar_despertar)
+
+        self.temporizadores = []
+        self.contador = itertools.count()
+        self.lock = threading.Lock()
+        self.ativo = True
+        self.thread_laco = None
+
+    def registrar(self, sock, callback):
+        sock.setblocking(False)
+        self.seletor.register(sock, selectors.EVENT_READ, callback)
+
+    def remover(self, sock):
+        try:
+            self.seletor.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+
+    def chamar_depois(self, atraso, callback):
+        """Agenda callback no laco; pode ser chamado de qualquer thread"""
+        temporizador = Temporizador(time.monotonic() + atraso, callback)
+        with self.lock:
+            heapq.heappush(self.temporizadores, (temporizador.prazo, next(self.contador), temporizador))
+        if threading.get_ident() != self.thread_laco:
+            self.despertar()  # Dentro do laco o prazo e recalculado na proxima volta
+        return temporizador
+
+    def repetir(self, periodo, callback):
+        """Executa callback a cada `periodo` segundos, por prazo absoluto (sem deriva)"""
+        estado = {'prazo': time.monotonic() + periodo}
+
+        def disparar():
+            callback()
+            estado['prazo'] += periodo
+            atraso = max(0.0, estado['prazo'] - time.monotonic())
+            estado['temporizador'] = self.chamar_depois(atraso, disparar)
+
+        estado['temporizador'] = self.chamar_depois(periodo, disparar)
+        return estado
+
+    def despertar(self):
+        try:
+            self.despertar_escrita.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass  # Ja existe um despertar pendente
+
+    def _drenar_despertar(self, sock):
+        try:
+            while sock.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def parar(self):
+        self.ativo = False
+        self.despertar()
+
+    def _proximo_prazo(self):
+        with self.lock:
+            while self.temporizadores and self.temporizadores[0][2].cancelado:
+                heapq.heappop(self.temporizadores)
+            return self.temporizadores[0][0] if self.temporizadores else None
+
+    def _vencidos(self):
+        agora = time.monotonic()
+        vencidos = []
+        with self.lock:
+            while self.temporizadores and self.temporizadores[0][0] <= agora:
+                vencidos.append(heapq.heappop(self.temporizadores)[2])
+        return [t for t in vencidos if not t.cancelado]
+
+    def executar(self):
+        self.thread_laco = threading.get_ident()
+        while self.ativo:
+            prazo = self._proximo_prazo()
+            espera = None if prazo is None else max(0.0, prazo - time.monotonic())
+            for chave, _ in self.seletor.select(espera):
+                try:
+                    chave.data(chave.fileobj)
+                except Exception as e:
+                    print(f"[REATOR] Erro ao tratar evento: {e}")
+            for temporizador in self._vencidos():
+                try:
+                    temporizador.callback()
+                except Exception as e:
+                    print(f"[REATOR] Erro em temporizador: {e}")
+
+
+class ServidorComandos:
+    """Servidor TCP de comandos atendido pelo reator.
+
+    Varias conexoes sao atendidas ao mesmo tempo; cada uma acumula bytes ate o
+    gateway fechar o envio e so entao a Mensagem e decodificada. Conexoes que
+    nao terminam em `tempo_limite` segundos sao descartadas.
+    """
+
+    def __init__(self, reator, porta, ao_comando, tempo_limite=5.0):
+        self.reator = reator
+        self.ao_comando = ao_comando
+        self.tempo_limite = tempo_limite
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(('0.0.0.0', porta))
+        self.server.listen(16)
+        self.conexoes = {}
+        reator.registrar(self.server, self._aceitar)
+
+    def _aceitar(self, server):
+        while True:
+            try:
+                client, _ = server.accept()
+            except (BlockingIOError, OSError):
+                return
+            buffer = bytearray()
+            limite = self.reator.chamar_depois(self.tempo_limite, lambda c=client: self._fechar(c))
+            self.conexoes[client] = (buffer, limite)
+            self.reator.registrar(client, self._ler)
+
+    def _ler(self, client):
+        buffer, _ = self.conexoes.get(client, (None, None))
+        if buffer is None:
+            return
+        try:
+            data = client.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if data:
+            buffer.extend(data)
+            return
+        # Fim do envio: decodifica e executa o comando
+        self._fechar(client)
+        try:
+            msg = proto.Mensagem()
+            msg.ParseFromString(bytes(buffer))
+            if msg.tipo_mensagem == "COMANDO":
+                self.ao_comando(msg.comando.acao, msg.comando.param)
+        except Exception:
+            pass
+
+    def _fechar(self, client):
+        entrada = self.conexoes.pop(client, None)
+        if entrada is None:
+            return
+        entrada[1].cancelar()
+        self.reator.remover(client)
+        client.close()
+
+    def fechar(self):
+        for client in list(self.conexoes):
+            self._fechar(client)
+        self.reator.remover(self.server)
+        self.server.close()
+
+
+class EscutaDiscovery:
+    """Escuta pedidos de DISCOVERY no grupo multicast e responde apos `atraso`"""
+
+    def __init__(self, reator, grupo, porta, atraso, ao_discovery):
+        self.reator = reator
+        self.atraso = atraso
+        self.ao_discovery = ao_discovery
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('', porta))
+        mreq = struct.pack("4sl", socket.inet_aton(grupo), socket.INADDR_ANY)
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+        reator.registrar(self.sock, self._ler)
+
+    def _ler(self, sock):
+        while True:
+            try:
+                data, _ = sock.recvfrom(1024)
+            except (BlockingIOError, OSError):
+                return
+            try:
+                msg = proto.Mensagem()
+                msg.ParseFromString(data)
+                if msg.tipo_mensagem == "DISCOVERY":
+                    # Atraso sem bloquear o laco (espalha as respostas dos dispositivos)
+                    self.reator.chamar_depois(self.atraso, self.ao_discovery)
+            except Exception:
+                pass
@@ -1,11 +1,14 @@
+import itertools
+import math
 import socket
 import struct
 import threading
 import time
 import signal
-import sys
 import iot_pb2 as proto
 import config
+from escalonador import Escalonador
+from reator import Reator, ServidorComandos, EscutaDiscovery
 
 MEU_ID = "semaforo_principal"
 MINHA_PORTA_TCP = config.SEMAFORO_PORT
@@ -18,54 +21,83 @@ TEMPO_VERMELHO = 10
 TEMPO_AMARELO = 3
 TEMPO_VERDE = 10
 
+# Ordem das fases no ciclo automático
+FASES = ["VERMELHO", "VERDE", "AMARELO"]
+
 running = True
+semaforos = []
+reator = Reator()
 
 def enviar_desregistro():
     """Envia mensagem de DESREGISTRO ao encerrar"""
-    try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, struct.pack('b', 1))
-        
-        msg = proto.Mensagem()
-        msg.id_origem = MEU_ID
-        msg.tipo_mensagem = "DESREGISTRO"
-        msg.registro.porta = MINHA_PORTA_TCP
-        msg.registro.tipo_dispositivo = "ATUADOR"
-        
-        sock.sendto(msg.SerializeToString(), (MCAST_GRP, MCAST_PORT))
-        sock.close()
-    except:
-        pass
+    for semaforo in semaforos:
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, struct.pack('b', 1))
+
+            msg = proto.Mensagem()
+            msg.id_origem = semaforo.id
+            msg.tipo_mensagem = "DESREGISTRO"
+            msg.registro.porta = semaforo.porta
+            msg.registro.tipo_dispositivo = "ATUADOR"
+
+            sock.sendto(msg.SerializeToString(), (MCAST_GRP, MCAST_PORT))
+            sock.close()
+        except:
+            pass
 
 def signal_handler(sig, frame):
     global running
     print("\n[SEMAFORO] Encerrando...")
     running = False
-    enviar_desregistro()
-    sys.exit(0)
+    reator.parar()  # Acorda o laco; o DESREGISTRO sai no finally de start()
 
 signal.signal(signal.SIGINT, signal_handler)
 
 class Semaforo:
-    def __init__(self):
+    def __init__(self, escalonador, d_id=MEU_ID, porta=MINHA_PORTA_TCP):
+        self.id = d_id
+        self.porta = porta
+        self.escalonador = escalonador
         self.cor_atual = "VERMELHO"
-        self.server = None
+        # Numera os estados enviados (perdas/duplicatas no gateway); next() e
+        # atomico, e enviar_estado roda tanto no escalonador quanto no reator
+        self.sequencia = itertools.count(1)
         self.tempo_vermelho = TEMPO_VERMELHO
         self.tempo_amarelo = TEMPO_AMARELO
         self.tempo_verde = TEMPO_VERDE
         self.modo_auto = True  # Modo automático ligado por padrão
 
+        # Ciclo alinhado ao relógio de parede: (agora - offset) % ciclo dá a
+        # posição no ciclo, então semáforos com offsets diferentes formam onda verde
+        self.offset = 0.0
+        self.fase = 0
+        self.inicio_fase = 0.0   # time.monotonic() do início da fase atual
+        self.tarefa = None
+        self.lock = threading.Lock()
+
+    def duracao(self, fase):
+        cor = FASES[fase]
+        if cor == "VERMELHO":
+            return self.tempo_vermelho
+        if cor == "VERDE":
+            return self.tempo_verde
+        return self.tempo_amarelo
+
+    def ciclo(self):
+        return self.tempo_vermelho + self.tempo_verde + self.tempo_amarelo
+
     def anunciar_presenca(self):
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
         sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, struct.pack('b', 1))
-        
+
         msg = proto.Mensagem()
-        msg.id_origem = MEU_ID
+        msg.id_origem = self.id
         msg.tipo_mensagem = "REGISTRO"
-        msg.registro.porta = MINHA_PORTA_TCP
+        msg.registro.porta = self.porta
         msg.registro.tipo_dispositivo = "ATUADOR"
-        
-        print(f"[SEMAFORO] Anunciando presenca via Multicast (porta {MINHA_PORTA_TCP})...")
+
+        print(f"[SEMAFORO] {self.id}: anunciando presenca via Multicast (porta {self.porta})...")
         sock.sendto(msg.SerializeToString(), (MCAST_GRP, MCAST_PORT))
         sock.close()
 
@@ -73,147 +105,131 @@ class Semaforo:
         """Envia estado atual do semáforo para o Gateway"""
         try:
             sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            
+
             msg = proto.Mensagem()
-            msg.id_origem = MEU_ID
+            msg.id_origem = self.id
             msg.tipo_mensagem = "DADOS"
             msg.dados.valor = 0  # Não usado
             msg.dados.unidade = self.cor_atual
             msg.dados.tipo_leitura = "COR_SEMAFORO"
-            
+            msg.dados.sequencia = next(self.sequencia)
+            msg.dados.timestamp = time.time()
+
             sock.sendto(msg.SerializeToString(), ('localhost', GATEWAY_UDP_PORT))
             sock.close()
         except:
             pass
 
-    def ouvir_discovery(self):
-        """Escuta mensagens de DISCOVERY do Gateway e re-anuncia"""
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        sock.bind(('', MCAST_PORT))
-        sock.settimeout(1.0)
-        
-        # Entra no grupo Multicast
-        mreq = struct.pack("4sl", socket.inet_aton(MCAST_GRP), socket.INADDR_ANY)
-        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
-        
-        while running:
+    def executar_comando(self, acao, param):
+        if acao == "MUDAR_COR":
+            self.cor_atual = param.upper()
+            print(f"[ACAO] {self.id}: cor alterada manualmente para: {self.cor_atual}")
+            self.enviar_estado()
+        elif acao in ("SET_TEMPO_VERMELHO", "SET_TEMPO_AMARELO", "SET_TEMPO_VERDE"):
+            self.ajustar_tempo(acao[len("SET_TEMPO_"):], param)
+        elif acao == "SET_OFFSET":
             try:
-                data, addr = sock.recvfrom(1024)
-                try:
-                    msg = proto.Mensagem()
-                    msg.ParseFromString(data)
-                    if msg.tipo_mensagem == "DISCOVERY":
-                        print(f"[SEMAFORO] Recebido pedido de descoberta do Gateway")
-                        time.sleep(0.1)
-                        self.anunciar_presenca()
-                except:
-                    pass
-            except socket.timeout:
-                continue
-            except:
-                break
-
-    def ouvir_comandos(self):
-        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.server.bind(('0.0.0.0', MINHA_PORTA_TCP))
-        self.server.listen(5)
-        self.server.settimeout(1.0)
-        print(f"[SEMAFORO] Aguardando comandos na porta {MINHA_PORTA_TCP}")
-
-        while running:
-            try:
-                client, _ = self.server.accept()
-                try:
-                    data = client.recv(1024)
-                    msg = proto.Mensagem()
-                    msg.ParseFromString(data)
-                    
-                    if msg.tipo_mensagem == "COMANDO":
-                        acao = msg.comando.acao
-                        param = msg.comando.param
-                        
-                        if acao == "MUDAR_COR":
-                            self.cor_atual = param.upper()
-                            print(f"[ACAO] Cor alterada manualmente para: {self.cor_atual}")
-                            self.enviar_estado()
-                        elif acao == "SET_TEMPO_VERMELHO":
-                            self.tempo_vermelho = int(param)
-                            print(f"[CONFIG] Tempo vermelho: {self.tempo_vermelho}s")
-                        elif acao == "SET_TEMPO_AMARELO":
-                            self.tempo_amarelo = int(param)
-                            print(f"[CONFIG] Tempo amarelo: {self.tempo_amarelo}s")
-                        elif acao == "SET_TEMPO_VERDE":
-                            self.tempo_verde = int(param)
-                            print(f"[CONFIG] Tempo verde: {self.tempo_verde}s")
-                except: pass
-                client.close()
-            except socket.timeout:
-                continue
-            except:
-                break
-
-    def ciclo_automatico(self):
-        """Executa o ciclo automático do semáforo"""
-        while running:
-            if self.modo_auto:
-                # Vermelho
-                self.cor_atual = "VERMELHO"
-                print(f"[AUTO] Semaforo: {self.cor_atual} ({self.tempo_vermelho}s)")
-                self.enviar_estado()
-                self._aguardar(self.tempo_vermelho)
-                
-                if not running: break
-                
-                # Verde
-                self.cor_atual = "VERDE"
-                print(f"[AUTO] Semaforo: {self.cor_atual} ({self.tempo_verde}s)")
-                self.enviar_estado()
-                self._aguardar(self.tempo_verde)
-                
-                if not running: break
-                
-                # Amarelo
-                self.cor_atual = "AMARELO"
-                print(f"[AUTO] Semaforo: {self.cor_atual} ({self.tempo_amarelo}s)")
-                self.enviar_estado()
-                self._aguardar(self.tempo_amarelo)
-            else:
-                time.sleep(0.5)
-    
-    def _aguardar(self, segundos):
-        """Aguarda X segundos, verificando a flag running"""
-        for _ in range(segundos * 2):
-            if not running:
+                offset = float(param)
+            except ValueError:
+                offset = math.nan
+            # nan/inf virariam um prazo NaN, que o escalonador executa na hora, em laco
+            if not math.isfinite(offset):
+                print(f"[ERRO] {self.id}: offset invalido: {param}")
                 return
-            time.sleep(0.5)
-
-    def start(self):
-        # Thread para ouvir comandos TCP
-        t1 = threading.Thread(target=self.ouvir_comandos, daemon=True)
-        t1.start()
-        
-        # Thread para ouvir DISCOVERY do Gateway
-        t2 = threading.Thread(target=self.ouvir_discovery, daemon=True)
-        t2.start()
-        
-        # Thread para ciclo automático
-        t3 = threading.Thread(target=self.ciclo_automatico, daemon=True)
-        t3.start()
-        
-        time.sleep(1)
-        self.anunciar_presenca()
-        
+            self.offset = offset
+            print(f"[CONFIG] {self.id}: offset de fase: {self.offset}s (ciclo {self.ciclo()}s)")
+            self.alinhar()
+
+    def alinhar(self):
+        """Entra no ciclo na fase correspondente ao relógio de parede e ao offset"""
+        with self.lock:
+            agora = time.monotonic()
+            posicao = (time.time() - self.offset) % self.ciclo()
+            fase = 0
+            while posicao >= self.duracao(fase):
+                posicao -= self.duracao(fase)
+                fase += 1
+            self.fase = fase
+            self.inicio_fase = agora - posicao
+            self._entrar_fase()
+
+    def ajustar_tempo(self, cor, param):
+        """Muda a duração de uma cor e realinha: o ciclo mudou, a posição nele também"""
         try:
-            while running:
-                time.sleep(0.5)
-        except KeyboardInterrupt:
-            pass
-        finally:
-            enviar_desregistro()
+            tempo = int(param)
+        except ValueError:
+            tempo = -1
+        tempos = {"VERMELHO": self.tempo_vermelho, "AMARELO": self.tempo_amarelo, "VERDE": self.tempo_verde}
+        tempos[cor] = tempo
+        # Negativo faria o escalonador girar sem parar; tudo 0 zera o ciclo (divisão por zero em alinhar)
+        if tempo < 0 or not sum(tempos.values()):
+            print(f"[ERRO] {self.id}: tempo {cor.lower()} invalido: {param} (inteiro >= 0, ciclo > 0)")
+            return
+        self.tempo_vermelho, self.tempo_amarelo, self.tempo_verde = tempos["VERMELHO"], tempos["AMARELO"], tempos["VERDE"]
+        print(f"[CONFIG] {self.id}: tempo {cor.lower()}: {tempo}s (ciclo {self.ciclo()}s)")
+        self.alinhar()
+
+    def _entrar_fase(self):
+        if self.tarefa is not None:
+            self.tarefa.cancelar()
+        self.cor_atual = FASES[self.fase]
+        print(f"[AUTO] {self.id}: {self.cor_atual} ({self.duracao(self.fase)}s, "
+              f"atraso max {self.escalonador.atraso_max * 1000:.1f} ms)")
+        self.enviar_estado()
+        tarefa = self.tarefa = self.escalonador.agendar(self.inicio_fase + self.duracao(self.fase),
+                                                        lambda: self._fim_fase(tarefa))
+
+    def _fim_fase(self, tarefa):
+        with self.lock:
+            if tarefa is not self.tarefa:
+                # Um alinhar concorrente ja trocou a fase (a tarefa saiu do heap antes de ser cancelada)
+                return
+            if not self.modo_auto:
+                self.tarefa = None
+                return
+            # O início da próxima fase é o prazo da anterior, não "agora": sem deriva
+            self.inicio_fase += self.duracao(self.fase)
+            self.fase = (self.fase + 1) % len(FASES)
+            self._entrar_fase()
+
+def anunciar_todos():
+    for semaforo in semaforos:
+        semaforo.anunciar_presenca()
+
+def responder_discovery():
+    """Re-anuncia todos os semáforos após um DISCOVERY do Gateway"""
+    print(f"[SEMAFORO] Recebido pedido de descoberta do Gateway")
+    anunciar_todos()
+
+def start():
+    # Um único escalonador (uma thread) dirige o ciclo de todos os semáforos
+    escalonador = Escalonador()
+    semaforos.append(Semaforo(escalonador))
+    for i in range(1, config.SEMAFORO_QTD):
+        semaforos.append(Semaforo(escalonador, f"semaforo_{i:02d}", config.SEMAFORO_PORTA_EXTRA + i))
+
+    # Servidores de comandos e DISCOVERY atendidos pelo mesmo laco de eventos
+    for semaforo in semaforos:
+        ServidorComandos(reator, semaforo.porta, semaforo.executar_comando)
+        print(f"[SEMAFORO] {semaforo.id}: aguardando comandos na porta {semaforo.porta}")
+
+    EscutaDiscovery(reator, MCAST_GRP, MCAST_PORT, 0.1, responder_discovery)
+
+    # Thread do escalonador de fases
+    threading.Thread(target=escalonador.executar, args=(lambda: running,), daemon=True).start()
+    for semaforo in semaforos:
+        semaforo.alinhar()
+
+    reator.chamar_depois(1, anunciar_todos)
+
+    try:
+        reator.executar()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        enviar_desregistro()
 
 if __name__ == "__main__":
     print("[SEMAFORO] Iniciando... (Ctrl+C para encerrar)")
     print(f"[SEMAFORO] Tempos: Vermelho={TEMPO_VERMELHO}s, Verde={TEMPO_VERDE}s, Amarelo={TEMPO_AMARELO}s")
-    Semaforo().start()
+    start()
@@ -1,12 +1,12 @@
 import socket
 import struct
-import threading
 import time
 import random
 import signal
-import sys
 import iot_pb2 as proto
 import config
+from reator import Reator, EscutaDiscovery
+from politica import PoliticaEnvio
 
 MEU_ID = "sensor_qualidade_ar_01"
 MINHA_PORTA_TCP = config.SENSOR_AR_PORT
@@ -15,6 +15,7 @@ MCAST_GRP = config.MCAST_GRP
 MCAST_PORT = config.MCAST_PORT
 
 running = True
+reator = Reator()
 
 def enviar_desregistro():
     try:
@@ -36,14 +37,20 @@ def signal_handler(sig, frame):
     global running
     print("\n[AQI] Encerrando...")
     running = False
-    enviar_desregistro()
-    sys.exit(0)
+    reator.parar()  # Acorda o laco; o DESREGISTRO sai no finally de start()
 
 signal.signal(signal.SIGINT, signal_handler)
 
 class SensorQualidadeAr:
     def __init__(self):
         self.aqi_atual = 50 
+        self.sequencia = 0  # Numera as leituras enviadas (perdas/duplicatas no gateway)
+        self.politica = PoliticaEnvio(
+            banda_abs=config.AR_BANDA_ABS,
+            banda_pct=config.AR_BANDA_PCT,
+            intervalo_min=config.AR_INTERVALO_MIN,
+            intervalo_max=config.AR_INTERVALO_MAX,
+        )
 
     def anunciar_presenca(self):
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
@@ -59,62 +66,43 @@ class SensorQualidadeAr:
         sock.sendto(msg.SerializeToString(), (MCAST_GRP, MCAST_PORT))
         sock.close()
 
-    def ouvir_discovery(self):
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        sock.bind(('', MCAST_PORT))
-        sock.settimeout(1.0)
-        
-        mreq = struct.pack("4sl", socket.inet_aton(MCAST_GRP), socket.INADDR_ANY)
-        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
-        
-        while running:
-            try:
-                data, addr = sock.recvfrom(1024)
-                try:
-                    msg = proto.Mensagem()
-                    msg.ParseFromString(data)
-                    if msg.tipo_mensagem == "DISCOVERY":
-                        print(f"[AQI] Recebido pedido de descoberta do Gateway")
-                        time.sleep(0.6)
-                        self.anunciar_presenca()
-                except:
-                    pass
-            except socket.timeout:
-                continue
-            except:
-                break
+    def responder_discovery(self):
+        print(f"[AQI] Recebido pedido de descoberta do Gateway")
+        self.anunciar_presenca()
 
     def enviar_leitura(self):
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        while running:
-            time.sleep(20)
-            if not running:
-                break
-            
-            variacao = random.randint(-5, 5)
-            self.aqi_atual = max(0, min(150, self.aqi_atual + variacao))
-            
-            msg = proto.Mensagem()
-            msg.id_origem = MEU_ID
-            msg.tipo_mensagem = "DADOS"
-            msg.dados.valor = self.aqi_atual
-            msg.dados.unidade = "AQI"
-            msg.dados.tipo_leitura = "QUALIDADE_AR"
-            
-            print(f"[ENVIO] Indice de Qualidade do Ar (AQI): {self.aqi_atual}")
-            sock.sendto(msg.SerializeToString(), ('localhost', GATEWAY_UDP_PORT))
+        variacao = random.randint(-5, 5)
+        self.aqi_atual = max(0, min(150, self.aqi_atual + variacao))
+        
+        motivo = self.politica.avaliar(self.aqi_atual)
+        if motivo is None:
+            self.politica.registrar_supressao()
+            return
+        
+        msg = proto.Mensagem()
+        msg.id_origem = MEU_ID
+        msg.tipo_mensagem = "DADOS"
+        msg.dados.valor = self.aqi_atual
+        msg.dados.unidade = "AQI"
+        msg.dados.tipo_leitura = "QUALIDADE_AR"
+        self.sequencia += 1
+        msg.dados.sequencia = self.sequencia
+        msg.dados.timestamp = time.time()
+        
+        print(f"[ENVIO] Indice de Qualidade do Ar (AQI): {self.aqi_atual} ({motivo})")
+        self.sock_dados.sendto(msg.SerializeToString(), ('localhost', GATEWAY_UDP_PORT))
+        self.politica.registrar_envio(self.aqi_atual)
 
     def start(self):
-        threading.Thread(target=self.enviar_leitura, daemon=True).start()
-        threading.Thread(target=self.ouvir_discovery, daemon=True).start()
+        EscutaDiscovery(reator, MCAST_GRP, MCAST_PORT, 0.6, self.responder_discovery)
         
-        time.sleep(1)
-        self.anunciar_presenca()
+        self.sock_dados = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        reator.repetir(20, self.enviar_leitura)
+        
+        reator.chamar_depois(1, self.anunciar_presenca)
         
         try:
-            while running:
-                time.sleep(0.5)
+            reator.executar()
         except KeyboardInterrupt:
             pass
         finally:
@@ -0,0 +1,248 @@
+"""Simulador de carga em escala de cidade.
+
+Gera leituras de milhares de sensores virtuais de uma vez com NumPy e envia
+ao Gateway como datagramas `Mensagem` (DADOS), a uma taxa alvo precisa.
+
+Modelos:
+- Temperatura: ciclo diurno (pico as 15h) + ruido AR(1) por sensor
+- Radar: velocidade cai com a intensidade do trafego (picos as 8h e 18h)
+- Qualidade do ar: trafego recente + temperatura + componente regional
+  comum (sensores da mesma regiao sao correlacionados) + ruido
+
+O tempo simulado avanca com o numero de mensagens geradas, entao a mesma
+semente e taxa produzem sempre a mesma sequencia de valores.
+
+Uso: python simulador.py --temperatura 2000 --radar 2000 --ar 1000 --taxa 5000
+Requer numpy.
+"""
+import argparse
+import socket
+import struct
+import time
+import numpy as np
+import config
+
+TEMPERATURA, RADAR, AR = 0, 1, 2
+TIPOS = {
+    TEMPERATURA: ("sim_temp", "TEMPERATURA", "C"),
+    RADAR: ("sim_radar", "VELOCIDADE", "km/h"),
+    AR: ("sim_ar", "QUALIDADE_AR", "AQI"),
+}
+N_REGIOES = 8
+
+
+def _varint(n):
+    saida = bytearray()
+    while True:
+        b = n & 0x7F
+        n >>= 7
+        if n:
+            saida.append(b | 0x80)
+        else:
+            saida.append(b)
+            return bytes(saida)
+
+
+def _campo_texto(numero, texto):
+    dados = texto.encode()
+    return _varint((numero << 3) | 2) + _varint(len(dados)) + dados
+
+
+def montar_moldes(d_id, tipo_leitura, unidade):
+    """Bytes fixos de uma Mensagem DADOS em volta dos campos que mudam a cada envio.
+
+    Segue a codificacao do protobuf: id_origem=1, tipo_mensagem=2, dados=4 e,
+    dentro de Dados, valor=1 (fixed32), unidade=2, tipo_leitura=3,
+    sequencia=4 (varint) e timestamp=5 (fixed64). O prefixo vai ate a tag de
+    `dados`; o tamanho de Dados varia com o varint da sequencia e e calculado
+    na serializacao. O sufixo fica entre o valor e a sequencia.
+    """
+    prefixo = _campo_texto(1, d_id) + _campo_texto(2, "DADOS") + _varint((4 << 3) | 2)
+    sufixo = _campo_texto(2, unidade) + _campo_texto(3, tipo_leitura)
+    return prefixo, sufixo
+
+
+TAG_VALOR = _varint((1 << 3) | 5)
+TAG_SEQUENCIA = _varint((4 << 3) | 0)
+TAG_TIMESTAMP = _varint((5 << 3) | 1)
+
+
+def intensidade_trafego(hora):
+    """Intensidade de trafego em [0, 1] com picos de manha e fim de tarde"""
+    hora = np.mod(hora, 24.0)
+    return np.clip(0.1 + 0.9 * np.exp(-((hora - 8.0) ** 2) / 2.0)
+                   + 0.8 * np.exp(-((hora - 18.0) ** 2) / 3.0), 0.0, 1.0)
+
+
+class SimuladorCidade:
+    def __init__(self, n_temperatura, n_radar, n_ar, semente=42):
+        self.rng = np.random.default_rng(semente)
+        self.tipo = np.concatenate([
+            np.full(n_temperatura, TEMPERATURA, np.int8),
+            np.full(n_radar, RADAR, np.int8),
+            np.full(n_ar, AR, np.int8),
+        ])
+        n = len(self.tipo)
+        self.n = n
+
+        # Parametros fixos por sensor
+        self.base = np.where(self.tipo == TEMPERATURA, self.rng.normal(22.0, 2.0, n),
+                             np.where(self.tipo == AR, self.rng.uniform(20.0, 50.0, n), 0.0))
+        self.amplitude = self.rng.uniform(3.0, 7.0, n)
+        self.limite_via = self.rng.choice([40.0, 60.0, 80.0, 110.0], n)
+        self.regiao = self.rng.integers(0, N_REGIOES, n)
+        self.sigma = np.select([self.tipo == TEMPERATURA, self.tipo == RADAR], [0.3, 8.0], 4.0)
+
+        # Estado dinamico
+        self.ruido = np.zeros(n)
+        self.regional = np.zeros(N_REGIOES)
+
+        # Moldes de serializacao, montados uma vez
+        self.ids = []
+        self.prefixos = []
+        self.sufixos = []
+        contadores = {t: 0 for t in TIPOS}
+        for t in self.tipo:
+            t = int(t)
+            contadores[t] += 1
+            prefixo_id, tipo_leitura, unidade = TIPOS[t]
+            d_id = f"{prefixo_id}_{contadores[t]:05d}"
+            prefixo, sufixo = montar_moldes(d_id, tipo_leitura, unidade)
+            self.ids.append(d_id)
+            self.prefixos.append(prefixo)
+            self.sufixos.append(sufixo)
+
+    def gerar(self, indices, hora):
+        """Valores (float32) dos sensores em `indices` na hora simulada `hora`"""
+        k = len(indices)
+        tipo = self.tipo[indices]
+        self.ruido[indices] = 0.9 * self.ruido[indices] + self.sigma[indices] * self.rng.standard_normal(k)
+        self.regional += self.rng.normal(0.0, 0.2, N_REGIOES)
+        self.regional *= 0.995
+
+        diurno = np.cos(2 * np.pi * (hora - 15.0) / 24.0)
+        trafego = intensidade_trafego(hora)
+        trafego_recente = intensidade_trafego(hora - 1.0)
+
+        temperatura = self.base[indices] + self.amplitude[indices] * diurno + self.ruido[indices]
+        velocidade = np.clip(self.limite_via[indices] * (1.0 - 0.55 * trafego) + self.ruido[indices], 5.0, 160.0)
+        poluicao = np.clip(self.base[indices] + 60.0 * trafego_recente + 1.5 * self.amplitude[indices] * diurno
+                           + 10.0 * self.regional[self.regiao[indices]] + self.ruido[indices], 0.0, 500.0)
+
+        valores = np.select([tipo == TEMPERATURA, tipo == RADAR], [temperatura, velocidade], poluicao)
+        return valores.astype('<f4')
+
+    def serializar(self, indices, valores, sequencias, timestamp):
+        """Monta os datagramas em lote juntando moldes, float32, sequencia e timestamp"""
+        brutos = valores.tobytes()
+        ts = TAG_TIMESTAMP + struct.pack('<d', timestamp)
+        prefixos, sufixos = self.prefixos, self.sufixos
+        saida = []
+        for j, (i, seq) in enumerate(zip(indices.tolist(), sequencias.tolist())):
+            corpo = TAG_VALOR + brutos[4 * j:4 * j + 4] + sufixos[i] + TAG_SEQUENCIA + _varint(seq) + ts
+            saida.append(prefixos[i] + _varint(len(corpo)) + corpo)
+        return saida
+
+
+def verificar(sim, amostras=200):
+    """Confere os datagramas montados a mao contra o parser do protobuf"""
+    import iot_pb2 as proto
+    globais = np.arange(min(amostras, sim.n) * 2)  # Duas voltas: sequencias 1 e 2
+    indices, sequencias = globais % sim.n, globais // sim.n + 1
+    valores = sim.gerar(indices, 12.0)
+    agora = time.time()
+    for i, seq, dado, valor in zip(indices, sequencias, sim.serializar(indices, valores, sequencias, agora), valores):
+        msg = proto.Mensagem()
+        msg.ParseFromString(dado)
+        assert msg.id_origem == sim.ids[i] and msg.tipo_mensagem == "DADOS"
+        assert msg.dados.valor == float(valor)
+        assert msg.dados.tipo_leitura == TIPOS[int(sim.tipo[i])][1]
+        assert msg.dados.sequencia == seq and msg.dados.timestamp == agora
+    print(f"[SIM] {len(indices)} datagramas conferidos com o protobuf")
+
+
+def executar(sim, taxa, duracao, host, porta, tick, hora_inicial, aceleracao):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4 * 1024 * 1024)
+    destino = (host, porta)
+
+    # Geracao em blocos de tamanho fixo: a sequencia de valores nao depende de
+    # como o envio foi fatiado no tempo, so da semente e da taxa. A mensagem
+    # global g e do sensor g % n e tem sequencia g // n + 1 (cada sensor conta
+    # as proprias leituras). A serializacao fica para a hora do envio, para o
+    # timestamp de origem ser o instante real em que o datagrama sai.
+    bloco = max(1, int(round(taxa * tick)))
+    indices = sequencias = valores = None
+    pos = bloco
+    gerados = 0
+
+    inicio = time.monotonic()
+    proximo = inicio
+    enviados = 0
+    ultimo_relatorio, enviados_relatorio = inicio, 0
+
+    while True:
+        agora = time.monotonic()
+        decorrido = agora - inicio
+        if duracao and decorrido >= duracao:
+            break
+
+        devidos = int(decorrido * taxa) - enviados
+        while devidos > 0:
+            if pos >= bloco:
+                globais = gerados + np.arange(bloco)
+                indices, sequencias = globais % sim.n, globais // sim.n + 1
+                hora = hora_inicial + (gerados / taxa) * aceleracao / 3600.0
+                valores, pos = sim.gerar(indices, hora), 0
+                gerados += bloco
+            n = min(devidos, bloco - pos)
+            fatia = slice(pos, pos + n)
+            for dado in sim.serializar(indices[fatia], valores[fatia], sequencias[fatia], time.time()):
+                sock.sendto(dado, destino)
+            pos += n
+            enviados += n
+            devidos -= n
+
+        if agora - ultimo_relatorio >= 1.0:
+            taxa_real = (enviados - enviados_relatorio) / (agora - ultimo_relatorio)
+            print(f"[SIM] {enviados} enviados | {taxa_real:.0f} msg/s (alvo {taxa:.0f})")
+            ultimo_relatorio, enviados_relatorio = agora, enviados
+
+        # Prazo absoluto: atrasos de um tick nao se acumulam
+        proximo += tick
+        espera = proximo - time.monotonic()
+        if espera > 0:
+            time.sleep(espera)
+        else:
+            proximo = time.monotonic()
+
+    total = time.monotonic() - inicio
+    print(f"[SIM] Fim: {enviados} mensagens em {total:.1f}s ({enviados / total:.0f} msg/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulador vetorizado de sensores")
+    parser.add_argument('--temperatura', type=int, default=1000, help="sensores de temperatura")
+    parser.add_argument('--radar', type=int, default=1000, help="radares")
+    parser.add_argument('--ar', type=int, default=500, help="sensores de qualidade do ar")
+    parser.add_argument('--taxa', type=float, default=2000.0, help="mensagens por segundo")
+    parser.add_argument('--duracao', type=float, default=0, help="segundos (0 = ate Ctrl+C)")
+    parser.add_argument('--tick', type=float, default=0.01, help="periodo do laco de envio em segundos")
+    parser.add_argument('--hora-inicial', type=float, default=6.0, help="hora simulada inicial")
+    parser.add_argument('--aceleracao', type=float, default=60.0, help="segundos simulados por segundo real de envio")
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--porta', type=int, default=config.GATEWAY_UDP_PORT)
+    parser.add_argument('--verificar', action='store_true', help="confere a serializacao e sai")
+    args = parser.parse_args()
+
+    sim = SimuladorCidade(args.temperatura, args.radar, args.ar, args.semente)
+    print(f"[SIM] {sim.n} sensores virtuais -> {args.host}:{args.porta} a {args.taxa:.0f} msg/s")
+    if args.verificar:
+        verificar(sim)
+    else:
+        try:
+            executar(sim, args.taxa, args.duracao, args.host, args.porta, args.tick,
+                     args.hora_inicial, args.aceleracao)
+        except KeyboardInterrupt:
+            print("\n[SIM] Encerrando...")
@@ -0,0 +1,170 @@
+import os
+import select
+import socket
+import struct
+import time
+
+# Cabecalho de cada quadro no canal de video (igual em gateway/video.py):
+# tamanho do payload, numero do quadro, largura, altura, fps e timestamp
+CABECALHO_QUADRO = struct.Struct('>IQHHBd')
+
+# Resolucao -> (largura, altura, quadros por segundo)
+RESOLUCOES = {
+    "SD": (640, 480, 10),
+    "HD": (1280, 720, 15),
+    "FullHD": (1920, 1080, 15),
+    "4K": (3840, 2160, 5),
+}
+# Nomes usados pelo painel web (client/frontend)
+APELIDOS = {"480p": "SD", "720p": "HD", "1080p": "FullHD", "2160p": "4K"}
+ESPERA_MAX = 30.0      # Teto do recuo entre tentativas de reconexao (s)
+INTERVALO_VIVO = 5.0   # Parada, a camera manda um cabecalho vazio a cada tanto (s)
+
+
+class TransmissorVideo:
+    """Envia quadros sinteticos da camera para o retransmissor de video do gateway.
+
+    O tamanho do quadro segue a resolucao (pixels x bits_por_pixel, como um
+    JPEG tipico) e a taxa segue o fps da tabela RESOLUCOES, entao SET_RESOLUCAO
+    muda a banda usada. O conteudo sai de um bloco aleatorio gerado uma vez:
+    cada quadro e uma fatia (memoryview) desse bloco enviada junto com o
+    cabecalho num unico sendmsg, sem copiar o payload.
+
+    Se o envio atrasar mais que um periodo (rede ou gateway lentos), os
+    quadros atrasados sao pulados em vez de acumulados.
+
+    O gateway manda PAUSAR quando ninguem assiste a camera e RETOMAR quando
+    chega um espectador; pausada (ou desligada) ela so manda um cabecalho
+    com tamanho 0 a cada INTERVALO_VIVO segundos. Conexao recusada ou
+    perdida espera cada vez mais (ate ESPERA_MAX) antes de tentar de novo.
+    """
+
+    def __init__(self, d_id, host, porta, resolucao, bits_por_pixel=0.15, prefixo="[VIDEO]"):
+        self.d_id = d_id
+        self.endereco = (host, porta)
+        self.bits_por_pixel = bits_por_pixel
+        self.prefixo = prefixo
+        self.ligado = True
+        self.modo = None
+        if not self.configurar(resolucao):
+            self.configurar("HD")
+        maior = max(self._tamanho(l, a) for l, a, _ in RESOLUCOES.values())
+        self.bloco = memoryview(os.urandom(2 * maior))
+        self.numero = 0
+        self.enviados = 0
+        self.pulados = 0
+        self.pausado = False
+        self.controle = b""
+
+    def _tamanho(self, largura, altura):
+        return int(largura * altura * self.bits_por_pixel / 8)
+
+    def configurar(self, resolucao):
+        """Troca resolucao e taxa; retorna False se a resolucao nao existe"""
+        resolucao = APELIDOS.get(resolucao, resolucao)
+        if resolucao not in RESOLUCOES:
+            return False
+        largura, altura, fps = RESOLUCOES[resolucao]
+        # Uma tupla so: a thread de envio sempre ve um modo completo
+        self.modo = (largura, altura, fps, self._tamanho(largura, altura))
+        return True
+
+    def conectar(self):
+        sock = socket.create_connection(self.endereco, timeout=5)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.sendall(f"CAMERA {self.d_id}\n".encode())
+        # Conexao nova transmite ate o gateway dizer que ninguem esta assistindo
+        self.pausado = False
+        self.controle = b""
+        return sock
+
+    def ler_controle(self, sock, espera=0):
+        """Trata as linhas que o gateway mandou (PAUSAR, RETOMAR, ERRO ...), esperando ate `espera` segundos"""
+        pronto, _, _ = select.select([sock], [], [], espera)
+        if not pronto:
+            return
+        dados = sock.recv(4096)
+        if not dados:
+            raise ConnectionError("gateway fechou a conexao")
+        self.controle = (self.controle + dados)[-1024:]
+        while b"\n" in self.controle:
+            linha, self.controle = self.controle.split(b"\n", 1)
+            comando = linha.decode(errors='replace').strip()
+            if comando == "PAUSAR":
+                self.pausado = True
+                print(f"{self.prefixo} Ninguem assistindo, envio de quadros pausado")
+            elif comando == "RETOMAR":
+                self.pausado = False
+                print(f"{self.prefixo} Espectador conectado, envio de quadros retomado")
+            elif comando:
+                print(f"{self.prefixo} Gateway respondeu '{comando}'")
+
+    def enviar_quadro(self, sock):
+        largura, altura, fps, tamanho = self.modo
+        self.numero += 1
+        inicio = (self.numero * 7919) % (len(self.bloco) - tamanho)
+        cabecalho = CABECALHO_QUADRO.pack(tamanho, self.numero, largura, altura, fps, time.time())
+        buffers = [cabecalho, self.bloco[inicio:inicio + tamanho]]
+        while buffers:
+            enviados = sock.sendmsg(buffers)
+            # Escrita parcial: avanca sobre o que ja foi (fatias de memoryview, sem copia)
+            while buffers and enviados >= len(buffers[0]):
+                enviados -= len(buffers[0])
+                buffers.pop(0)
+            if buffers and enviados:
+                buffers[0] = memoryview(buffers[0])[enviados:]
+        self.enviados += 1
+        return fps
+
+    def executar(self, ativo):
+        sock = None
+        avisado = False
+        espera = 1.0
+        while ativo():
+            if sock is None:
+                try:
+                    sock = self.conectar()
+                    print(f"{self.prefixo} Transmitindo para {self.endereco[0]}:{self.endereco[1]}")
+                    avisado = False
+                except OSError as e:
+                    if not avisado:
+                        print(f"{self.prefixo} Retransmissor de video indisponivel ({e}), tentando de novo...")
+                        avisado = True
+                    time.sleep(espera)
+                    espera = min(espera * 2, ESPERA_MAX)
+                    continue
+                conectado = proximo = vivo = time.monotonic()
+
+            try:
+                self.ler_controle(sock)
+                if not self.ligado or self.pausado:
+                    # Sem quadros, mas o gateway precisa saber que a conexao segue viva
+                    if time.monotonic() - vivo >= INTERVALO_VIVO:
+                        sock.sendall(CABECALHO_QUADRO.pack(0, self.numero, 0, 0, 0, time.time()))
+                        vivo = time.monotonic()
+                    self.ler_controle(sock, 0.2)
+                    proximo = time.monotonic()
+                    continue
+                fps = self.enviar_quadro(sock)
+            except OSError as e:
+                print(f"{self.prefixo} Conexao de video perdida: {e}")
+                sock.close()
+                sock = None
+                # Conexao que durou pouco (ex.: id recusado pelo gateway) aumenta a espera
+                if time.monotonic() - conectado >= ESPERA_MAX:
+                    espera = 1.0
+                time.sleep(espera)
+                espera = min(espera * 2, ESPERA_MAX)
+                continue
+
+            periodo = 1.0 / fps
+            proximo += periodo
+            agora = time.monotonic()
+            if agora - proximo > periodo:
+                # Atrasou mais de um quadro: pula os atrasados em vez de enviar em rajada
+                self.pulados += int((agora - proximo) / periodo)
+                proximo = agora
+            elif proximo > agora:
+                time.sleep(proximo - agora)
+        if sock is not None:
+            sock.close()